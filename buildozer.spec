@@ -14,6 +14,9 @@ source.dir = .
 
 # (list) Source files to include (leave empty to include all the files)
 source.include_exts = py,png,jpg,kv,atlas
+
+# (list) Directories to exclude from the package (benchmarks and helper scripts)
+source.exclude_dirs = tools, tests
 fullscreen=0 
 # (str) Application versioning (method 1)
 version = 1.0
@@ -10,6 +10,8 @@ import threading
 import datetime
 import webbrowser
 import urllib.parse
+import email.utils
+import json
 from io import BytesIO
 from pathlib import Path
 from typing import Optional, Callable
@@ -58,6 +60,7 @@ from kivymd.uix.textfield import MDTextField
 from kivymd.uix.spinner import MDSpinner
 from kivymd.uix.list import MDList, OneLineListItem
 from kivymd.uix.scrollview import MDScrollView
+from kivymd.uix.selectioncontrol import MDCheckbox
 
 # Try to import MDIcon
 try:
@@ -95,6 +98,15 @@ else:
 
 APP_VERSION = "1.0.0"  # ✅ FIXED: Renamed from VERSION to avoid conflict
 DEFAULT_PORT = 8000
+DEFAULT_ENGINE = "threaded"  # "threaded", "asyncio" or "pooled"
+DEFAULT_PROCESSES = 1  # >1 forks worker processes sharing the port via SO_REUSEPORT
+KEEPALIVE_IDLE_TIMEOUT = 30      # Seconds before an idle HTTP/1.1 connection is closed
+KEEPALIVE_MAX_REQUESTS = 100     # Requests served on one connection before it is closed
+KEEPALIVE_MAX_DISCARD = 64 * 1024  # Largest unused request body drained to keep a connection
+ALLOW_UPLOADS = False            # Uploads (POST/PUT/DELETE) are refused unless the user opts in
+CORS_ALLOW_METHODS = 'GET, HEAD, OPTIONS'  # Cross-origin pages may read, never write
+CORS_ALLOW_HEADERS = 'Range, If-Range, If-None-Match, If-Modified-Since'
+UPLOAD_TEMP_PREFIX = ".upload-"  # Uploads still being written beside their destination
 BUFFER_SIZE = 8192
 LOG_MAX_LINES = 1000
 DEFAULT_ANDROID_PATH = "/storage/emulated/0/"
@@ -135,6 +147,7 @@ class Logger:
         self.max_lines = max_lines
         self.logs = []
         self.callbacks = []
+        self._sink = None
         self._lock = threading.Lock()
         self.is_android = hasattr(sys, "getandroidapilevel")
 
@@ -222,6 +235,10 @@ class Logger:
     # --------------------------------------------------------
     def log(self, message, level="INFO"):
         """Record a message to memory and file, thread-safe"""
+        if self._sink is not None:
+            self._sink(message, level)
+            return
+
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
         entry = f"[{timestamp}] [{level}] {message}"
 
@@ -251,479 +268,7183 @@ class Logger:
         with self._lock:
             self.callbacks.append(callback)
 
+    def forward_to(self, sink):
+        """Send every entry to sink(message, level) instead of recording it (worker processes)"""
+        self._sink = sink
+
     def get_all_logs(self):
         """Return all logs as text"""
         with self._lock:
             return "\n".join(self.logs)
 
-    def clear(self):
-        """Clear log buffer and file"""
-        with self._lock:
-            self.logs.clear()
-            try:
-                open(self.log_file_path, "w").close()
-            except Exception:
-                pass
+    def clear(self):
+        """Clear log buffer and file"""
+        with self._lock:
+            self.logs.clear()
+            try:
+                open(self.log_file_path, "w").close()
+            except Exception:
+                pass
+
+
+# --------------------------------------------------------
+# Global instance (singleton)
+# --------------------------------------------------------
+logger = Logger(app_name="PyServer")
+
+
+# ============================================================================
+# STREAMING ZIP ARCHIVE
+# ============================================================================
+
+import stat
+import struct
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_STREAM_CHUNK = 256 * 1024
+ZIP_PARALLEL_BLOCK = 1024 * 1024                    # Unit of read-ahead and parallel deflate
+ZIP_BATCH_FILES = 256                               # Small files grouped into one pipeline job
+ZIP_READ_WORKERS = 4                                # Threads reading files ahead of the writer
+ZIP_COMPRESS_WORKERS = max(2, os.cpu_count() or 1)  # Threads deflating blocks (zlib drops the GIL)
+ZIP_PIPELINE_DEPTH = 2 * ZIP_COMPRESS_WORKERS + ZIP_READ_WORKERS  # Jobs in flight per archive
+ZIP_STORED_EXTENSIONS = {
+    # Already-compressed formats: deflating them burns CPU for no gain
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.avif',
+    '.mp4', '.m4v', '.mkv', '.mov', '.avi', '.webm',
+    '.mp3', '.m4a', '.aac', '.ogg', '.opus', '.flac',
+    '.zip', '.7z', '.rar', '.gz', '.tgz', '.bz2', '.xz', '.zst',
+    '.apk', '.jar', '.docx', '.xlsx', '.pptx', '.epub',
+}
+
+
+class ChunkedWriter:
+    """Wrap a socket file with HTTP/1.1 chunked transfer encoding"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, data):
+        if data:
+            self.wfile.write(b"%X\r\n%s\r\n" % (len(data), data))
+        return len(data)
+
+    def close(self):
+        """Send the terminating zero-length chunk"""
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class _ZipEntry:
+    """Header fields of one archive member, kept for the central directory"""
+
+    __slots__ = ("name", "flags", "method", "dostime", "dosdate", "zip64",
+                 "header_offset", "crc", "compress_size", "file_size")
+
+    def __init__(self, name, flags, method, dostime, dosdate, zip64, header_offset):
+        self.name = name
+        self.flags = flags
+        self.method = method
+        self.dostime = dostime
+        self.dosdate = dosdate
+        self.zip64 = zip64
+        self.header_offset = header_offset
+        self.crc = 0
+        self.compress_size = 0
+        self.file_size = 0
+
+
+class ZipStream:
+    """
+    Write a ZIP archive sequentially to a non-seekable stream.
+
+    Every entry uses a data descriptor, so CRC and sizes are emitted after the
+    file data and nothing has to be buffered or seeked back. Zip64 records are
+    used per entry and for the end of central directory whenever a size, an
+    offset or the entry count overflows the classic format. Entries whose
+    extension marks them as already compressed are STOREd even in a deflate
+    archive. add_file() streams one file with one read chunk of memory;
+    add_files() pipelines many files across the shared ZIP worker pools.
+    """
+
+    def __init__(self, out, compression=zipfile.ZIP_DEFLATED, chunk_size=ZIP_STREAM_CHUNK):
+        self.out = out
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.count = 0
+        self._central = []
+        self._current = None
+
+    def method_for(self, arcname):
+        """ZIP_STORED for already-compressed content, the archive's method otherwise"""
+        if os.path.splitext(arcname)[1].lower() in ZIP_STORED_EXTENSIONS:
+            return zipfile.ZIP_STORED
+        return self.compression
+
+    # --------------------------------------------------------
+    # Header builders (shared by writer and size planner)
+    # --------------------------------------------------------
+    @staticmethod
+    def _encode_name(arcname):
+        arcname = arcname.replace(os.sep, "/")
+        try:
+            return arcname.encode("ascii"), 0x08
+        except UnicodeEncodeError:
+            return arcname.encode("utf-8"), 0x08 | 0x800
+
+    @staticmethod
+    def _dos_time(mtime):
+        t = time.localtime(mtime)
+        if t.tm_year < 1980:
+            return 0, (1 << 5) | 1
+        dostime = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        dosdate = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+        return dostime, dosdate
+
+    @staticmethod
+    def _needs_zip64(size):
+        # Deflate can grow incompressible data slightly, keep the same margin as zipfile
+        return size * 1.05 > ZIP64_LIMIT
+
+    @staticmethod
+    def _local_header(entry):
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if entry.zip64 else b""
+        size_field = ZIP64_LIMIT if entry.zip64 else 0
+        return struct.pack(
+            "<4sHHHHHLLLHH",
+            b"PK\x03\x04", 45 if entry.zip64 else 20, entry.flags, entry.method,
+            entry.dostime, entry.dosdate, 0, size_field, size_field, len(entry.name), len(extra),
+        ) + entry.name + extra
+
+    @staticmethod
+    def _data_descriptor(entry):
+        if entry.zip64:
+            return struct.pack("<4sLQQ", b"PK\x07\x08", entry.crc, entry.compress_size, entry.file_size)
+        return struct.pack("<4sLLL", b"PK\x07\x08", entry.crc, entry.compress_size, entry.file_size)
+
+    @staticmethod
+    def _central_header(entry):
+        fields = []
+        if entry.file_size >= ZIP64_LIMIT:
+            fields.append(entry.file_size)
+        if entry.compress_size >= ZIP64_LIMIT:
+            fields.append(entry.compress_size)
+        if entry.header_offset >= ZIP64_LIMIT:
+            fields.append(entry.header_offset)
+        extra = b""
+        if fields:
+            extra = struct.pack("<HH" + "Q" * len(fields), 0x0001, 8 * len(fields), *fields)
+        version = 45 if fields else 20
+        return struct.pack(
+            "<4sBBHHHHHLLLHHHHHLL",
+            b"PK\x01\x02", version, 3, version, entry.flags, entry.method,
+            entry.dostime, entry.dosdate, entry.crc,
+            min(entry.compress_size, ZIP64_LIMIT), min(entry.file_size, ZIP64_LIMIT),
+            len(entry.name), len(extra), 0, 0, 0, 0o100644 << 16,
+            min(entry.header_offset, ZIP64_LIMIT),
+        ) + entry.name + extra
+
+    @staticmethod
+    def _end_records(count, cd_offset, cd_size):
+        records = b""
+        if count >= 0xFFFF or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            zip64_eocd_offset = cd_offset + cd_size
+            records += struct.pack(
+                "<4sQHHLLQQQQ", b"PK\x06\x06", 44, 45, 45, 0, 0,
+                count, count, cd_size, cd_offset,
+            )
+            records += struct.pack("<4sLQL", b"PK\x06\x07", 0, zip64_eocd_offset, 1)
+        records += struct.pack(
+            "<4sHHHHLLH", b"PK\x05\x06", 0, 0,
+            min(count, 0xFFFF), min(count, 0xFFFF),
+            min(cd_size, ZIP64_LIMIT), min(cd_offset, ZIP64_LIMIT), 0,
+        )
+        return records
+
+    # --------------------------------------------------------
+    # Size planning (STORE mode only)
+    # --------------------------------------------------------
+    def planned_size(self, entries):
+        """Exact archive size for `entries` when written uncompressed"""
+        if self.compression != zipfile.ZIP_STORED:
+            raise ValueError("Archive size is only known in advance for STORE mode")
+        offset = 0
+        cd_size = 0
+        count = 0
+        for _, arcname, st in entries:
+            name, flags = self._encode_name(arcname)
+            entry = _ZipEntry(name, flags, zipfile.ZIP_STORED, 0, 0,
+                              self._needs_zip64(st.st_size), offset)
+            entry.compress_size = entry.file_size = st.st_size
+            cd_size += len(self._central_header(entry))
+            offset += len(self._local_header(entry)) + st.st_size + len(self._data_descriptor(entry))
+            count += 1
+        return offset + cd_size + len(self._end_records(count, offset, cd_size))
+
+    # --------------------------------------------------------
+    # Writing
+    # --------------------------------------------------------
+    def _emit(self, data):
+        self.out.write(data)
+        self.offset += len(data)
+
+    def _begin_entry(self, arcname, st, method):
+        name, flags = self._encode_name(arcname)
+        dostime, dosdate = self._dos_time(st.st_mtime)
+        entry = _ZipEntry(name, flags, method, dostime, dosdate,
+                          self._needs_zip64(st.st_size), self.offset)
+        self._emit(self._local_header(entry))
+        return entry
+
+    def _end_entry(self, entry):
+        self._emit(self._data_descriptor(entry))
+        self._central.append(entry)
+        self.count += 1
+
+    def add_file(self, file_path, arcname, st=None, method=None):
+        """Stream one file into the archive. Returns bytes of file data read."""
+        if st is None:
+            st = os.stat(file_path)
+        if method is None:
+            method = self.method_for(arcname)
+        entry = self._begin_entry(arcname, st, method)
+
+        compressor = None
+        if method == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+
+        with open(file_path, "rb") as f:
+            remaining = st.st_size
+            while True:
+                # STORE promises an exact size up front, so never read past the stat'd size
+                want = self.chunk_size if compressor else min(self.chunk_size, remaining)
+                if want <= 0:
+                    break
+                chunk = f.read(want)
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                entry.crc = zlib.crc32(chunk, entry.crc)
+                entry.file_size += len(chunk)
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    entry.compress_size += len(chunk)
+                    self._emit(chunk)
+            if compressor:
+                tail = compressor.flush()
+                entry.compress_size += len(tail)
+                self._emit(tail)
+
+        if compressor is None and entry.file_size != st.st_size:
+            raise IOError(f"File changed size while archiving: {file_path}")
+
+        self._end_entry(entry)
+        return entry.file_size
+
+    def add_files(self, entries):
+        """
+        Add (file_path, arcname, stat) entries through the parallel pipeline.
+
+        Large files are cut into ZIP_PARALLEL_BLOCK blocks and small files are
+        batched up to the same size; each job is read ahead on the I/O pool
+        and deflated on the compression pool. Blocks are independent
+        raw-deflate segments (sync-flushed, the entry's last one finished),
+        which concatenate into one valid stream. This thread writes jobs
+        strictly in order, computing CRCs as it goes, with at most
+        ZIP_PIPELINE_DEPTH jobs in flight. Only the stat'd size of each file
+        is archived. Returns bytes of file data read.
+        """
+        pending = deque()
+        batch = []
+        batch_bytes = 0
+        total = 0
+        try:
+            for file_path, arcname, st in entries:
+                method = self.method_for(arcname)
+                if st.st_size < ZIP_PARALLEL_BLOCK:
+                    batch.append((file_path, arcname, st, method, 0, st.st_size, True, True))
+                    batch_bytes += st.st_size
+                    if batch_bytes >= ZIP_PARALLEL_BLOCK or len(batch) >= ZIP_BATCH_FILES:
+                        pending.append(self._submit_job(batch))
+                        batch, batch_bytes = [], 0
+                else:
+                    if batch:
+                        pending.append(self._submit_job(batch))
+                        batch, batch_bytes = [], 0
+                    count = -(-st.st_size // ZIP_PARALLEL_BLOCK)
+                    for index in range(count):
+                        offset = index * ZIP_PARALLEL_BLOCK
+                        length = min(ZIP_PARALLEL_BLOCK, st.st_size - offset)
+                        pending.append(self._submit_job([
+                            (file_path, arcname, st, method, offset, length, index == 0, index == count - 1)
+                        ]))
+                        while len(pending) > ZIP_PIPELINE_DEPTH:
+                            total += self._write_job(*pending.popleft())
+                while len(pending) > ZIP_PIPELINE_DEPTH:
+                    total += self._write_job(*pending.popleft())
+            if batch:
+                pending.append(self._submit_job(batch))
+            while pending:
+                total += self._write_job(*pending.popleft())
+        finally:
+            for future, _ in pending:
+                future.cancel()
+        return total
+
+    @staticmethod
+    def _submit_job(pieces):
+        read_pool, compress_pool = zip_worker_pools()
+        future = read_pool.submit(_read_zip_pieces, [(p[0], p[4], p[5]) for p in pieces])
+        finals = [p[7] if p[3] == zipfile.ZIP_DEFLATED else None for p in pieces]
+        if any(final is not None for final in finals):
+            future = compress_pool.submit(_deflate_zip_pieces, future, finals)
+        return future, pieces
+
+    def _write_job(self, future, pieces):
+        total = 0
+        for (raw, data), (file_path, arcname, st, method, _, _, first, last) in zip(future.result(), pieces):
+            if first:
+                self._current = self._begin_entry(arcname, st, method)
+            entry = self._current
+            entry.crc = zlib.crc32(raw, entry.crc)
+            entry.file_size += len(raw)
+            entry.compress_size += len(data)
+            self._emit(data)
+            if last:
+                if entry.file_size != st.st_size:
+                    raise IOError(f"File changed size while archiving: {file_path}")
+                self._end_entry(entry)
+                self._current = None
+            total += len(raw)
+        return total
+
+    def close(self):
+        """Write the central directory and end records"""
+        cd_offset = self.offset
+        for entry in self._central:
+            self._emit(self._central_header(entry))
+        cd_size = self.offset - cd_offset
+        self._emit(self._end_records(len(self._central), cd_offset, cd_size))
+        self._central = []
+
+
+def _read_zip_pieces(specs):
+    """Read (file_path, offset, length) pieces; STORE pieces are returned as (raw, raw)"""
+    pieces = []
+    for file_path, offset, length in specs:
+        with open(file_path, "rb") as f:
+            if offset:
+                f.seek(offset)
+            raw = f.read(length)
+        pieces.append((raw, raw))
+    return pieces
+
+
+def _deflate_zip_pieces(read_future, finals):
+    # zlib releases the GIL while deflating, so jobs compress on all cores
+    pieces = read_future.result()
+    for i, final in enumerate(finals):
+        if final is not None:
+            raw = pieces[i][0]
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            pieces[i] = (raw, compressor.compress(raw) +
+                         compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH))
+    return pieces
+
+
+_zip_pools = None
+_zip_pools_lock = threading.Lock()
+
+
+def zip_worker_pools():
+    """The shared (read-ahead, compression) thread pools, created on first use"""
+    global _zip_pools
+    with _zip_pools_lock:
+        if _zip_pools is None:
+            _zip_pools = (
+                ThreadPoolExecutor(max_workers=ZIP_READ_WORKERS, thread_name_prefix="pyserver-zip-io"),
+                ThreadPoolExecutor(max_workers=ZIP_COMPRESS_WORKERS, thread_name_prefix="pyserver-zip-cpu"),
+            )
+        return _zip_pools
+
+
+def forget_zip_worker_pools():
+    """Drop pools inherited from the parent process; their threads did not come along"""
+    global _zip_pools, _zip_pools_lock
+    _zip_pools = None
+    _zip_pools_lock = threading.Lock()
+
+
+def iter_zip_entries(folder_path):
+    """Yield (file_path, arcname, stat) for every regular file below folder_path"""
+    parent = os.path.dirname(folder_path)
+    for root, dirs, files in os.walk(folder_path):
+        dirs[:] = sorted(d for d in dirs if not is_app_cache(os.path.join(root, d)))
+        for file in sorted(files):
+            if is_upload_temp(file):
+                continue
+            file_path = os.path.join(root, file)
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            yield file_path, os.path.relpath(file_path, parent), st
+
+
+def unique_name(name, taken, is_dir=False):
+    """name, or "name (2).ext", "name (3).ext"... if taken; the result is added to taken"""
+    stem, ext = (name, "") if is_dir else os.path.splitext(name)
+    candidate = name
+    n = 2
+    # Compare case-insensitively so the archive also extracts cleanly on Windows and macOS
+    while candidate.lower() in taken:
+        candidate = f"{stem} ({n}){ext}"
+        n += 1
+    taken.add(candidate.lower())
+    return candidate
+
+
+def iter_selection_entries(paths):
+    """
+    Yield (file_path, arcname, stat) for a selection of files and folders.
+
+    Every selected item becomes a top-level member named after itself;
+    clashing names get " (2)", " (3)"... suffixes and repeated paths are
+    archived once.
+    """
+    taken = set()
+    seen = set()
+    for path in paths:
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        name = os.path.basename(path)
+        is_dir = stat.S_ISDIR(st.st_mode)
+        if not is_dir and is_upload_temp(name):
+            continue
+        top = unique_name(name, taken, is_dir)
+        if is_dir:
+            for file_path, arcname, file_st in iter_zip_entries(path):
+                # arcname starts with the folder's own name
+                yield file_path, top + arcname[len(name):], file_st
+        else:
+            yield path, top, st
+
+
+class BufferedSocketWriter:
+    """Coalesce small writes into large socket sends"""
+
+    def __init__(self, out, buffer_size=ZIP_STREAM_CHUNK):
+        self.out = out
+        self.buffer_size = buffer_size
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        if len(self._buf) >= self.buffer_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buf:
+            self.out.write(bytes(self._buf))
+            self._buf.clear()
+
+
+# ============================================================================
+# STREAMING TAR ARCHIVE
+# ============================================================================
+
+import tarfile
+
+TAR_BLOCK = 512
+TAR_RECORD = 20 * TAR_BLOCK
+TAR_FORMATS = {
+    # ?format= value: (file extension, Content-Type, compression or None)
+    "tar": (".tar", "application/x-tar", None),
+    "tgz": (".tar.gz", "application/gzip", "gzip"),
+    "tzst": (".tar.zst", "application/zstd", "zstd"),
+}
+
+
+class TarStream:
+    """
+    Write a POSIX (pax) tar archive of (file_path, arcname, stat) entries.
+
+    A tar stream has no central directory: every member is a header followed
+    by its data padded to 512 bytes, so the archive is written in one pass
+    with constant memory and can be piped straight into `tar x`. Headers
+    depend only on the entries, which makes the exact size, and the content
+    of any byte range, known before a file is read.
+    """
+
+    def __init__(self, entries, chunk_size=ZIP_STREAM_CHUNK):
+        self.entries = entries
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _header(arcname, st):
+        info = tarfile.TarInfo(arcname.replace(os.sep, "/"))
+        info.size = st.st_size
+        info.mtime = int(st.st_mtime)
+        info.mode = 0o644
+        return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+    def _segments(self):
+        """Yield (length, literal_bytes_or_None, file_path) in archive order"""
+        offset = 0
+        for file_path, arcname, st in self.entries:
+            header = self._header(arcname, st)
+            yield len(header), header, None
+            yield st.st_size, None, file_path
+            padding = -st.st_size % TAR_BLOCK
+            if padding:
+                yield padding, b"\0" * padding, None
+            offset += len(header) + st.st_size + padding
+        # Two zero blocks end the archive; pad to a full record like tarfile does
+        end = 2 * TAR_BLOCK
+        end += -(offset + end) % TAR_RECORD
+        yield end, b"\0" * end, None
+
+    def size(self):
+        """Exact archive size in bytes"""
+        return sum(length for length, _, _ in self._segments())
+
+    def write(self, out, start=0, end=None, copy_file=None):
+        """
+        Write archive bytes start..end (inclusive, default: all) to out.
+
+        copy_file(f, offset, count) may send file data itself (e.g. with
+        sendfile) and must return the bytes sent. Returns bytes written.
+        """
+        written = 0
+        position = 0
+        for length, literal, file_path in self._segments():
+            lo = max(start, position)
+            hi = position + length if end is None else min(end + 1, position + length)
+            if lo < hi:
+                if literal is not None:
+                    out.write(literal[lo - position:hi - position])
+                else:
+                    with open(file_path, "rb") as f:
+                        sent = self._copy(f, out, lo - position, hi - lo, copy_file)
+                    if sent != hi - lo:
+                        raise IOError(f"File changed size while archiving: {file_path}")
+                written += hi - lo
+            position += length
+            if end is not None and position > end:
+                break
+        return written
+
+    def _copy(self, f, out, offset, count, copy_file):
+        if copy_file is not None:
+            return copy_file(f, offset, count)
+        f.seek(offset)
+        sent = 0
+        while sent < count:
+            chunk = f.read(min(self.chunk_size, count - sent))
+            if not chunk:
+                break
+            out.write(chunk)
+            sent += len(chunk)
+        return sent
+
+
+# ============================================================================
+# FILE TRANSFER ENGINE
+# ============================================================================
+
+SENDFILE_AVAILABLE = hasattr(os, "sendfile")
+TRANSFER_CHUNK = 256 * 1024
+TRANSFER_LOG_THRESHOLD = 1024 * 1024  # Only report throughput for transfers above 1 MB
+
+
+def transfer_file(sock, wfile, f, offset=0, count=None, done=None):
+    """
+    Send `count` bytes of the open file `f`, starting at `offset`.
+
+    Uses the kernel's sendfile() so file data never passes through Python
+    buffers; falls back to a buffered read/write loop when sendfile is not
+    available or `f` is not a real file. Returns (bytes_sent, method).
+
+    Under the asyncio engine, wfile queues the file for the event loop
+    instead; the bytes are then sent after the handler returns. done(sent,
+    method), if given, is called once they are out either way.
+    """
+    try:
+        fileno = f.fileno()
+        if count is None:
+            count = max(os.fstat(fileno).st_size - offset, 0)
+    except (AttributeError, OSError, ValueError):
+        fileno = None
+
+    queue_file = getattr(wfile, "queue_file", None)
+    if queue_file is not None and fileno is not None:
+        method = "sendfile from the event loop"
+        return queue_file(f, offset, count, done and (lambda sent: done(sent, method))), method
+
+    if SENDFILE_AVAILABLE and fileno is not None and sock is not None:
+        # socket.sendfile() copes with socket timeouts and partial sends
+        sent = sock.sendfile(f, offset, count) if count else 0
+        if done is not None:
+            done(sent, "sendfile")
+        return sent, "sendfile"
+
+    f.seek(offset)
+    sent = 0
+    while count is None or sent < count:
+        want = TRANSFER_CHUNK if count is None else min(TRANSFER_CHUNK, count - sent)
+        chunk = f.read(want)
+        if not chunk:
+            break
+        wfile.write(chunk)
+        sent += len(chunk)
+    if done is not None:
+        done(sent, "buffered copy")
+    return sent, "buffered copy"
+
+
+MAX_RANGES = 32  # Cap on parts per multi-range request
+
+
+def parse_range_header(value, size):
+    """
+    Parse a `Range: bytes=...` header against a resource of `size` bytes.
+
+    Returns None when the header is absent or malformed (serve the full body),
+    an empty list when no range is satisfiable (416), or a sorted list of
+    coalesced inclusive (start, end) tuples.
+    """
+    if not value:
+        return None
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not sep or not (first.isdigit() or first == "") or not (last.isdigit() or last == ""):
+            return None
+        if first == "":
+            if last == "":
+                return None
+            # Suffix range: the final N bytes
+            length = int(last)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        return []
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def file_etag(st):
+    """
+    Strong ETag for a file's bytes, derived from inode, size and mtime (to
+    the nanosecond), so it can satisfy If-Range. Compressed responses send
+    it weak, as they are not byte-identical.
+    """
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def listing_etag(st, generation=0, uploads=False):
+    """
+    Weak ETag for a directory listing, derived from the directory's own stat.
+
+    Adding, removing or renaming an entry bumps the directory mtime (and usually
+    its size), so the entry set is covered without scanning. The app version and
+    the uploads setting are mixed in so a different page template invalidates
+    cached listings, and the FolderSizes generation so new file or subfolder
+    sizes do.
+    """
+    template = APP_VERSION + ("-u" if uploads else "")
+    return f'W/"d{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}-g{generation:x}-{template}"'
+
+
+def etag_matches(header, etag):
+    """Weak comparison of an If-None-Match header against `etag`"""
+    header = header.strip()
+    if header == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def accepts_encoding(header, coding):
+    """True when an Accept-Encoding header allows `coding` (q=0 means refused)"""
+    if not header:
+        return False
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() not in (coding, "*"):
+            continue
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+# ============================================================================
+# DIRECTORY SCANNER
+# ============================================================================
+
+from collections import namedtuple
+
+ListingEntry = namedtuple("ListingEntry", "name is_dir size mtime")
+
+
+def is_app_cache(path):
+    """Whether path is the server's own cache folder, left out of listings, archives and indexes"""
+    return path == APP_CACHE_DIR
+
+
+def is_upload_temp(name):
+    """Whether name is an unfinished upload, which listings, archives and indexes leave out"""
+    return name.startswith(UPLOAD_TEMP_PREFIX) and name.endswith(".part")
+
+
+def iter_directory(path):
+    """
+    Yield ListingEntry tuples from a single os.scandir() pass, in directory order.
+
+    DirEntry.is_dir() is answered from the d_type returned with the directory
+    read, so each entry costs at most one stat() call. Entries whose target
+    cannot be stat'ed (e.g. broken symlinks) are skipped.
+    """
+    with os.scandir(path) as it:
+        for entry in it:
+            if is_upload_temp(entry.name) or is_app_cache(entry.path):
+                continue
+            try:
+                is_dir = entry.is_dir()
+                st = entry.stat()
+            except OSError:
+                continue
+            yield ListingEntry(entry.name, is_dir, st.st_size, st.st_mtime)
+
+
+API_LIST_DEFAULT_LIMIT = 1000
+API_LIST_MAX_LIMIT = 10000
+API_LIST_STREAM_BUFFER = 64 * 1024
+API_LIST_SORT_KEYS = {
+    "name": lambda e: e.name.lower(),
+    "size": lambda e: (e.size, e.name.lower()),
+    "mtime": lambda e: (e.mtime, e.name.lower()),
+}
+
+
+def listing_entry_json(base, entry):
+    """JSON-ready dict for a ListingEntry below the relative folder `base`"""
+    return {
+        "name": entry.name,
+        "path": f"{base}/{entry.name}" if base else entry.name,
+        "type": "dir" if entry.is_dir else "file",
+        "size": entry.size,
+        "mtime": entry.mtime,
+    }
+
+
+def scan_directory(path):
+    """List a directory sorted folders first, then case-insensitively by name"""
+    entries = list(iter_directory(path))
+    entries.sort(key=lambda e: (not e.is_dir, e.name.lower()))
+    return entries
+
+
+FolderRead = namedtuple("FolderRead", "mtime_ns names subdirs bytes files")
+
+
+def read_folder(path):
+    """
+    One scandir pass over a folder for the background services: its mtime,
+    every name, the subfolders to descend into (symlinks are not followed)
+    and the bytes and count of its regular files. None if it cannot be read.
+    """
+    names = []
+    subdirs = []
+    total = files = 0
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        with os.scandir(path) as it:
+            for entry in it:
+                if is_upload_temp(entry.name) or is_app_cache(entry.path):
+                    continue
+                names.append(entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                        files += 1
+                except OSError:
+                    pass
+    except OSError:
+        return None
+    return FolderRead(mtime_ns, names, tuple(subdirs), total, files)
+
+
+# ============================================================================
+# LISTING CACHE
+# ============================================================================
+
+from collections import OrderedDict
+
+LISTING_CACHE_MAX_ENTRIES = 64
+LISTING_CACHE_MAX_BYTES = 8 * 1024 * 1024
+LISTING_CACHE_COMPRESS = True  # Keep pre-compressed copies of each rendered listing
+
+
+class ListingCache:
+    """
+    Thread-safe LRU cache of rendered directory listings.
+
+    Entries are stored with the directory's listing ETag (inode, size, mtime)
+    and dropped on lookup when the directory has changed since rendering.
+    The cache is bounded both by entry count and by total body bytes.
+    """
+
+    def __init__(self, max_entries=LISTING_CACHE_MAX_ENTRIES,
+                 max_bytes=LISTING_CACHE_MAX_BYTES, compress=LISTING_CACHE_COMPRESS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, validator):
+        """Return (body, variants) when cached for this validator, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != validator:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, validator, body):
+        """Store a rendered body and return (body, variants)"""
+        variants = {}
+        if self.compress and len(body) >= COMPRESS_MIN_SIZE:
+            variants = {coding: compress_bytes(body, coding) for coding in supported_encodings()}
+        size = len(body) + sum(len(v) for v in variants.values())
+        if size > self.max_bytes:
+            return body, variants
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (validator, body, variants, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+        return body, variants
+
+    def invalidate(self, key=None):
+        """Forget one listing, or everything when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            elif key in self._entries:
+                self._drop(key)
+
+    def invalidate_folder(self, path):
+        """Forget every rendering of the folder at path (keys are (path, display path))"""
+        path = os.path.normpath(path)
+        with self._lock:
+            for key in [k for k in self._entries if os.path.normpath(k[0]) == path]:
+                self._drop(key)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[3]
+
+    def stats(self):
+        """Snapshot of cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+listing_cache = ListingCache()
+
+
+# ============================================================================
+# FILENAME SEARCH INDEX
+# ============================================================================
+
+SEARCH_DEFAULT_LIMIT = 100
+SEARCH_MAX_LIMIT = 1000
+SEARCH_REFRESH_INTERVAL = 30      # Seconds between incremental refresh passes
+SEARCH_MAX_ENTRIES = 2000000      # Indexing stops here to bound memory
+
+
+class _IndexedDir:
+    """Names in one directory: original and lower-cased, each joined by newlines"""
+
+    __slots__ = ("mtime_ns", "names", "lowered", "subdirs", "count")
+
+    def __init__(self, mtime_ns, names, subdirs):
+        self.mtime_ns = mtime_ns
+        # A leading newline makes a prefix test one substring test on the whole folder
+        self.names = "\n" + "\n".join(names)
+        self.lowered = self.names.lower()
+        self.subdirs = subdirs
+        self.count = len(names)
+
+
+class SearchIndex:
+    """
+    In-memory index of every name below the served root, for /api/search.
+
+    The tree is walked once, by the FileWatcher's startup walk (see seed())
+    or, when started on its own, by a background thread. After that, each refresh
+    pass stats every indexed folder and rescans only those whose mtime moved
+    (adding, removing or renaming an entry updates its folder's mtime), so
+    staying current costs one stat per folder rather than a full walk.
+    Matching folders are found with one substring test over all of their
+    names, so a query only loops over the names of folders that contain a hit.
+    """
+
+    def __init__(self, refresh_interval=SEARCH_REFRESH_INTERVAL, max_entries=SEARCH_MAX_ENTRIES):
+        self.refresh_interval = refresh_interval
+        self.max_entries = max_entries
+        self.root = None
+        self.ready = False
+        self.truncated = False
+        self.build_seconds = 0.0
+        self.refreshes = 0
+        self.rescanned = 0
+        self._dirs = {}            # "a/b" -> _IndexedDir; "" is the root
+        self._entries = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self.periodic = True
+        self._walk = True
+        self._seeded = threading.Event()
+
+    def start(self, root, periodic=True, seeded=False):
+        """
+        Index root in the background, then keep refreshing until stop().
+        periodic=False refreshes only on refresh_soon(), for callers that
+        report changes through invalidate() (the FileWatcher). seeded=True
+        skips the walk: folders arrive through seed() until seeded() is called.
+        """
+        self.stop()
+        self.periodic = periodic
+        with self._lock:
+            self.root = os.path.abspath(root)
+            self._dirs = {}
+            self._entries = 0
+            self.ready = False
+            self.truncated = False
+        self._stop.clear()
+        self._wake.clear()
+        self._seeded.clear()
+        self._walk = not seeded
+        self._thread = threading.Thread(target=self._run, name="search-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def refresh_soon(self):
+        """Run a refresh pass now instead of at the next interval"""
+        self._wake.set()
+
+    def seed(self, relative, info):
+        """Index one folder read by a shared walk (a FolderRead), unless it is indexed already"""
+        if not self.truncated and relative not in self._dirs:
+            self._store(relative, info)
+
+    def seeded(self):
+        """The shared walk is complete"""
+        self._seeded.set()
+        self._wake.set()
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            if self._walk:
+                self._scan_tree("")
+            else:
+                while not self._seeded.is_set() and not self._stop.is_set():
+                    self._wake.wait()
+                    self._wake.clear()
+        except Exception as e:
+            logger.log(f"Search index build failed: {e}", "ERROR")
+            return
+        if self._stop.is_set():
+            return
+        self.build_seconds = time.perf_counter() - started
+        self.ready = True
+        logger.log(
+            f"Search index ready: {self._entries} names in {len(self._dirs)} folders "
+            f"({self.build_seconds:.1f}s)" + (", truncated" if self.truncated else ""),
+            "INFO"
+        )
+        while not self._stop.is_set():
+            self._wake.wait(self.refresh_interval if self.periodic else None)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.log(f"Search index refresh failed: {e}", "ERROR")
+
+    def _scan_dir(self, relative):
+        """Read one folder into the index; returns its subfolders, or () if unreadable"""
+        info = read_folder(os.path.join(self.root, relative) if relative else self.root)
+        if info is None:
+            self._drop(relative)
+            return ()
+        return self._store(relative, info)
+
+    def _store(self, relative, info):
+        # Names are stored newline-separated, so a name containing one is left out.
+        # Symlinked folders are listed but not followed, so loops cannot occur.
+        indexed = _IndexedDir(info.mtime_ns, [n for n in info.names if "\n" not in n],
+                              tuple(n for n in info.subdirs if "\n" not in n))
+        with self._lock:
+            old = self._dirs.get(relative)
+            self._entries += indexed.count - (old.count if old else 0)
+            self._dirs[relative] = indexed
+            if self._entries > self.max_entries:
+                self.truncated = True
+        return indexed.subdirs
+
+    def _scan_tree(self, relative):
+        """Index relative and everything below it, breadth-first"""
+        pending = [relative]
+        while pending and not self._stop.is_set() and not self.truncated:
+            next_level = []
+            for folder in pending:
+                for name in self._scan_dir(folder):
+                    next_level.append(f"{folder}/{name}" if folder else name)
+            pending = next_level
+
+    def _drop(self, relative):
+        """Forget a folder and everything indexed below it"""
+        prefix = relative + "/"
+        with self._lock:
+            for key in [k for k in self._dirs if k == relative or k.startswith(prefix) or not relative]:
+                self._entries -= self._dirs.pop(key).count
+
+    def refresh(self):
+        """Rescan folders whose mtime changed since they were indexed"""
+        with self._lock:
+            snapshot = list(self._dirs.items())
+        self.refreshes += 1
+        for relative, indexed in snapshot:
+            if self._stop.is_set():
+                return
+            path = os.path.join(self.root, relative) if relative else self.root
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._drop(relative)
+                continue
+            if st.st_mtime_ns != indexed.mtime_ns:
+                self.invalidate(relative, indexed)
+
+    def invalidate(self, relative, indexed=None):
+        """Rescan one folder now, indexing new subfolders and dropping removed ones"""
+        if indexed is None:
+            with self._lock:
+                indexed = self._dirs.get(relative)
+        self.rescanned += 1
+        subdirs = self._scan_dir(relative)
+        if indexed is None:
+            return
+        for name in set(indexed.subdirs) - set(subdirs):
+            self._drop(f"{relative}/{name}" if relative else name)
+        for name in set(subdirs) - set(indexed.subdirs):
+            self._scan_tree(f"{relative}/{name}" if relative else name)
+
+    def search(self, query, base="", limit=SEARCH_DEFAULT_LIMIT, prefix=False):
+        """
+        Up to limit (folder, name) matches below base, shallower folders first.
+
+        Matching is case-insensitive. Substring mode needs every space-separated
+        term in the name; prefix mode matches names starting with the query.
+        Returns (matches, truncated).
+        """
+        query = query.lower().strip()
+        terms = [query] if prefix else query.split()
+        if not terms:
+            return [], False
+        probe = "\n" + query if prefix else max(terms, key=len)
+        base = base.strip("/")
+        base_prefix = base + "/"
+        with self._lock:
+            folders = list(self._dirs.items())
+
+        matches = []
+        for folder, indexed in folders:
+            if base and folder != base and not folder.startswith(base_prefix):
+                continue
+            if probe not in indexed.lowered:
+                continue
+            lowered = indexed.lowered[1:].split("\n")
+            names = indexed.names[1:].split("\n")
+            for low, name in zip(lowered, names):
+                if (low.startswith(query) if prefix else all(t in low for t in terms)):
+                    if len(matches) == limit:
+                        return matches, True
+                    matches.append((folder, name))
+        return matches, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "folders": len(self._dirs),
+                "names": self._entries,
+                "truncated": self.truncated,
+                "build_seconds": round(self.build_seconds, 3),
+                "refreshes": self.refreshes,
+                "rescanned_folders": self.rescanned,
+            }
+
+
+search_index = SearchIndex()
+
+
+# ============================================================================
+# FOLDER SIZES
+# ============================================================================
+
+class FolderSizes:
+    """
+    Recursive byte and file counts for every folder below the served root.
+
+    A background thread walks the tree bottom-up, so a folder's total is
+    known once its whole subtree is. Listings only look totals up and ask
+    for unknown folders to be done next (prioritize). When the FileWatcher
+    reports a changed folder, only that folder is re-read: known subfolder
+    totals are reused and the difference is carried up its ancestors.
+
+    Each folder also has a generation number that moves whenever something
+    its listing shows (a file size or a subfolder total) changes; it is part
+    of the listing ETag, so cached pages and 304s never hide a new size.
+
+    Started with seeded=True, the first pass reads nothing itself: it waits
+    for the FileWatcher's startup walk to hand over every folder (seed())
+    and then only adds the totals up.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.scanned = 0
+        self._own = {}           # folder -> (bytes, files, subfolder names) of its direct entries
+        self._totals = {}        # folder -> (bytes, files) of the whole subtree
+        self._generations = {}   # folder -> counter, see above
+        self._stack = []         # (folder, phase) work items, see _step
+        self._seeds = {}         # folder -> FolderRead from the shared startup walk
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, root, seeded=False):
+        self.stop()
+        with self._lock:
+            self.root = os.path.abspath(root)
+            self._own = {}
+            self._totals = {}
+            self._seeds = {}
+            self._stack = [] if seeded else [("", "scan")]
+        self._stop.clear()
+        self._wake.set()
+        self._thread = threading.Thread(target=self._run, name="folder-sizes", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def relative(self, path):
+        """Key for an absolute path below the root, or None"""
+        if self.root is None:
+            return None
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        if relative == os.curdir:
+            return ""
+        if relative.startswith(os.pardir):
+            return None
+        return relative.replace(os.sep, "/")
+
+    def get(self, folder):
+        """(bytes, files) for a relative folder, or None while it is being counted"""
+        return self._totals.get(folder)
+
+    def generation(self, folder):
+        return self._generations.get(folder, 0)
+
+    def children(self, folder):
+        """{name: (bytes, files) or None} for the subfolders of a folder, or None if not read yet"""
+        info = self._own.get(folder)
+        if info is None:
+            return None
+        return {
+            name: self._totals.get(f"{folder}/{name}" if folder else name)
+            for name in info[2]
+        }
+
+    def prioritize(self, folders):
+        """Count these relative folders before anything else"""
+        with self._lock:
+            self._stack.extend((f, "scan") for f in folders if f not in self._totals)
+        self._wake.set()
+
+    def seed(self, folder, info):
+        """Keep a folder read by the shared startup walk (a FolderRead) for the first pass"""
+        with self._lock:
+            self._seeds[folder] = info
+
+    def seeded(self):
+        """The shared walk is complete: add up the seeded folders"""
+        with self._lock:
+            self._stack.append(("", "scan"))
+        self._wake.set()
+
+    def invalidate(self, folder):
+        """Re-read one relative folder (None: everything) after it changed"""
+        if folder is None:
+            if self.root is not None:
+                self.start(self.root)
+            return
+        with self._lock:
+            self._stack.append((folder, "rescan"))
+        self._wake.set()
+
+    def _run(self):
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            with self._lock:
+                item = self._stack.pop() if self._stack else None
+            if item is None:
+                if started is not None and "" in self._totals:
+                    total_bytes, total_files = self._totals[""]
+                    logger.log(
+                        f"Folder sizes ready: {total_files} files, {total_bytes / 1024 ** 3:.2f} GB in "
+                        f"{len(self._totals)} folders ({time.perf_counter() - started:.1f}s)",
+                        "INFO"
+                    )
+                    started = None
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                self._step(*item)
+            except Exception as e:
+                logger.log(f"Folder size scan error in {item[0] or '/'}: {e}", "ERROR")
+
+    def _read(self, folder):
+        """(bytes, files, subfolders) of the direct entries of a folder"""
+        path = os.path.join(self.root, folder) if folder else self.root
+        if folder and os.path.islink(path):
+            return None  # Only reached through prioritize(); the walk never enters links
+        # Symlinks are not followed, so nothing is counted twice
+        info = read_folder(path)
+        if info is None:
+            return None
+        self.scanned += 1
+        return info.bytes, info.files, info.subdirs
+
+    def _step(self, folder, phase):
+        """
+        "scan": read a folder not counted yet; "rescan": read it again after a
+        change. Both queue the subfolders that are not counted and a "sum"
+        step, which runs after them and records the folder's total.
+        """
+        if phase == "sum":
+            self._set_total(folder, self._sum(folder))
+            return
+        if phase == "scan" and folder in self._totals:
+            return
+        with self._lock:
+            seed = self._seeds.pop(folder, None)
+        if seed is not None and phase == "scan":
+            info = seed.bytes, seed.files, seed.subdirs
+        else:
+            info = self._read(folder)
+        if info is None:
+            # Gone or unreadable: forget it and let the parent notice
+            self._drop(folder)
+            parent, _, name = folder.rpartition("/")
+            if folder and name in self._own.get(parent, (0, 0, ()))[2]:
+                with self._lock:
+                    self._stack.append((parent, "rescan"))
+            return
+        old = self._own.get(folder)
+        self._own[folder] = info
+        if old is not None:
+            if old[:2] != info[:2]:
+                self._bump(folder)
+            for name in set(old[2]) - set(info[2]):
+                self._drop(f"{folder}/{name}" if folder else name)
+        children = [f"{folder}/{name}" if folder else name for name in info[2]]
+        with self._lock:
+            self._stack.append((folder, "sum"))
+            self._stack.extend((child, "scan") for child in children if child not in self._totals)
+
+    def _sum(self, folder):
+        total, files, subdirs = self._own.get(folder, (0, 0, ()))
+        for name in subdirs:
+            child = self._totals.get(f"{folder}/{name}" if folder else name)
+            if child is not None:
+                total += child[0]
+                files += child[1]
+        return total, files
+
+    def _set_total(self, folder, total):
+        # Record a total and carry the change up through ancestors that are already counted
+        while self._totals.get(folder) != total:
+            self._totals[folder] = total
+            if not folder:
+                return
+            parent = folder.rpartition("/")[0]
+            self._bump(parent)
+            if parent not in self._totals:
+                return  # The parent's own "sum" step is still to come
+            folder, total = parent, self._sum(parent)
+
+    def _bump(self, folder):
+        self._generations[folder] = self._generations.get(folder, 0) + 1
+
+    def _drop(self, folder):
+        prefix = folder + "/"
+        for table in (self._own, self._totals, self._generations):
+            for key in [k for k in table if k == folder or k.startswith(prefix)]:
+                del table[key]
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._stack)
+        root = self._totals.get("")
+        return {
+            "ready": root is not None,
+            "folders": len(self._totals),
+            "bytes": root[0] if root else None,
+            "files": root[1] if root else None,
+            "pending": pending,
+            "folders_read": self.scanned,
+        }
+
+
+folder_sizes = FolderSizes()
+
+
+# ============================================================================
+# DISK CACHE
+# ============================================================================
+
+import hashlib
+import tempfile
+
+
+def user_cache_dir(app_name=logger.app_name):
+    """
+    Per-user cache folder that does not depend on the launch directory: the
+    app's private storage on Android, %LOCALAPPDATA% on Windows,
+    ~/Library/Caches on macOS and $XDG_CACHE_HOME (~/.cache) elsewhere.
+    """
+    if logger.is_android:
+        try:
+            from android.storage import app_storage_path
+            return os.path.join(app_storage_path(), "cache")
+        except Exception as e:
+            print(f"[Cache] app_storage_path() failed: {e}")
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+        return os.path.join(base, app_name, "Cache")
+    if sys.platform == "darwin":
+        return os.path.join(os.path.expanduser("~/Library/Caches"), app_name)
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, app_name.lower())
+
+
+# Walkers skip it (see is_app_cache) in case it lies inside the served folder
+APP_CACHE_DIR = os.path.abspath(user_cache_dir())
+DISK_CACHE_RESCAN_INTERVAL = 5.0     # Seconds between looks at what other processes added
+DISK_CACHE_STALE_TEMP = 3600         # Temporary files untouched this long were left by a crash
+
+
+class DiskCache:
+    """
+    Byte-budgeted LRU cache of files in one directory.
+
+    Keys are hashed into file names. Recency is tracked in memory and seeded
+    from file mtimes when the cache directory is opened, so the budget holds
+    across restarts. Writers produce a temporary file next to the cache and
+    publish it atomically with put_file().
+
+    Worker processes (see MultiProcessServer) share the directory: hits
+    touch the file's mtime, and put_file() re-reads the directory at most
+    every DISK_CACHE_RESCAN_INTERVAL before evicting, so the budget holds
+    for all of them together rather than for each.
+    """
+
+    def __init__(self, name, max_bytes, suffix=""):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.directory = os.path.join(APP_CACHE_DIR, name)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._next_scan = 0.0   # time.monotonic() of the next look at the directory
+
+    def _load(self):
+        # Called with the lock held; deferred so importing never touches the disk
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._scan(remove_stale=True)
+        except OSError as e:
+            logger.log(f"Cache '{self.name}' unavailable: {e}", "WARNING")
+
+    def _scan(self, remove_stale=False):
+        # Called with the lock held: rebuild the index from the directory,
+        # least recently used (oldest mtime) first
+        found = []
+        stale_before = time.time() - DISK_CACHE_STALE_TEMP
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith(".tmp"):
+                    # Other processes may still be writing the recent ones
+                    if remove_stale and st.st_mtime < stale_before:
+                        try:
+                            os.unlink(entry.path)
+                        except OSError:
+                            pass
+                    continue
+                found.append((st.st_mtime, entry.name, st.st_size))
+        self._entries = OrderedDict((file_name, size) for _, file_name, size in sorted(found))
+        self._bytes = sum(self._entries.values())
+        self._next_scan = time.monotonic() + DISK_CACHE_RESCAN_INTERVAL
+
+    def _file_name(self, key):
+        return hashlib.sha1(repr(key).encode("utf-8", "surrogatepass")).hexdigest() + self.suffix
+
+    def get(self, key):
+        """Path of the cached file for key, or None"""
+        file_name = self._file_name(key)
+        with self._lock:
+            self._load()
+            if file_name not in self._entries:
+                self.misses += 1
+                return None
+            path = os.path.join(self.directory, file_name)
+            if not os.path.exists(path):
+                self._bytes -= self._entries.pop(file_name)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(file_name)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def temp_path(self):
+        """A fresh temporary path inside the cache directory"""
+        with self._lock:
+            self._load()
+        fd, path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        return path
+
+    def put_file(self, key, temp_path):
+        """Move a finished temporary file into the cache and return its final path"""
+        file_name = self._file_name(key)
+        path = os.path.join(self.directory, file_name)
+        size = os.path.getsize(temp_path)
+        if size > self.max_bytes:
+            os.unlink(temp_path)
+            return None
+        with self._lock:
+            self._load()
+            os.replace(temp_path, path)
+            if file_name in self._entries:
+                self._bytes -= self._entries.pop(file_name)
+            if time.monotonic() >= self._next_scan:
+                try:
+                    self._scan()
+                except OSError:
+                    pass
+                self._bytes -= self._entries.pop(file_name, 0)
+            self._entries[file_name] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest, oldest_size = self._entries.popitem(last=False)
+                self._bytes -= oldest_size
+                self.evictions += 1
+                try:
+                    os.unlink(os.path.join(self.directory, oldest))
+                except OSError:
+                    pass
+        return path
+
+    def discard(self, key):
+        """Delete the cached file for key, if any"""
+        file_name = self._file_name(key)
+        with self._lock:
+            self._load()
+            size = self._entries.pop(file_name, None)
+            if size is None:
+                return
+            self._bytes -= size
+        try:
+            os.unlink(os.path.join(self.directory, file_name))
+        except OSError:
+            pass
+
+    def stats(self):
+        """Snapshot of cache counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# ============================================================================
+# RESPONSE COMPRESSION
+# ============================================================================
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+COMPRESS_MIN_SIZE = 1024                     # Smaller bodies are not worth the framing overhead
+COMPRESS_MAX_SIZE = 256 * 1024 * 1024        # Larger files are always sent as-is
+COMPRESS_MEMORY_ITEM_LIMIT = 256 * 1024      # Compressed variants up to this size stay in RAM
+COMPRESS_MEMORY_BUDGET = 16 * 1024 * 1024
+COMPRESS_DISK_BUDGET = 512 * 1024 * 1024
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/javascript", "application/x-javascript",
+    "application/xml", "application/x-ndjson", "image/svg+xml",
+)
+COMPRESSIBLE_EXTENSIONS = {
+    ".log", ".txt", ".py", ".md", ".csv", ".tsv", ".ini", ".cfg", ".conf", ".yaml",
+    ".yml", ".toml", ".sh", ".kv", ".spec", ".json", ".js", ".css", ".html", ".xml",
+}
+
+
+def supported_encodings():
+    """Content codings we can produce, most preferred first"""
+    return ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+
+
+def choose_encoding(accept_encoding):
+    """Best content coding allowed by an Accept-Encoding header, or None"""
+    for coding in supported_encodings():
+        if accepts_encoding(accept_encoding, coding):
+            return coding
+    return None
+
+
+def is_compressible(path, content_type):
+    """True for text-like content worth compressing"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type.startswith(COMPRESSIBLE_TYPES):
+        return True
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+class StreamCompressor:
+    """Incremental gzip, brotli or zstd encoder with a common interface"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=5)
+        elif encoding == "zstd":
+            self._zstd = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            # wbits=31 selects the gzip container
+            self._zlib = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self._brotli.process(data)
+        if self.encoding == "zstd":
+            return self._zstd.compress(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        if self.encoding == "br":
+            return self._brotli.finish()
+        if self.encoding == "zstd":
+            return self._zstd.flush()
+        return self._zlib.flush()
+
+
+class CompressingWriter:
+    """File-like wrapper that compresses everything written through it"""
+
+    def __init__(self, out, encoding):
+        self.out = out
+        self.compressor = StreamCompressor(encoding)
+
+    def write(self, data):
+        data = self.compressor.compress(data)
+        if data:
+            self.out.write(data)
+
+    def close(self):
+        """Write the end of the compressed stream"""
+        self.out.write(self.compressor.flush())
+
+
+def compress_bytes(data, encoding):
+    """Compress a whole body in one call"""
+    compressor = StreamCompressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+class CompressionCache:
+    """
+    Compressed variants of static files, keyed by path, ETag and coding.
+
+    Small variants are kept in an in-memory LRU; larger ones are compressed
+    chunk by chunk into the disk cache so they are never held in RAM. Either
+    way a file is compressed once per version and then served from the cache.
+    """
+
+    def __init__(self, memory_budget=COMPRESS_MEMORY_BUDGET, disk_budget=COMPRESS_DISK_BUDGET):
+        self.memory_budget = memory_budget
+        self.disk = DiskCache("compressed", disk_budget)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_create(self, path, etag, encoding, f):
+        """
+        Return (bytes_or_None, disk_path_or_None) for the compressed variant,
+        compressing from the open file `f` on a miss.
+        """
+        key = (path, etag, encoding)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data, None
+
+        cached_path = self.disk.get(key)
+        if cached_path:
+            return None, cached_path
+
+        f.seek(0)
+        compressor = StreamCompressor(encoding)
+        parts = []
+        held = 0
+        temp_path = None
+        out = None
+        try:
+            while True:
+                chunk = f.read(TRANSFER_CHUNK)
+                if not chunk:
+                    break
+                data = compressor.compress(chunk)
+                if out is None:
+                    parts.append(data)
+                    held += len(data)
+                    if held > COMPRESS_MEMORY_ITEM_LIMIT:
+                        # Too big for RAM: spill what we have and continue on disk
+                        temp_path = self.disk.temp_path()
+                        out = open(temp_path, "wb")
+                        out.write(b"".join(parts))
+                        parts = []
+                else:
+                    out.write(data)
+            tail = compressor.flush()
+            if out is None:
+                data = b"".join(parts) + tail
+                self._remember(key, data)
+                return data, None
+            out.write(tail)
+            out.close()
+            out = None
+            final_path = self.disk.put_file(key, temp_path)
+            temp_path = None
+            return None, final_path
+        finally:
+            if out is not None:
+                out.close()
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key))
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_budget and self._memory:
+                _, old = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old)
+
+    def stats(self):
+        """Snapshot of memory and disk usage"""
+        with self._lock:
+            memory = {"entries": len(self._memory), "bytes": self._memory_bytes}
+        return {"memory": memory, "disk": self.disk.stats()}
+
+
+compression_cache = CompressionCache()
+
+
+# ============================================================================
+# FOLDER ARCHIVE CACHE
+# ============================================================================
+
+ARCHIVE_CACHE_BUDGET = 2 * 1024 * 1024 * 1024  # Disk space for finished folder archives
+
+
+class _ArchiveBuild:
+    """An archive being written to a temporary file that readers tail as it grows"""
+
+    def __init__(self, temp_path):
+        self.temp_path = temp_path
+        self.path = None        # Final cache path once published
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.readers = 0        # Requests streaming from this build, its writer included
+        self.cond = threading.Condition()
+        self._file = None
+
+    def write(self, data):
+        # The builder's file is unbuffered, so every byte counted is visible to readers
+        self._file.write(data)
+        with self.cond:
+            self.written += len(data)
+            self.cond.notify_all()
+        return len(data)
+
+    def finish(self, error=None):
+        with self.cond:
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+    def reader(self, chunk_size=ZIP_STREAM_CHUNK, idle=None):
+        """
+        Open the archive now and return an iterator over it that waits for the
+        builder. Raises OSError if the finished file is already gone (rejected
+        or evicted by the disk cache). idle(wait, what), if given, runs those
+        waits (see AsyncHTTPServer.wait_idle).
+        """
+        with self.cond:
+            # Opening and publishing both happen under the condition, so the
+            # file is found under exactly one of its two names
+            f = open(self.path or self.temp_path, "rb")
+        return self._chunks(f, chunk_size, idle)
+
+    def _wait_past(self, offset):
+        with self.cond:
+            while self.written <= offset and not self.done:
+                self.cond.wait()
+        return True
+
+    def _chunks(self, f, chunk_size, idle):
+        with f:
+            offset = 0
+            while True:
+                with self.cond:
+                    behind = self.written <= offset and not self.done
+                if behind and idle is not None:
+                    idle(lambda: self._wait_past(offset), "archive data")
+                elif behind:
+                    self._wait_past(offset)
+                with self.cond:
+                    available = self.written
+                    if self.error is not None:
+                        raise IOError(f"Archive build failed: {self.error}")
+                if available <= offset:
+                    return
+                while offset < available:
+                    data = f.read(min(chunk_size, available - offset))
+                    if not data:
+                        raise IOError("Archive build file was truncated")
+                    offset += len(data)
+                    yield data
+
+
+class _ArchiveTee:
+    """
+    Where the first request writes a shared build: the cache file, then its
+    own client. Once that client is gone the build carries on for the
+    requests following it, and is abandoned if there are none.
+    """
+
+    def __init__(self, build, client):
+        self.build = build
+        self.client = client
+        self.error = None
+
+    def write(self, data):
+        self.build.write(data)
+        if self.client is not None:
+            try:
+                self.client.write(data)
+            except OSError as e:
+                self.error = e
+                self.client = None
+        if self.client is None:
+            with self.build.cond:
+                followers = self.build.readers - 1
+            if not followers:
+                raise self.error
+        return len(data)
+
+
+class ArchiveCache:
+    """
+    Finished folder archives on disk, keyed by a fingerprint of the tree.
+
+    The fingerprint covers every member's path, size and mtime, so any change
+    to the folder yields a new key; stale archives age out of the LRU disk
+    budget, or are deleted right away when the FileWatcher reports a change
+    in one of their folders.
+
+    The first request for an archive that is not cached builds it: the
+    archive is written to a temporary file in the cache and to that client
+    as it is produced (see _ArchiveTee), and the finished file is published
+    to the cache. Requests for the same archive arriving meanwhile follow
+    that one build (single-flight), streaming the file while it grows. A
+    build whose readers have all gone is cancelled.
+    """
+
+    def __init__(self, budget=ARCHIVE_CACHE_BUDGET):
+        self.disk = DiskCache("archives", budget, ".zip")
+        self.builds = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.invalidated = 0
+        self._active = {}
+        self._folders = {}   # key -> folders holding the archive's members
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(entries):
+        """Digest of (arcname, size, mtime) for every (path, arcname, stat) entry"""
+        digest = hashlib.sha1(APP_VERSION.encode("ascii"))
+        for _, arcname, st in entries:
+            digest.update(f"{arcname}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def member_folders(entries):
+        """
+        Folders whose changes can alter an archive of these entries: each
+        member's folder and those above it up to the archived folder (the
+        arcname tells how far that is), or the folder of a selected file.
+        Folders above the archive, and its siblings, are left out.
+        """
+        folders = set()
+        for path, arcname, _ in entries:
+            folder = os.path.dirname(path)
+            levels = max(arcname.replace(os.sep, "/").count("/"), 1)
+            for _ in range(levels):
+                if folder in folders:
+                    break
+                folders.add(folder)
+                folder = os.path.dirname(folder)
+        return frozenset(folders)
+
+    def accepts(self, entries):
+        """Whether an archive of these entries can fit the disk budget"""
+        return sum(st.st_size for _, _, st in entries) <= self.disk.max_bytes
+
+    def open(self, key):
+        """
+        Return (path, None, False) for a cached archive, (None, build, False)
+        to follow a build in progress, or (None, build, True) when the caller
+        is first and must write the build with write_build(). Every build
+        returned must be given back with release().
+        """
+        with self._lock:
+            build = self._join(key)
+            if build is not None:
+                return None, build, False
+
+        path = self.disk.get(key)
+        if path:
+            return path, None, False
+
+        with self._lock:
+            build = self._join(key)
+            if build is not None:
+                return None, build, False
+            build = _ArchiveBuild(self.disk.temp_path())
+            build.readers = 1
+            self._active[key] = build
+            self.builds += 1
+        return None, build, True
+
+    def _join(self, key):
+        """The active build for key with one more reader, or None; needs self._lock"""
+        build = self._active.get(key)
+        if build is not None:
+            with build.cond:
+                build.readers += 1
+            self.coalesced += 1
+        return build
+
+    def release(self, key, build):
+        """A reader of build is done with it"""
+        with build.cond:
+            build.readers -= 1
+
+    def abandon(self, key, build):
+        """The first request gave up before write_build(): fail the build for its followers"""
+        with self._lock:
+            if self._active.get(key) is build:
+                del self._active[key]
+            self.cancelled += 1
+        try:
+            os.unlink(build.temp_path)
+        except OSError:
+            pass
+        build.finish(IOError("Archive build abandoned"))
+
+    def write_build(self, key, build, entries, compression, client):
+        """
+        Write the archive for a build opened first by this caller, both into
+        the cache and to client, and publish it. Returns the finished
+        ZipStream. If client fails the build still completes for its
+        followers, and the client's error is raised afterwards.
+        """
+        error = None
+        tee = _ArchiveTee(build, client)
+        try:
+            with open(build.temp_path, "wb", buffering=0) as build._file:
+                out = BufferedSocketWriter(tee)
+                archive = ZipStream(out, compression)
+                archive.add_files(entries)
+                archive.close()
+                out.flush()
+            with build.cond:
+                build.path = self.disk.put_file(key, build.temp_path)
+            folders = self.member_folders(entries)
+            with self._lock:
+                self._folders[key] = folders
+        except Exception as e:
+            error = e
+            if e is tee.error:
+                logger.log("Archive build cancelled: every download of it ended", "INFO")
+                with self._lock:
+                    self.cancelled += 1
+            else:
+                logger.log(f"Archive build failed: {e}", "ERROR")
+            try:
+                os.unlink(build.temp_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            with self._lock:
+                if self._active.get(key) is build:
+                    del self._active[key]
+            build.finish(error)
+        if tee.error is not None:
+            raise tee.error
+        return archive
+
+    def invalidate_folder(self, path):
+        """Delete cached archives with members in path or below it"""
+        path = os.path.normpath(path)
+        with self._lock:
+            stale = [key for key, folders in self._folders.items() if path in folders]
+            for key in stale:
+                del self._folders[key]
+        for key in stale:
+            self.disk.discard(key)
+        self.invalidated += len(stale)
+
+    def after_fork(self):
+        """Forget builds inherited from the parent process; their writers did not come along"""
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """Disk usage plus build and coalescing counters"""
+        with self._lock:
+            active = len(self._active)
+        return {"disk": self.disk.stats(), "builds": self.builds,
+                "coalesced": self.coalesced, "active_builds": active,
+                "cancelled": self.cancelled, "invalidated": self.invalidated}
+
+
+archive_cache = ArchiveCache()
+
+
+# ============================================================================
+# CONTENT HASHES
+# ============================================================================
+
+import base64
+import mmap
+
+HASH_ALGORITHMS = ("sha256", "blake2b", "md5")
+HASH_WORKERS = min(4, os.cpu_count() or 1)   # hashlib drops the GIL, so threads hash in parallel
+HASH_MMAP_MIN = 1024 * 1024                  # Smaller files are read, larger ones mapped
+HASH_BLOCK = 16 * 1024 * 1024                # Bytes per update() call, from the map or a read
+HASH_CACHE_ENTRIES = 100000                  # Digests kept; the journal is compacted past twice that
+HASH_JOURNAL = os.path.join(APP_CACHE_DIR, "digests.log")
+HASH_JOURNAL_SYNC_INTERVAL = 2.0             # Seconds between looks for other processes' journal lines
+
+# Digest field names for the download headers, for the algorithms that have one
+REPR_DIGEST_NAMES = {"sha256": "sha-256"}              # RFC 9530 Repr-Digest
+LEGACY_DIGEST_NAMES = {"sha256": "SHA-256", "md5": "MD5"}  # RFC 3230 Digest
+
+
+def hash_file(path, algorithm):
+    """Hex digest of a file, mapping large files instead of copying them through reads"""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= HASH_MMAP_MIN:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, len(view), HASH_BLOCK):
+                            digest.update(view[offset:offset + HASH_BLOCK])
+                    finally:
+                        view.release()
+                return digest.hexdigest()
+            except (OSError, ValueError):
+                # Not mappable (special files, some FUSE mounts): read it instead
+                digest = hashlib.new(algorithm)
+                f.seek(0)
+        buffer = bytearray(min(HASH_BLOCK, max(size, 64 * 1024)))
+        view = memoryview(buffer)
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+    return digest.hexdigest()
+
+
+class ContentHashes:
+    """
+    File digests computed on a thread pool and remembered across restarts.
+
+    Digests are keyed by (device, inode, size, mtime_ns), so a changed file
+    simply misses and nothing has to be invalidated. They are kept in memory
+    and appended to a journal of "dev ino size mtime_ns algorithm hex" lines.
+    Worker processes share the journal: lookups read the lines others
+    appended at most every HASH_JOURNAL_SYNC_INTERVAL, and always before a
+    file is hashed. Concurrent requests for the same file share one computation.
+    """
+
+    def __init__(self, journal=HASH_JOURNAL):
+        self.journal = journal
+        self.hits = 0
+        self.computed = 0
+        self.bytes_hashed = 0
+        self.seconds = 0.0
+        self._digests = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._journal_id = None   # (st_dev, st_ino) of the journal read so far
+        self._journal_offset = 0
+        self._journal_lines = 0
+        self._next_sync = 0.0     # time.monotonic() of the next throttled look at the journal
+
+    @staticmethod
+    def key(st, algorithm):
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, algorithm)
+
+    def _sync(self):
+        # Called with the lock held: read journal lines appended since the last look
+        self._next_sync = time.monotonic() + HASH_JOURNAL_SYNC_INTERVAL
+        try:
+            st = os.stat(self.journal)
+        except OSError:
+            return
+        if (st.st_dev, st.st_ino) != self._journal_id or st.st_size < self._journal_offset:
+            # First look, or another process compacted it
+            self._digests.clear()
+            self._journal_id = (st.st_dev, st.st_ino)
+            self._journal_offset = self._journal_lines = 0
+        if st.st_size == self._journal_offset:
+            return
+        try:
+            with open(self.journal, "rb") as f:
+                f.seek(self._journal_offset)
+                data = f.read(st.st_size - self._journal_offset)
+        except OSError:
+            return
+        data = data[:data.rfind(b"\n") + 1]  # A line still being written is read next time
+        self._journal_offset += len(data)
+        for line in data.decode("ascii", "replace").splitlines():
+            fields = line.split()
+            if len(fields) != 6 or fields[4] not in HASH_ALGORITHMS:
+                continue
+            try:
+                key = (int(fields[0]), int(fields[1]), int(fields[2]), int(fields[3]), fields[4])
+            except ValueError:
+                continue
+            self._remember(key, fields[5])
+            self._journal_lines += 1
+
+    def _remember(self, key, hexdigest):
+        self._digests[key] = hexdigest
+        self._digests.move_to_end(key)
+        while len(self._digests) > HASH_CACHE_ENTRIES:
+            self._digests.popitem(last=False)
+
+    def known(self, st, algorithm, sync=False):
+        """
+        Digest for this file version if it was computed before, else None;
+        never hashes. A miss looks at the journal only if the last look is
+        HASH_JOURNAL_SYNC_INTERVAL old, or with sync=True.
+        """
+        key = self.key(st, algorithm)
+        with self._lock:
+            hexdigest = self._digests.get(key)
+            if hexdigest is None and (sync or time.monotonic() >= self._next_sync):
+                self._sync()
+                hexdigest = self._digests.get(key)
+        return hexdigest
+
+    def record(self, st, algorithm, hexdigest):
+        """Remember a digest for a file version, e.g. one verified during an upload"""
+        key = self.key(st, algorithm)
+        line = " ".join(str(part) for part in key) + f" {hexdigest}\n"
+        with self._lock:
+            self._remember(key, hexdigest)
+            try:
+                os.makedirs(os.path.dirname(self.journal), exist_ok=True)
+                # One O_APPEND write per line, so worker processes never interleave lines
+                fd = os.open(self.journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line.encode("ascii"))
+                finally:
+                    os.close(fd)
+                # Other processes may have appended before our line: read on from the
+                # last offset, which takes in theirs and ours alike
+                self._sync()
+                if self._journal_lines > 2 * HASH_CACHE_ENTRIES:
+                    self._compact()
+            except OSError as e:
+                logger.log(f"Could not save digest: {e}", "WARNING")
+
+    def _compact(self):
+        # Called with the lock held: rewrite the journal with the digests still kept
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(self.journal))
+        with os.fdopen(fd, "w", encoding="ascii") as f:
+            for key, hexdigest in self._digests.items():
+                f.write(" ".join(str(part) for part in key) + f" {hexdigest}\n")
+        os.replace(temp_path, self.journal)
+        st = os.stat(self.journal)
+        self._journal_id = (st.st_dev, st.st_ino)
+        self._journal_offset = st.st_size
+        self._journal_lines = len(self._digests)
+
+    def get(self, path, algorithm):
+        """
+        (hex digest, st, cached) for a file. Hashes on the pool when the
+        digest is not known yet; raises OSError if the file cannot be read.
+        """
+        st = os.stat(path)
+        hexdigest = self.known(st, algorithm)
+        if hexdigest is None:
+            # Hashing costs far more than a look at the journal another process may have filled
+            hexdigest = self.known(st, algorithm, sync=True)
+        if hexdigest is not None:
+            self.hits += 1
+            return hexdigest, st, True
+        key = self.key(st, algorithm)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pyserver-hash")
+                future = self._pool.submit(self._compute, path, st, algorithm)
+                self._pending[key] = future
+                future.add_done_callback(lambda _, key=key: self._pending.pop(key, None))
+        return future.result(), st, False
+
+    def _compute(self, path, st, algorithm):
+        start = time.perf_counter()
+        hexdigest = hash_file(path, algorithm)
+        try:
+            unchanged = self.key(os.stat(path), algorithm) == self.key(st, algorithm)
+        except OSError:
+            unchanged = False
+        if unchanged:
+            # Only a file that did not change while it was read gets remembered
+            self.record(st, algorithm, hexdigest)
+        self.computed += 1
+        self.bytes_hashed += st.st_size
+        self.seconds += time.perf_counter() - start
+        return hexdigest
+
+    def digest_headers(self, st):
+        """(header, value) pairs for the digests already known for this file version"""
+        headers = []
+        repr_fields = []
+        legacy_fields = []
+        for algorithm in HASH_ALGORITHMS:
+            if algorithm not in REPR_DIGEST_NAMES and algorithm not in LEGACY_DIGEST_NAMES:
+                continue
+            hexdigest = self.known(st, algorithm)
+            if hexdigest is None:
+                continue
+            encoded = base64.b64encode(bytes.fromhex(hexdigest)).decode("ascii")
+            if algorithm in REPR_DIGEST_NAMES:
+                repr_fields.append(f"{REPR_DIGEST_NAMES[algorithm]}=:{encoded}:")
+            if algorithm in LEGACY_DIGEST_NAMES:
+                legacy_fields.append(f"{LEGACY_DIGEST_NAMES[algorithm]}={encoded}")
+        if repr_fields:
+            headers.append(("Repr-Digest", ", ".join(repr_fields)))
+        if legacy_fields:
+            headers.append(("Digest", ", ".join(legacy_fields)))
+        return headers
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def after_fork(self):
+        """Drop the pool and computations inherited from the parent process; their threads did not come along"""
+        self._pool = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        return {
+            "known": len(self._digests),
+            "hits": self.hits,
+            "computed": self.computed,
+            "pending": len(self._pending),
+            "mb_per_second": round(self.bytes_hashed / 1e6 / self.seconds, 1) if self.seconds else None,
+        }
+
+
+content_hashes = ContentHashes()
+
+
+# ============================================================================
+# DELTA DOWNLOADS
+# ============================================================================
+
+import math
+
+DELTA_MIN_BLOCK = 4 * 1024
+DELTA_MAX_BLOCK = 256 * 1024
+DELTA_STRONG_BYTES = 16                  # blake2b digest size per block
+DELTA_SIGNATURE_BUDGET = 128 * 1024 * 1024
+DELTA_SIGNATURE_TIMEOUT = 600
+DELTA_MAX_REQUEST = 1024 * 1024          # POST /api/blocks range lists
+SIGNATURE_MAGIC = b"PSIG"
+SIGNATURE_VERSION = 1
+SIGNATURE_HEADER = struct.Struct("<4sB3xIQ")   # magic, version, block size, file size
+SIGNATURE_BLOCK = struct.Struct("<I")          # Adler-32, followed by the strong digest
+
+
+def delta_block_size(size):
+    """Default block size: the power of two nearest above sqrt(size), clamped"""
+    block = 1 << max(0, math.isqrt(max(size, 1)) - 1).bit_length()
+    return min(max(block, DELTA_MIN_BLOCK), DELTA_MAX_BLOCK)
+
+
+def valid_delta_block(block):
+    return DELTA_MIN_BLOCK <= block <= DELTA_MAX_BLOCK and block & (block - 1) == 0
+
+
+def write_signature(f, size, block, out):
+    """
+    Write the block signature of an open file to out.
+
+    The format is a SIGNATURE_HEADER, then for every block (the last one may
+    be short) its Adler-32 as a little-endian uint32 and its 16-byte blake2b
+    digest. Adler-32 can be rolled one byte at a time, so a client can find
+    these blocks at any offset of its own copy (see tools/delta_fetch.py).
+    """
+    out.write(SIGNATURE_HEADER.pack(SIGNATURE_MAGIC, SIGNATURE_VERSION, block, size))
+    buffer = bytearray(block)
+    view = memoryview(buffer)
+    records = []
+    while True:
+        count = f.readinto(buffer)
+        if not count:
+            break
+        data = view[:count]
+        records.append(SIGNATURE_BLOCK.pack(zlib.adler32(data)))
+        records.append(hashlib.blake2b(data, digest_size=DELTA_STRONG_BYTES).digest())
+        if len(records) >= 8192:
+            out.write(b"".join(records))
+            records = []
+    out.write(b"".join(records))
+
+
+def parse_block_ranges(text, block_count):
+    """[(first, last), ...] from "0-3,10,12-15" (inclusive block indices), or None if invalid"""
+    ranges = []
+    for part in text.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            return None
+        if not 0 <= first <= last < block_count:
+            return None
+        ranges.append((first, last))
+    return ranges or None
+
+
+class DeltaSignatures:
+    """
+    Block signatures for delta downloads, kept in a DiskCache.
+
+    Keys include the file's device, inode, size and mtime, so a changed file
+    gets a fresh signature and the old one ages out of the byte budget.
+    Requests for a signature that is already being computed wait for it.
+    """
+
+    def __init__(self, budget=DELTA_SIGNATURE_BUDGET):
+        self.disk = DiskCache("signatures", budget, ".sig")
+        self.computed = 0
+        self.seconds = 0.0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, st, block):
+        """Path of the cached signature, computing it if needed; raises OSError if the file cannot be read"""
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, block)
+        cached = self.disk.get(key)
+        if cached:
+            return cached
+        with self._lock:
+            done = self._pending.get(key)
+            owner = done is None
+            if owner:
+                done = self._pending[key] = threading.Event()
+        if not owner:
+            done.wait(DELTA_SIGNATURE_TIMEOUT)
+            cached = self.disk.get(key)
+            if cached:
+                return cached
+            raise OSError(f"Signature of {os.path.basename(path)} is not available")
+        try:
+            start = time.perf_counter()
+            out_path = self.disk.temp_path()
+            try:
+                with open(path, "rb") as f, open(out_path, "wb") as out:
+                    write_signature(f, st.st_size, block, out)
+                    now = os.fstat(f.fileno())
+                    if (now.st_size, now.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                        raise OSError(f"{os.path.basename(path)} changed while its signature was computed")
+                self.disk.put_file(key, out_path)
+            except BaseException:
+                try:
+                    os.unlink(out_path)
+                except OSError:
+                    pass
+                raise
+            with self._lock:
+                self.computed += 1
+                self.seconds += time.perf_counter() - start
+            return self.disk.get(key)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "computing": len(self._pending),
+                "computed": self.computed,
+                "avg_ms": round(1000 * self.seconds / self.computed, 1) if self.computed else 0.0,
+                "disk": self.disk.stats(),
+            }
+
+
+delta_signatures = DeltaSignatures()
+
+
+# ============================================================================
+# IMAGE THUMBNAILS
+# ============================================================================
+
+try:
+    from PIL import Image as PILImage, ImageOps
+    THUMBNAILS_AVAILABLE = True
+except ImportError:
+    THUMBNAILS_AVAILABLE = False
+
+THUMB_SIZES = (128, 256)                 # Bounding boxes served by /thumb/?s=
+THUMB_CACHE_BUDGET = 256 * 1024 * 1024   # Bytes of rendered thumbnails kept on disk
+THUMB_QUALITY = 80
+THUMB_TIMEOUT = 30                       # Seconds a request waits for its render
+THUMB_WORKERS = max(1, min(4, os.cpu_count() or 1))
+THUMB_EXTENSIONS = frozenset((".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"))
+THUMB_FAILED_MAX = 1000                  # Unrenderable images remembered so they are not retried
+
+
+def render_thumbnail(path, box, out_path):
+    """Render the image at path, fitted into box x box, as a JPEG written to out_path"""
+    with PILImage.open(path) as image:
+        # JPEG only: decode at 1/2, 1/4 or 1/8 scale straight from the DCT data
+        image.draft("RGB", (box, box))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((box, box))
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = PILImage.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(out_path, "JPEG", quality=THUMB_QUALITY)
+
+
+class ThumbnailService:
+    """
+    Renders thumbnails on a thread pool and keeps them in a DiskCache.
+
+    Keys include the image's mtime and size, so an edited photo simply gets
+    a new thumbnail and the old one ages out of the byte budget. Requests
+    for a thumbnail that is already rendering wait for the same job. Pillow
+    releases the GIL while decoding and resizing, so threads render in
+    parallel; a process pool would have to fork this multi-threaded server
+    or spawn children that re-import Kivy and open a window.
+    """
+
+    def __init__(self, budget=THUMB_CACHE_BUDGET, workers=THUMB_WORKERS):
+        self.disk = DiskCache("thumbnails", budget, ".jpg")
+        self.workers = workers
+        self.rendered = 0
+        self.failed = 0
+        self.render_seconds = 0.0
+        self._pool = None
+        self._pending = {}
+        self._failed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        # Called with the lock held
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pyserver-thumb")
+        return self._pool
+
+    def get(self, path, st, box):
+        """Path of the cached thumbnail, rendering it if needed; None if the image cannot be read"""
+        key = (path, st.st_mtime_ns, st.st_size, box)
+        cached = self.disk.get(key)
+        if cached:
+            return cached
+        with self._lock:
+            if key in self._failed:
+                return None
+            done = self._pending.get(key)
+            render = done is None
+            if render:
+                # Waiters wake on this event, set only once the result is in the cache
+                done = self._pending[key] = threading.Event()
+                executor = self._executor()
+        if render:
+            # Outside the lock: a render that is already over runs _finished on this thread
+            out_path = self.disk.temp_path()
+            started = time.perf_counter()
+            try:
+                future = executor.submit(render_thumbnail, path, box, out_path)
+            except RuntimeError:
+                # The pool was shut down under us (server stopping)
+                try:
+                    os.unlink(out_path)
+                except OSError:
+                    pass
+                with self._lock:
+                    self._pending.pop(key, None)
+                done.set()
+                return None
+            future.add_done_callback(lambda f: self._finished(key, out_path, started, done, f))
+        done.wait(THUMB_TIMEOUT)
+        return self.disk.get(key)
+
+    def _finished(self, key, out_path, started, done, future):
+        try:
+            error = None if future.cancelled() else future.exception()
+            if error is None and not future.cancelled():
+                try:
+                    self.disk.put_file(key, out_path)
+                    with self._lock:
+                        self.rendered += 1
+                        self.render_seconds += time.perf_counter() - started
+                    return
+                except OSError as e:
+                    error = e
+            try:
+                os.unlink(out_path)
+            except OSError:
+                pass
+            if error is not None:
+                logger.log(f"Thumbnail failed for {os.path.basename(key[0])}: {error}", "WARNING")
+                with self._lock:
+                    self.failed += 1
+                    self._failed[key] = True
+                    while len(self._failed) > THUMB_FAILED_MAX:
+                        self._failed.popitem(last=False)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            done.set()
+
+    def shutdown(self):
+        """Stop the pool (a new one starts on demand)"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def after_fork(self):
+        """Drop the pool and renders inherited from the parent process; their threads did not come along"""
+        self._pool = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "available": THUMBNAILS_AVAILABLE,
+                "workers": self.workers,
+                "rendering": len(self._pending),
+                "rendered": self.rendered,
+                "failed": self.failed,
+                "avg_render_ms": round(1000 * self.render_seconds / self.rendered, 1) if self.rendered else 0.0,
+                "disk": self.disk.stats(),
+            }
+
+
+thumbnail_service = ThumbnailService()
+
+
+# ============================================================================
+# STATIC ASSETS
+# ============================================================================
+
+STATIC_URL_PREFIX = "/__pyserver/static/"
+
+LISTING_CSS = """\
+* { margin: 0; padding: 0; box-sizing: border-box; }
+body {
+    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    min-height: 100vh;
+    padding: 20px;
+}
+.container {
+    max-width: 1200px;
+    margin: 0 auto;
+    background: white;
+    border-radius: 16px;
+    box-shadow: 0 20px 60px rgba(0,0,0,0.3);
+    overflow: hidden;
+}
+.header {
+    background: linear-gradient(135deg, #6366F1 0%, #4F46E5 100%);
+    color: white;
+    padding: 30px;
+    text-align: center;
+}
+.header h1 { font-size: 2em; font-weight: 600; }
+.breadcrumb {
+    background: #F9FAFB;
+    padding: 15px 30px;
+    border-bottom: 1px solid #E5E7EB;
+    display: flex;
+    align-items: center;
+    flex-wrap: wrap;
+    word-break: break-word;
+}
+.breadcrumb a {
+    color: #6366F1;
+    text-decoration: none;
+    margin: 0 5px;
+}
+.breadcrumb a:hover { text-decoration: underline; }
+.file-list { padding: 20px; }
+
+.file-item {
+    display: flex;
+    align-items: flex-start;
+    justify-content: space-between;
+    gap: 10px;
+    padding: 15px;
+    border-bottom: 1px solid #E5E7EB;
+    transition: background 0.2s;
+    flex-wrap: nowrap;
+    word-break: break-word;
+}
+.file-item:hover { background: #F9FAFB; }
+.file-icon {
+    font-size: 28px;
+    margin-right: 10px;
+    min-width: 28px;
+    margin-top: 2px;
+}
+.file-icon .thumb {
+    display: block;
+    width: 48px;
+    height: 48px;
+    object-fit: cover;
+    border-radius: 6px;
+    background: #F3F4F6;
+}
+.file-info {
+    flex: 1 1 auto;
+    min-width: 0;
+    overflow: hidden;
+}
+.file-name {
+    color: #111827;
+    text-decoration: none;
+    font-weight: 500;
+    display: block;
+    word-wrap: anywhere;
+    white-space: normal;
+}
+.file-name:hover { color: #6366F1; }
+.file-meta {
+    color: #6B7280;
+    font-size: 0.85em;
+    margin-top: 5px;
+}
+.file-meta .calculating {
+    font-style: italic;
+    color: #9CA3AF;
+}
+.file-actions {
+    flex-shrink: 0;
+    display: flex;
+    align-items: flex-start;
+    justify-content: flex-end;
+    gap: 8px;
+    min-width: 120px;
+}
+.download-btn {
+    background: #10B981;
+    color: white;
+    border: none;
+    padding: 8px 14px;
+    border-radius: 6px;
+    cursor: pointer;
+    text-decoration: none;
+    font-size: 0.85em;
+    white-space: nowrap;
+    transition: background 0.2s;
+}
+.download-btn:hover { background: #059669; }
+.download-btn.zip {
+    background: #F59E0B;
+}
+.download-btn.zip:hover {
+    background: #D97706;
+}
+.search-box {
+    padding: 20px 30px;
+    background: #F9FAFB;
+    border-bottom: 1px solid #E5E7EB;
+}
+.search-box input {
+    width: 100%;
+    padding: 12px 20px;
+    border: 2px solid #E5E7EB;
+    border-radius: 8px;
+    font-size: 14px;
+}
+.search-box input:focus {
+    outline: none;
+    border-color: #6366F1;
+}
+.search-results {
+    display: flex;
+    flex-direction: column;
+    gap: 6px;
+    margin-top: 12px;
+}
+.search-results:empty { display: none; }
+.search-results a {
+    color: #4F46E5;
+    text-decoration: none;
+    overflow-wrap: anywhere;
+}
+.search-results a:hover { text-decoration: underline; }
+.search-results span { color: #6B7280; font-size: 0.9em; }
+.batch-bar {
+    display: flex;
+    align-items: center;
+    flex-wrap: wrap;
+    gap: 12px;
+    padding: 12px 30px;
+    border-bottom: 1px solid #E5E7EB;
+    position: sticky;
+    top: 0;
+    background: white;
+    z-index: 1;
+}
+.batch-bar #selectedCount { color: #6B7280; font-size: 0.9em; flex: 1; }
+.batch-bar select {
+    padding: 6px 8px;
+    border: 2px solid #E5E7EB;
+    border-radius: 6px;
+}
+.download-btn:disabled { background: #9CA3AF; cursor: default; }
+.download-btn.upload { background: #6366F1; }
+.download-btn.upload:hover { background: #4F46E5; }
+.upload-box {
+    display: flex;
+    align-items: center;
+    flex-wrap: wrap;
+    gap: 12px;
+    padding: 12px 30px;
+    border-bottom: 1px solid #E5E7EB;
+}
+.upload-box input[type=file] { flex: 1; min-width: 0; }
+#uploadStatus { color: #6B7280; font-size: 0.9em; }
+.select-item {
+    margin-top: 9px;
+    width: 18px;
+    height: 18px;
+    flex-shrink: 0;
+}
+
+@media (max-width: 768px) {
+    body { padding: 0; }
+    .container { border-radius: 0; }
+    .file-item {
+        flex-direction: row;
+        align-items: flex-start;
+        padding: 12px;
+    }
+    .file-info {
+        flex: 1 1 auto;
+        overflow-wrap: anywhere;
+    }
+    .file-actions {
+        gap: 6px;
+        min-width: auto;
+    }
+    .download-btn {
+        padding: 7px 10px;
+        font-size: 0.8em;
+    }
+}
+
+@media (max-width: 480px) {
+    .header h1 { font-size: 1.6em; }
+    .file-meta { font-size: 0.8em; }
+    .download-btn {
+        padding: 6px 8px;
+        font-size: 0.78em;
+    }
+}
+"""
+
+LISTING_JS = """\
+let searchTimer = null;
+
+function filterFiles() {
+    const input = document.getElementById('search');
+    const filter = input.value.toUpperCase();
+    const items = document.querySelectorAll('.file-item');
+
+    items.forEach(item => {
+        const name = item.querySelector('.file-name').textContent;
+        item.style.display = name.toUpperCase().indexOf(filter) > -1 ? '' : 'none';
+    });
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => searchTree(input.value.trim()), 250);
+}
+
+function searchTree(text) {
+    // Matches anywhere below this folder, from the server's filename index
+    const box = document.getElementById('searchResults');
+    if (text.length < 2 || !window.fetch) { box.textContent = ''; return; }
+    const folder = decodeURIComponent(location.pathname).replace(/^\\/+|\\/+$/g, '');
+    fetch('/api/search?limit=50&q=' + encodeURIComponent(text) + '&path=' + encodeURIComponent(folder))
+        .then(response => response.json())
+        .then(data => {
+            if (document.getElementById('search').value.trim() !== text) { return; }
+            box.textContent = '';
+            (data.results || []).forEach(item => {
+                const link = document.createElement('a');
+                link.href = '/' + item.path.split('/').map(encodeURIComponent).join('/') +
+                    (item.type === 'dir' ? '/' : '');
+                link.textContent = (item.type === 'dir' ? '📁 ' : '📄 ') + item.path;
+                box.appendChild(link);
+            });
+            const note = document.createElement('span');
+            if (!data.ready) {
+                note.textContent = 'Still indexing, results may be incomplete';
+            } else if (data.truncated) {
+                note.textContent = 'Showing the first ' + data.results.length + ' matches';
+            } else if (!data.results.length) {
+                note.textContent = 'No matches in subfolders';
+            }
+            if (note.textContent) { box.appendChild(note); }
+        })
+        .catch(() => { box.textContent = ''; });
+}
+
+let sizeRounds = 0;
+
+function formatSize(size) {
+    for (const unit of ['B', 'KB', 'MB', 'GB']) {
+        if (size < 1024) { return size.toFixed(1) + ' ' + unit; }
+        size /= 1024;
+    }
+    return size.toFixed(1) + ' TB';
+}
+
+function fillFolderSizes() {
+    // Folders listed before their size was known poll /api/sizes until it is
+    const pending = document.querySelectorAll('.calculating');
+    if (!pending.length || !window.fetch || ++sizeRounds > 60) { return; }
+    const folder = decodeURIComponent(location.pathname).replace(/^\\/+|\\/+$/g, '');
+    fetch('/api/sizes?path=' + encodeURIComponent(folder))
+        .then(response => response.json())
+        .then(data => {
+            const children = data.children || {};
+            pending.forEach(marker => {
+                const totals = children[marker.dataset.name];
+                if (totals) {
+                    marker.replaceWith(formatSize(totals.size) + ' • ' +
+                        totals.files.toLocaleString('en-US') + ' files');
+                }
+            });
+        })
+        .catch(() => {})
+        .then(() => setTimeout(fillFolderSizes, Math.min(500 * sizeRounds, 5000)));
+}
+
+function updateSelection() {
+    const count = document.querySelectorAll('.select-item:checked').length;
+    document.getElementById('selectedCount').textContent = count + ' selected';
+    document.getElementById('batchDownload').disabled = count === 0;
+}
+
+const UPLOAD_RESUMABLE_MIN = 16 * 1048576;  // Larger files go through /api/upload sessions
+const UPLOAD_PARALLEL = 4;                  // Chunks in flight per file
+const UPLOAD_RETRIES = 20;                  // Attempts per chunk; backoff is capped at 30 s
+
+function uploadFiles(form) {
+    // Send with XHR/fetch for progress and resume; without them the form posts normally
+    if (!window.FormData || !window.XMLHttpRequest || !window.fetch) { return true; }
+    const status = document.getElementById('uploadStatus');
+    const button = form.querySelector('button');
+    const files = Array.from(form.querySelector('input[type=file]').files);
+    const progress = {
+        sent: 0,
+        total: files.reduce((n, f) => n + f.size, 0),
+        started: Date.now(),
+        show(note) {
+            const seconds = Math.max((Date.now() - this.started) / 1000, 0.001);
+            status.textContent = (note || 'Uploading') + ' ' +
+                Math.round(100 * this.sent / Math.max(this.total, 1)) + '% (' +
+                (this.sent / seconds / 1048576).toFixed(1) + ' MB/s)';
+        }
+    };
+    const small = files.filter(f => f.size < UPLOAD_RESUMABLE_MIN);
+    button.disabled = true;
+    (async () => {
+        for (const file of files.filter(f => f.size >= UPLOAD_RESUMABLE_MIN)) {
+            await uploadResumable(file, progress);
+        }
+        if (small.length) { await uploadForm(small, progress); }
+        location.reload();
+    })().catch(err => {
+        status.textContent = 'Upload failed (' + err.message + ')';
+        button.disabled = false;
+    });
+    return false;
+}
+
+function uploadForm(files, progress) {
+    // One multipart POST for the small files
+    return new Promise((resolve, reject) => {
+        const data = new FormData();
+        files.forEach(f => data.append('file', f));
+        const xhr = new XMLHttpRequest();
+        const base = progress.sent;
+        xhr.upload.onprogress = e => {
+            progress.sent = base + e.loaded;
+            progress.show();
+        };
+        xhr.onload = () => xhr.status === 201 ? resolve() : reject(new Error(xhr.status));
+        xhr.onerror = () => reject(new Error('connection lost'));
+        xhr.open('POST', location.pathname);
+        xhr.setRequestHeader('Accept', 'application/json');
+        xhr.send(data);
+    });
+}
+
+async function uploadApi(method, url, body) {
+    const response = await fetch(url, {method: method, body: body,
+                                       headers: {'Content-Type': 'application/json'}});
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok && response.status !== 409) { throw new Error(data.error || response.status); }
+    return data;
+}
+
+function missingChunks(received, size, chunkSize) {
+    // Gaps between the received [start, end) ranges, cut into chunkSize pieces
+    const chunks = [];
+    let position = 0;
+    for (const [start, end] of received.concat([[size, size]])) {
+        for (let offset = position; offset < start; offset += chunkSize) {
+            chunks.push([offset, Math.min(offset + chunkSize, start)]);
+        }
+        position = Math.max(position, end);
+    }
+    return chunks;
+}
+
+async function putChunk(id, file, start, end, progress) {
+    for (let attempt = 1; ; attempt++) {
+        try {
+            const response = await fetch('/api/upload/' + id + '?offset=' + start,
+                                         {method: 'PUT', body: file.slice(start, end)});
+            if (response.ok) { break; }
+            if (response.status < 500 || attempt >= UPLOAD_RETRIES) { throw new Error(response.status); }
+        } catch (err) {
+            if (!(err instanceof TypeError) || attempt >= UPLOAD_RETRIES) { throw err; }
+            progress.show('Connection lost, retrying…');
+        }
+        await new Promise(r => setTimeout(r, Math.min(1000 * 2 ** attempt, 30000)));
+    }
+    progress.sent += end - start;
+    progress.show();
+}
+
+async function uploadResumable(file, progress) {
+    // A lastModified key lets a re-selected file resume its earlier session
+    let session = await uploadApi('POST', '/api/upload', JSON.stringify({
+        path: decodeURIComponent(location.pathname), name: file.name,
+        size: file.size, key: String(file.lastModified)}));
+    progress.sent += session.received_bytes;
+    for (let round = 0; round < 3 && !session.location; round++) {
+        const chunks = missingChunks(session.received, file.size, session.chunk_size);
+        let next = 0;
+        const worker = async () => {
+            while (next < chunks.length) {
+                const [start, end] = chunks[next++];
+                await putChunk(session.id, file, start, end, progress);
+            }
+        };
+        await Promise.all(Array.from({length: UPLOAD_PARALLEL}, worker));
+        const result = await uploadApi('POST', '/api/upload/' + session.id + '/finish', '{}');
+        session = result.location ? result : Object.assign(session, result);
+    }
+    if (!session.location) { throw new Error('incomplete'); }
+}
+
+function toggleAll(checked) {
+    // Only visible rows, so "select all" respects the search filter
+    document.querySelectorAll('.file-item').forEach(item => {
+        if (item.style.display !== 'none') {
+            item.querySelector('.select-item').checked = checked;
+        }
+    });
+    updateSelection();
+}
+
+setTimeout(fillFolderSizes, 500);
+"""
+
+
+def build_static_assets():
+    """
+    Build the asset table and the URL of each logical asset.
+
+    Returns ({hashed_name: (body, content type, compressed variants)},
+    {"listing.css": url, ...}). The hash is part of the URL, so the files can
+    be cached forever and a new release simply links to new names.
+    """
+    assets = {}
+    urls = {}
+    for stem, ext, body, content_type in (
+        ("listing", "css", LISTING_CSS, "text/css; charset=utf-8"),
+        ("listing", "js", LISTING_JS, "application/javascript; charset=utf-8"),
+    ):
+        data = body.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        variants = {coding: compress_bytes(data, coding) for coding in supported_encodings()}
+        hashed_name = f"{stem}.{digest}.{ext}"
+        assets[hashed_name] = (data, content_type, variants)
+        urls[f"{stem}.{ext}"] = STATIC_URL_PREFIX + hashed_name
+    return assets, urls
+
+
+STATIC_ASSETS, STATIC_ASSET_URLS = build_static_assets()
+
+
+# ============================================================================
+# STREAMING UPLOADS
+# ============================================================================
+
+import email.message
+import email.parser
+
+UPLOAD_CHUNK = 1024 * 1024        # Socket read and disk write size for request bodies
+UPLOAD_MAX_HEADER = 16 * 1024     # Largest header block of one multipart part
+UPLOAD_FILE_MODE = 0o644          # Permissions of received files (temp files start private)
+
+
+class RequestBody:
+    """File-like reader for a request body framed by Content-Length or chunked coding"""
+
+    def __init__(self, rfile, length=None, chunked=False):
+        self.rfile = rfile
+        self.remaining = length
+        self.chunked = chunked
+        self.bytes_read = 0
+        self._chunk_left = 0
+        self.done = length == 0 and not chunked
+
+    def read(self, size=UPLOAD_CHUNK):
+        """Up to size bytes; b"" at the end of the body"""
+        if self.done:
+            return b""
+        if self.chunked:
+            if self._chunk_left == 0:
+                self._chunk_left = self._next_chunk_size()
+                if self._chunk_left == 0:
+                    self.done = True
+                    return b""
+            data = self.rfile.read(min(size, self._chunk_left))
+            self._chunk_left -= len(data)
+            if self._chunk_left == 0:
+                self.rfile.readline()  # CRLF after the chunk data
+        else:
+            data = self.rfile.read(min(size, self.remaining))
+            self.remaining -= len(data)
+            self.done = self.remaining == 0
+        if not data:
+            raise ConnectionError("Client closed the connection during the upload")
+        self.bytes_read += len(data)
+        return data
+
+    def _next_chunk_size(self):
+        line = self.rfile.readline(1024)
+        try:
+            size = int(line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise ValueError("Malformed chunked request body")
+        if size == 0:
+            # Skip trailers up to the blank line
+            while self.rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                pass
+        return size
+
+
+class MultipartReader:
+    """
+    Incremental multipart/form-data parser.
+
+    The body is scanned in UPLOAD_CHUNK reads for the boundary delimiter;
+    part data before it is handed on immediately, so memory holds one read
+    plus a delimiter-sized tail however large the parts are.
+    """
+
+    def __init__(self, body, boundary):
+        self.body = body
+        self.delimiter = b"\r\n--" + boundary.encode("latin-1")
+        # A leading CRLF lets the first boundary match the same delimiter
+        self._buf = bytearray(b"\r\n")
+        self._eof = False
+
+    def _fill(self):
+        data = self.body.read(UPLOAD_CHUNK)
+        if not data:
+            self._eof = True
+        self._buf += data
+        return bool(data)
+
+    def _skip_to_delimiter(self):
+        """Drop data up to and including the next delimiter; True if it opens another part"""
+        while True:
+            index = self._buf.find(self.delimiter)
+            if index >= 0:
+                del self._buf[:index + len(self.delimiter)]
+                break
+            del self._buf[:max(0, len(self._buf) - len(self.delimiter))]
+            if not self._fill():
+                raise ValueError("Multipart body ended before its closing boundary")
+        while len(self._buf) < 2 and self._fill():
+            pass
+        if self._buf[:2] == b"--":
+            return False
+        line_end = self._buf.find(b"\r\n")
+        while line_end < 0 and self._fill():
+            line_end = self._buf.find(b"\r\n")
+        if line_end < 0:
+            raise ValueError("Malformed multipart boundary line")
+        del self._buf[:line_end + 2]
+        return True
+
+    def _read_headers(self):
+        while True:
+            end = self._buf.find(b"\r\n\r\n")
+            if end >= 0:
+                break
+            if len(self._buf) > UPLOAD_MAX_HEADER or not self._fill():
+                raise ValueError("Malformed multipart part headers")
+        text = bytes(self._buf[:end + 2]).decode("utf-8", "replace")
+        del self._buf[:end + 4]
+        return email.parser.Parser().parsestr(text, headersonly=True)
+
+    def parse(self, open_part):
+        """
+        Call open_part(headers) for every part. It returns a sink with
+        write(data) and close(), or None to discard the part's data.
+        """
+        more = self._skip_to_delimiter()
+        while more:
+            headers = self._read_headers()
+            sink = open_part(headers)
+            keep = len(self.delimiter) - 1
+            while True:
+                index = self._buf.find(self.delimiter)
+                if index >= 0:
+                    if sink is not None and index:
+                        sink.write(bytes(self._buf[:index]))
+                    break
+                if len(self._buf) > keep:
+                    if sink is not None:
+                        sink.write(bytes(self._buf[:-keep]))
+                    del self._buf[:-keep]
+                if not self._fill():
+                    raise ValueError("Multipart body ended inside a part")
+            if sink is not None:
+                sink.close()
+            more = self._skip_to_delimiter()
+        # Drain the epilogue so the connection can carry the next request
+        while self.body.read(UPLOAD_CHUNK):
+            pass
+
+
+def safe_upload_name(filename):
+    """
+    Last path component of a client-supplied file name, or None if unusable.
+
+    Characters like <>"' are legal in file names and kept; the listing
+    escapes names when it renders them (see _generate_html).
+    """
+    name = filename.replace("\\", "/").rsplit("/", 1)[-1].strip()
+    if name in ("", ".", "..") or "\0" in name:
+        return None
+    return name
+
+
+def available_name(directory, name):
+    """name, or "name (2)", "name (3)"... whichever does not exist in directory yet"""
+    taken = set()
+    while True:
+        candidate = unique_name(name, taken)
+        if not os.path.lexists(os.path.join(directory, candidate)):
+            return candidate
+
+
+def reserve_name(directory, name):
+    """
+    Like available_name, but creates the chosen file (empty) with O_EXCL, so
+    concurrent uploads never pick the same name. Returns the name.
+    """
+    taken = set()
+    while True:
+        candidate = unique_name(name, taken)
+        try:
+            os.close(os.open(os.path.join(directory, candidate), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+            return candidate
+        except FileExistsError:
+            continue
+
+
+class UploadTarget:
+    """
+    A file being received: written to a hidden temporary file beside its
+    destination and moved into place only once complete.
+    """
+
+    def __init__(self, directory, name, overwrite=False):
+        self.name = name if overwrite else available_name(directory, name)
+        self.path = os.path.join(directory, self.name)
+        fd, self.temp_path = tempfile.mkstemp(prefix=UPLOAD_TEMP_PREFIX, suffix=".part", dir=directory)
+        self._file = os.fdopen(fd, "wb", buffering=UPLOAD_CHUNK)
+        self.size = 0
+        self.done = False
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def write(self, data):
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        """Publish the finished file"""
+        self._file.close()
+        try:
+            os.chmod(self.temp_path, UPLOAD_FILE_MODE)
+        except OSError:
+            pass  # e.g. shared storage on Android has fixed permissions
+        os.replace(self.temp_path, self.path)
+        self.done = True
+        self.elapsed = time.perf_counter() - self.started
+
+    def abort(self):
+        """Discard a partial upload"""
+        try:
+            self._file.close()
+            os.unlink(self.temp_path)
+        except OSError:
+            pass
+
+
+# ============================================================================
+# RESUMABLE CHUNKED UPLOADS
+# ============================================================================
+
+import errno
+import secrets
+import shutil
+
+UPLOAD_SESSION_DIR = os.path.join(APP_CACHE_DIR, "uploads")
+UPLOAD_SESSION_CHUNK = 8 * 1024 * 1024   # Chunk size suggested to clients
+UPLOAD_SESSION_TTL = 24 * 3600           # Sessions idle this long are discarded
+UPLOAD_SESSION_SWEEP = 3600              # Seconds between checks for idle sessions
+UPLOAD_CHECKSUMS = ("sha256", "sha1", "md5")
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+
+def merge_ranges(ranges):
+    """Sorted, coalesced [start, end) pairs"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        elif start < end:
+            merged.append([start, end])
+    return merged
+
+
+def preallocate(fd, size):
+    """Reserve size bytes for fd, falling back to a sparse file where fallocate is unsupported"""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass  # e.g. FAT or FUSE storage on Android
+    os.ftruncate(fd, size)
+
+
+def pwrite(fd, data, offset):
+    """Write all of data at offset without touching other writers' file positions"""
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            # Windows: every request opens its own descriptor, so seeking is private
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+class UploadSession:
+    """
+    A large upload received in chunks, in any order and over any number of
+    connections.
+
+    Chunks are written with positional writes into a preallocated hidden
+    part file beside the destination (see is_upload_temp), so finishing is
+    a rename on the same filesystem. Every written range is appended to a
+    journal in UPLOAD_SESSION_DIR as one short O_APPEND write, so parallel
+    requests (and worker processes) never overwrite each other's records.
+    The journal is the only state: a session survives dropped connections
+    and server restarts alike.
+    """
+
+    def __init__(self, session_id, info, ranges=()):
+        self.id = session_id
+        self.directory = info["dir"]
+        self.name = info["name"]
+        self.size = info["size"]
+        self.key = info.get("key", "")
+        self.part_path = os.path.join(self.directory, UPLOAD_TEMP_PREFIX + session_id + ".part")
+        self.journal_path = os.path.join(UPLOAD_SESSION_DIR, session_id + ".journal")
+        self.claim_path = os.path.join(UPLOAD_SESSION_DIR, session_id + ".finishing")
+        self.received = merge_ranges(ranges)
+
+    @classmethod
+    def create(cls, directory, name, size, key=""):
+        session_id = secrets.token_hex(16)
+        info = {"dir": directory, "name": name, "size": size, "key": key}
+        session = cls(session_id, info)
+        os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+        fd = os.open(session.part_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _O_BINARY, 0o600)
+        try:
+            preallocate(fd, size)
+        except OSError:
+            os.close(fd)
+            os.unlink(session.part_path)
+            raise
+        os.close(fd)
+        temp_path = session.journal_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(info) + "\n")
+        os.replace(temp_path, session.journal_path)
+        return session
+
+    @classmethod
+    def load(cls, session_id):
+        """The session with this id, or None if it is unknown or finished"""
+        if not re.fullmatch(r"[0-9a-f]{32}", session_id):
+            return None
+        try:
+            with open(os.path.join(UPLOAD_SESSION_DIR, session_id + ".journal"),
+                      encoding="utf-8") as f:
+                info = json.loads(f.readline())
+                ranges = []
+                for line in f:
+                    try:
+                        start, end = line.split()
+                        ranges.append((int(start), int(end)))
+                    except ValueError:
+                        pass  # A record torn by a crash; its chunk is simply resent
+        except (OSError, ValueError):
+            return None
+        return cls(session_id, info, ranges)
+
+    @classmethod
+    def find(cls, directory, name, size, key=""):
+        """An unfinished session for the same file, so a restarted client can resume it"""
+        try:
+            ids = [n[:-len(".journal")] for n in os.listdir(UPLOAD_SESSION_DIR) if n.endswith(".journal")]
+        except OSError:
+            return None
+        for session_id in ids:
+            session = cls.load(session_id)
+            if (session is not None and session.directory == directory and session.name == name
+                    and session.size == size and session.key == key
+                    and os.path.exists(session.part_path)):
+                return session
+        return None
+
+    @staticmethod
+    def expire():
+        """Discard sessions that have not received data for UPLOAD_SESSION_TTL"""
+        cutoff = time.time() - UPLOAD_SESSION_TTL
+        try:
+            names = os.listdir(UPLOAD_SESSION_DIR)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(UPLOAD_SESSION_DIR, name)
+            try:
+                if os.stat(path).st_mtime >= cutoff:
+                    continue
+            except OSError:
+                continue
+            session = UploadSession.load(name[:-len(".journal")]) if name.endswith(".journal") else None
+            if session is not None:
+                logger.log(f"Discarding stale upload session for {session.name}", "INFO")
+                session.abort()
+            else:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    @property
+    def received_bytes(self):
+        return sum(end - start for start, end in self.received)
+
+    @property
+    def complete(self):
+        return self.received == ([[0, self.size]] if self.size else [])
+
+    def status(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "size": self.size,
+            "chunk_size": UPLOAD_SESSION_CHUNK,
+            "received": self.received,
+            "received_bytes": self.received_bytes,
+            "complete": self.complete,
+        }
+
+    def _record(self, start, end):
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | _O_BINARY)
+        try:
+            os.write(fd, b"%d %d\n" % (start, end))
+        finally:
+            os.close(fd)
+        self.received = merge_ranges(self.received + [[start, end]])
+
+    def write_chunk(self, offset, body):
+        """
+        Write the request body at offset; returns the bytes written. Whatever
+        arrived before a disconnect is recorded, so a resend can skip it.
+        """
+        position = offset
+        fd = os.open(self.part_path, os.O_WRONLY | _O_BINARY)
+        try:
+            while True:
+                data = body.read(UPLOAD_CHUNK)
+                if not data:
+                    break
+                if position + len(data) > self.size:
+                    raise ValueError("Chunk extends past the end of the upload")
+                pwrite(fd, data, position)
+                position += len(data)
+        finally:
+            os.close(fd)
+            if position > offset:
+                self._record(offset, position)
+        return position - offset
+
+    def verify(self, algorithm, expected):
+        """True if the received file hashes to the expected hex digest"""
+        digest = hashlib.new(algorithm)
+        with open(self.part_path, "rb") as f:
+            for block in iter(lambda: f.read(UPLOAD_CHUNK), b""):
+                digest.update(block)
+        return digest.hexdigest() == expected.lower()
+
+    def reset(self):
+        """Forget every received range, e.g. after a checksum mismatch"""
+        with open(self.journal_path, "r+", encoding="utf-8") as f:
+            f.readline()
+            f.truncate(f.tell())
+        self.received = []
+
+    def claim(self):
+        """
+        Mark the session as being finished, across requests and worker
+        processes; False if another request already is. See release().
+        """
+        try:
+            os.close(os.open(self.claim_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+            return True
+        except FileExistsError:
+            return False
+
+    def release(self):
+        try:
+            os.unlink(self.claim_path)
+        except OSError:
+            pass
+
+    def finish(self):
+        """Move the completed file into place; returns its final name. Call with the session claimed."""
+        try:
+            os.chmod(self.part_path, UPLOAD_FILE_MODE)
+        except OSError:
+            pass
+        name = reserve_name(self.directory, self.name)
+        path = os.path.join(self.directory, name)
+        try:
+            os.replace(self.part_path, path)
+        except BaseException:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            raise
+        try:
+            os.unlink(self.journal_path)
+        except OSError:
+            pass
+        return name
+
+    def abort(self):
+        for path in (self.part_path, self.journal_path, self.claim_path):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+# ============================================================================
+# ENHANCED HTTP REQUEST HANDLER
+# ============================================================================
+
+import html
+
+BATCH_MAX_BODY = 1024 * 1024   # Largest /download-batch request body
+BATCH_MAX_PATHS = 10000        # Selected items accepted in one batch download
+UPLOAD_API_MAX_BODY = 64 * 1024  # Largest JSON body of the /api/upload endpoints
+
+class EnhancedHTTPHandler(http.server.SimpleHTTPRequestHandler):
+    """HTTP handler with modern UI, file management, and download functionality"""
+    
+    server_version = f"PyServer/{APP_VERSION}"
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_IDLE_TIMEOUT  # Socket timeout; also bounds how long an idle keep-alive connection lives
+    allow_uploads = ALLOW_UPLOADS     # Set per server by ServerManager.start
+    worker_index = None               # Set in multi-process worker processes
+    
+    # Errors after which the request stream can no longer be trusted
+    _FATAL_ERROR_CODES = (400, 408, 411, 413, 414, 431, 501, 505)
+    _suppress_connection_close = False
+    
+    def setup(self):
+        """Per-connection state"""
+        super().setup()
+        self.requests_on_connection = 0
+    
+    def handle_one_request(self):
+        """Count requests so persistent connections can be capped"""
+        self.requests_on_connection += 1
+        self._awaiting_request = True
+        super().handle_one_request()
+    
+    def parse_request(self):
+        """Parse the request head and drop any body sent with a method that ignores it"""
+        self._awaiting_request = False
+        self._expect_continue = False
+        self._body = None
+        if not super().parse_request():
+            return False
+        if self.command in ('GET', 'HEAD', 'OPTIONS'):
+            self._discard_request_body()
+        return True
+    
+    def handle_expect_100(self):
+        """Defer "100 Continue" until a handler starts reading the body (see _request_body)"""
+        self._expect_continue = True
+        return True
+    
+    def _discard_request_body(self):
+        """Keep the connection in sync by consuming an unused request body"""
+        if self.headers.get('Transfer-Encoding', '').lower() not in ('', 'identity'):
+            self.close_connection = True
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.close_connection = True
+            return
+        if length > KEEPALIVE_MAX_DISCARD:
+            self.close_connection = True
+        elif length > 0:
+            self.rfile.read(length)
+    
+    def send_response(self, code, message=None):
+        """Send the status line, closing the connection once it has served its quota"""
+        super().send_response(code, message)
+        if self.requests_on_connection >= KEEPALIVE_MAX_REQUESTS and not self.close_connection:
+            super().send_header('Connection', 'close')
+    
+    def send_header(self, keyword, value):
+        """Send a header, letting non-fatal error pages keep the connection alive"""
+        if (self._suppress_connection_close and keyword.lower() == 'connection'
+                and value.lower() == 'close'):
+            return
+        super().send_header(keyword, value)
+    
+    def send_error(self, code, message=None, explain=None):
+        """Error pages are framed with Content-Length, so only fatal errors close the connection"""
+        if self.command in ('POST', 'PUT') and (self._body is None or not self._body.done):
+            # The unread rest of the body would be parsed as the next request
+            self.close_connection = True
+        self._suppress_connection_close = (
+            code not in self._FATAL_ERROR_CODES
+            and self.request_version >= 'HTTP/1.1'
+            and not self.close_connection
+        )
+        try:
+            super().send_error(code, message, explain)
+        finally:
+            self._suppress_connection_close = False
+    
+    def log_message(self, format, *args):
+        """Override to use our logger"""
+        message = f"{self.address_string()} - {format % args}"
+        logger.log(message, "INFO")
+    
+    def log_error(self, format, *args):
+        """Override error logging"""
+        if getattr(self, '_awaiting_request', False) and format.startswith("Request timed out"):
+            # An idle keep-alive connection reaching its timeout is routine
+            return
+        message = f"{self.address_string()} - {format % args}"
+        logger.log(message, "ERROR")
+    
+    def end_headers(self):
+        """Add CORS and security headers"""
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', CORS_ALLOW_METHODS)
+        self.send_header('Access-Control-Allow-Headers', CORS_ALLOW_HEADERS)
+        self.send_header('X-Content-Type-Options', 'nosniff')
+        if not self.close_connection and self.request_version >= 'HTTP/1.1':
+            remaining = KEEPALIVE_MAX_REQUESTS - self.requests_on_connection
+            self.send_header('Keep-Alive', f'timeout={KEEPALIVE_IDLE_TIMEOUT}, max={remaining}')
+        super().end_headers()
+    
+    def do_OPTIONS(self):
+        """Handle preflight requests"""
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def do_GET(self):
+        """Handle GET requests including download endpoints"""
+        # Check if this is a download request
+        if self.path.startswith('/download/'):
+            self.handle_download()
+            return
+        
+        if self.path.startswith(STATIC_URL_PREFIX):
+            self.serve_static_asset()
+            return
+        
+        if self.path.startswith('/thumb/'):
+            self.handle_thumbnail()
+            return
+        
+        if urllib.parse.urlsplit(self.path).path == '/api/list':
+            self.handle_api_list()
+            return
+        
+        if urllib.parse.urlsplit(self.path).path == '/api/status':
+            self.handle_api_status()
+            return
+        
+        if urllib.parse.urlsplit(self.path).path == '/api/search':
+            self.handle_api_search()
+            return
+        
+        if urllib.parse.urlsplit(self.path).path == '/api/sizes':
+            self.handle_api_sizes()
+            return
+        
+        if self.path.startswith('/api/hash/'):
+            self.handle_api_hash()
+            return
+        
+        if self.path.startswith('/api/signature/'):
+            self.handle_api_signature()
+            return
+        
+        if self.path.startswith('/api/blocks/'):
+            self.handle_api_blocks()
+            return
+        
+        if self.path.startswith('/api/upload/'):
+            session = self._upload_session()
+            if session is not None:
+                self._send_json(200, session.status())
+            return
+        
+        file_path = self._static_file_path()
+        if file_path:
+            self.serve_file(file_path)
+        else:
+            super().do_GET()
+    
+    def do_POST(self):
+        """Handle POST requests: batch downloads, upload sessions and multipart uploads into a folder"""
+        url_path = urllib.parse.urlsplit(self.path).path
+        if url_path == '/download-batch':
+            self.handle_download_batch()
+            return
+        
+        if url_path == '/api/upload':
+            if self._uploads_allowed():
+                self.handle_upload_create()
+            return
+        
+        if url_path.startswith('/api/upload/') and url_path.endswith('/finish'):
+            self.handle_upload_finish()
+            return
+        
+        if url_path.startswith('/api/blocks/'):
+            self.handle_api_blocks()
+            return
+        
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.split(';')[0].strip().lower() == 'multipart/form-data':
+            if not self._uploads_allowed():
+                return
+            directory = self.resolve_safe_path(urllib.parse.unquote(url_path).lstrip('/'))
+            if directory is None:
+                self.send_error(403, "Access denied")
+            elif not os.path.isdir(directory):
+                self.send_error(404, "Upload folder not found")
+            else:
+                self.handle_upload_form(directory)
+            return
+        
+        self.send_error(404, "Not found")
+    
+    def do_PUT(self):
+        """
+        Store the raw request body at the URL path.
+
+        An existing file is only replaced when If-Match names its current ETag
+        (or is "*"); without it the answer is 409, so a PUT never silently
+        overwrites. If-Match on a missing file, or a stale ETag, answers 412.
+        """
+        if self.path.startswith('/api/upload/'):
+            self.handle_upload_chunk()
+            return
+        if not self._uploads_allowed():
+            return
+        
+        relative_path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).lstrip('/')
+        full_path = self.resolve_safe_path(relative_path)
+        if full_path is None:
+            self.send_error(403, "Access denied")
+            return
+        if not relative_path or relative_path.endswith('/') or os.path.isdir(full_path):
+            self.send_error(409, "PUT needs a file path")
+            return
+        directory = os.path.dirname(full_path)
+        if not os.path.isdir(directory):
+            self.send_error(409, "Parent folder does not exist")
+            return
+        
+        try:
+            current = os.stat(full_path)
+        except OSError:
+            current = None
+        if_match = self.headers.get('If-Match')
+        if if_match is None:
+            if current is not None:
+                self.send_error(409, "File exists; send If-Match with its ETag to replace it")
+                return
+        elif current is None or not etag_matches(if_match, file_etag(current)):
+            self.send_error(412, "File changed or does not exist")
+            return
+        body = self._request_body()
+        if body is None:
+            return
+        
+        existed = current is not None
+        target = None
+        try:
+            target = UploadTarget(directory, os.path.basename(full_path), overwrite=existed)
+            while True:
+                data = body.read(UPLOAD_CHUNK)
+                if not data:
+                    break
+                target.write(data)
+            target.close()
+        except Exception as e:
+            if target is not None:
+                target.abort()
+            logger.log(f"Upload failed: {relative_path}: {e}", "ERROR")
+            self.close_connection = True
+            if not isinstance(e, ConnectionError):
+                self.send_error(500, "Upload failed")
+            return
+        
+        self._log_upload(target)
+        self.send_response(204 if existed else 201)
+        if not existed:
+            location = os.path.relpath(target.path, os.getcwd()).replace(os.sep, '/')
+            self.send_header('Location', urllib.parse.quote('/' + location))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def do_DELETE(self):
+        """Cancel an upload session (the session lookup checks uploads are allowed)"""
+        if not self.path.startswith('/api/upload/'):
+            self.send_error(404, "Not found")
+            return
+        session = self._upload_session()
+        if session is None:
+            return
+        session.abort()
+        logger.log(f"Upload cancelled: {session.name}", "INFO")
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def _request_body(self):
+        """RequestBody for the current request, or None after answering 411"""
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            body = RequestBody(self.rfile, chunked=True)
+        else:
+            try:
+                length = int(self.headers.get('Content-Length', ''))
+            except ValueError:
+                length = -1
+            if length < 0:
+                self.send_error(411, "Content-Length required")
+                return None
+            body = RequestBody(self.rfile, length)
+        self._body = body
+        if self._expect_continue:
+            self._expect_continue = False
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        return body
+    
+    def handle_upload_form(self, directory):
+        """
+        Save every file part of a multipart/form-data POST into directory.
+
+        Parts are parsed incrementally and written straight to disk; existing
+        files are never replaced, a clashing upload is saved as "name (2)".
+        Answers JSON to scripts (Accept: application/json) and redirects
+        browsers back to the listing.
+        """
+        message = email.message.Message()
+        message['Content-Type'] = self.headers.get('Content-Type', '')
+        boundary = message.get_param('boundary')
+        if not boundary or len(boundary) > 200:
+            self.send_error(400, "Missing multipart boundary")
+            return
+        body = self._request_body()
+        if body is None:
+            return
+        
+        saved = []
+        current = []
+        
+        def open_part(headers):
+            filename = headers.get_filename()
+            name = safe_upload_name(filename) if filename else None
+            if name is None:
+                return None  # Plain form fields carry nothing we need
+            target = UploadTarget(directory, name)
+            current.append(target)
+            return target
+        
+        try:
+            MultipartReader(body, boundary).parse(open_part)
+        except Exception as e:
+            for target in current:
+                if not target.done:
+                    target.abort()
+            logger.log(f"Upload failed after {self._format_size(body.bytes_read)}: {e}", "ERROR")
+            self.close_connection = True
+            if not isinstance(e, ConnectionError):
+                self.send_error(400 if isinstance(e, ValueError) else 500, "Upload failed")
+            return
+        
+        for target in current:
+            self._log_upload(target)
+            saved.append({"name": target.name, "size": target.size})
+        
+        if 'application/json' in self.headers.get('Accept', ''):
+            self._send_json(201, {"files": saved})
+        else:
+            self.send_response(303)
+            self.send_header('Location', self.path)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+    
+    def _log_upload(self, target):
+        rate = target.size / target.elapsed if target.elapsed > 0 else 0
+        logger.log(
+            f"File uploaded: {target.name} ({self._format_size(target.size)} in "
+            f"{target.elapsed:.2f}s, {self._format_size(rate)}/s)",
+            "INFO"
+        )
+    
+    def _uploads_allowed(self):
+        """
+        True if this request may write, else False after answering 403.
+
+        Writes need the ALLOW_UPLOADS opt-in and must not come from a page on
+        another origin: browsers send form POSTs cross-origin without a
+        preflight, so CORS alone does not stop them.
+        """
+        if not self.allow_uploads:
+            self.send_error(403, "Uploads are disabled on this server")
+            return False
+        origin = self.headers.get('Origin')
+        if origin is not None and (origin == 'null' or
+                                   urllib.parse.urlsplit(origin).netloc != self.headers.get('Host', '')):
+            self.send_error(403, "Uploads from other sites are not allowed")
+            return False
+        return True
+    
+    def _upload_session(self):
+        """UploadSession named by /api/upload/<id>[/finish], or None after answering 403/404"""
+        if not self._uploads_allowed():
+            return None
+        parts = urllib.parse.urlsplit(self.path).path.split('/')
+        session = UploadSession.load(parts[3]) if len(parts) > 3 else None
+        if session is None:
+            self.send_error(404, "Unknown upload session")
+        return session
+    
+    def _read_json(self, limit):
+        """The JSON object in the request body ({} when empty), or None after answering an error"""
+        body = self._read_body(limit)
+        if body is None:
+            return None
+        try:
+            request = json.loads(body.decode('utf-8')) if body.strip() else {}
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            self.send_error(400, f"Invalid JSON body: {e}")
+            return None
+        return request
+    
+    def handle_upload_create(self):
+        """
+        POST /api/upload {"path": folder, "name": file, "size": bytes, "key": optional}
+
+        Opens a resumable upload session (201), or returns the unfinished
+        session for the same folder, name, size and key (200) so a client that
+        lost its state can ask which ranges are still missing.
+        """
+        request = self._read_json(UPLOAD_API_MAX_BODY)
+        if request is None:
+            return
+        name = safe_upload_name(str(request.get('name', '')))
+        size = request.get('size')
+        key = str(request.get('key', ''))[:200]
+        if name is None or not isinstance(size, int) or isinstance(size, bool) or size < 0:
+            self.send_error(400, "name and a non-negative integer size are required")
+            return
+        directory = self.resolve_safe_path(str(request.get('path', '')).strip('/'))
+        if directory is None:
+            self.send_error(403, "Access denied")
+            return
+        if not os.path.isdir(directory):
+            self.send_error(404, "Upload folder not found")
+            return
+        
+        UploadSession.expire()
+        session = UploadSession.find(directory, name, size, key)
+        status = 200
+        if session is None:
+            try:
+                # The part file is preallocated beside the destination
+                if shutil.disk_usage(directory).free < size:
+                    self.send_error(507, "Not enough free space for this upload")
+                    return
+                session = UploadSession.create(directory, name, size, key)
+            except OSError as e:
+                logger.log(f"Could not start upload of {name}: {e}", "ERROR")
+                self.send_error(500, "Could not start upload")
+                return
+            status = 201
+            logger.log(f"Upload started: {name} ({self._format_size(size)})", "INFO")
+        self._send_json(status, session.status())
+    
+    def handle_upload_chunk(self):
+        """PUT /api/upload/<id>?offset=N: write the body at byte offset N"""
+        session = self._upload_session()
+        if session is None:
+            return
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        try:
+            offset = int(query.get('offset', ['0'])[0])
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            offset = length = -1
+        if offset < 0 or length < 0 or offset + length > session.size:
+            self.send_error(416, "Chunk outside the upload")
+            return
+        body = self._request_body()
+        if body is None:
+            return
+        try:
+            session.write_chunk(offset, body)
+        except ValueError as e:
+            self.close_connection = True
+            self.send_error(416, str(e))
+            return
+        except ConnectionError:
+            # The part that did arrive is recorded; the client resends the rest
+            logger.log(f"Upload chunk of {session.name} at {offset} interrupted", "WARNING")
+            self.close_connection = True
+            return
+        except OSError as e:
+            logger.log(f"Upload chunk of {session.name} at {offset} failed: {e}", "ERROR")
+            self.close_connection = True
+            self.send_error(500, "Chunk upload failed")
+            return
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def handle_upload_finish(self):
+        """
+        POST /api/upload/<id>/finish with an optional {"sha256": hex} (or sha1/md5).
+
+        Moves the file into its folder once every byte has arrived (201).
+        Missing ranges answer 409 with the session status; a checksum mismatch
+        answers 422 and clears the received ranges so the file can be resent.
+        """
+        session = self._upload_session()
+        if session is None:
+            return
+        request = self._read_json(UPLOAD_API_MAX_BODY)
+        if request is None:
+            return
+        if not session.complete:
+            self._send_json(409, dict(session.status(), error="Upload is incomplete"))
+            return
+        if not session.claim():
+            self._send_json(409, dict(session.status(), error="Upload is already being finished"))
+            return
+        verified = {}
+        try:
+            for algorithm in UPLOAD_CHECKSUMS:
+                expected = request.get(algorithm)
+                if expected and not session.verify(algorithm, str(expected)):
+                    session.reset()
+                    logger.log(f"Upload of {session.name} failed its {algorithm} check", "ERROR")
+                    self._send_json(422, dict(session.status(), error=f"{algorithm} mismatch"))
+                    return
+                if expected:
+                    verified[algorithm] = str(expected).lower()
+            name = session.finish()
+        except FileNotFoundError:
+            self.send_error(404, "Unknown upload session")
+            return
+        except OSError as e:
+            logger.log(f"Could not finish upload of {session.name}: {e}", "ERROR")
+            self.send_error(500, "Could not finish upload")
+            return
+        finally:
+            session.release()
+        
+        # Digests the client just proved are known for /api/hash and download headers
+        try:
+            st = os.stat(os.path.join(session.directory, name))
+            for algorithm, hexdigest in verified.items():
+                if algorithm in HASH_ALGORITHMS:
+                    content_hashes.record(st, algorithm, hexdigest)
+        except OSError:
+            pass
+        
+        logger.log(f"File uploaded: {name} ({self._format_size(session.size)}, resumable)", "INFO")
+        relative = os.path.relpath(os.path.join(session.directory, name), os.getcwd()).replace(os.sep, '/')
+        self._send_json(201, {"name": name, "size": session.size,
+                              "location": urllib.parse.quote('/' + relative)})
+    
+    def do_HEAD(self):
+        """Handle HEAD requests with the same headers GET would send"""
+        if self.path.startswith('/download/'):
+            self.handle_download()
+            return
+        
+        if self.path.startswith(STATIC_URL_PREFIX):
+            self.serve_static_asset()
+            return
+        
+        if self.path.startswith('/thumb/'):
+            self.handle_thumbnail()
+            return
+        
+        if self.path.startswith('/api/signature/'):
+            self.handle_api_signature()
+            return
+        
+        file_path = self._static_file_path()
+        if file_path:
+            self.serve_file(file_path, head_only=True)
+        else:
+            super().do_HEAD()
+    
+    def _static_file_path(self):
+        """Filesystem path when the request targets a regular file, else None"""
+        url_path = urllib.parse.urlsplit(self.path).path
+        if url_path.endswith('/'):
+            return None
+        path = self.translate_path(self.path)
+        return path if os.path.isfile(path) else None
+    
+    def serve_static_asset(self):
+        """Serve a built-in, content-hashed asset with an immutable cache lifetime"""
+        name = urllib.parse.urlsplit(self.path).path[len(STATIC_URL_PREFIX):]
+        asset = STATIC_ASSETS.get(name)
+        if asset is None:
+            self.send_error(404, "Asset not found")
+            return
+        
+        data, content_type, variants = asset
+        etag = '"' + name.split('.')[1] + '"'
+        if etag_matches(self.headers.get('If-None-Match', ''), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+            self.end_headers()
+            return
+        
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        body = variants.get(encoding, data)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if body is not data:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+    
+    def handle_thumbnail(self):
+        """
+        /thumb/<path>?s=128|256: a JPEG preview of an image.
+
+        The listing adds v=<mtime> to the URL, so those responses are cached
+        for good; a changed photo is linked with a new v.
+        """
+        parts = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(parts.query)
+        relative_path = urllib.parse.unquote(parts.path[len('/thumb/'):])
+        full_path = self.resolve_safe_path(relative_path)
+        if full_path is None:
+            self.send_error(403, "Access denied")
+            return
+        try:
+            box = int(query.get('s', [str(THUMB_SIZES[0])])[0])
+        except ValueError:
+            box = 0
+        if box not in THUMB_SIZES:
+            self.send_error(400, f"Thumbnail size must be one of {', '.join(map(str, THUMB_SIZES))}")
+            return
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            self.send_error(404, f"File not found: {relative_path}")
+            return
+        if os.path.splitext(full_path)[1].lower() not in THUMB_EXTENSIONS:
+            self.send_error(415, "Not an image")
+            return
+        if not THUMBNAILS_AVAILABLE:
+            self.send_error(501, "Thumbnails need the Pillow module")
+            return
+        
+        etag = f'"thumb-{box}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+        cache_control = 'public, max-age=31536000, immutable' if 'v' in query else 'no-cache'
+        if etag_matches(self.headers.get('If-None-Match', ''), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            return
+        
+        thumb_path = thumbnail_service.get(full_path, st, box)
+        try:
+            f = open(thumb_path, 'rb') if thumb_path else None
+        except OSError:
+            f = None  # Evicted between lookup and open
+        if f is None:
+            self.send_error(415, "Unsupported or damaged image")
+            return
+        with f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.send_file_body(f, label=f"thumbnail of {os.path.basename(full_path)}")
+    
+    def handle_download(self):
+        """Handle file/folder download requests"""
+        try:
+            # Extract the path from /download/url/path?query
+            parts = urllib.parse.urlsplit(self.path)
+            download_path = urllib.parse.unquote(parts.path[10:])  # Remove '/download/' prefix
+            query = urllib.parse.parse_qs(parts.query)
+            
+            full_path = self.resolve_safe_path(download_path)
+            if full_path is None:
+                self.send_error(403, "Access denied")
+                return
+            
+            if not os.path.exists(full_path):
+                self.send_error(404, f"File or folder not found: {download_path}")
+                return
+            
+            if os.path.isfile(full_path):
+                # Download single file
+                self.download_file(full_path)
+            elif os.path.isdir(full_path):
+                # Download folder as zip (?mode=store sends an uncompressed archive of known size)
+                # or as tar with ?format=tar|tgz|tzst
+                archive_format = query.get('format', ['zip'])[0].lower()
+                if archive_format == 'zip':
+                    store = query.get('mode', [''])[0].lower() == 'store'
+                    self.download_folder_as_zip(full_path, store=store)
+                elif archive_format not in TAR_FORMATS:
+                    self.send_error(400, f"Unknown archive format: {archive_format}")
+                elif archive_format == 'tzst' and not ZSTD_AVAILABLE:
+                    self.send_error(501, "tar.zst downloads need the zstandard module")
+                else:
+                    self.download_folder_as_tar(full_path, archive_format)
+            else:
+                self.send_error(400, "Invalid download target")
+                
+        except Exception as e:
+            logger.log(f"Download error: {e}", "ERROR")
+            self.send_error(500, f"Download failed: {str(e)}")
+    
+    def _read_body(self, limit):
+        """The whole request body, or None after answering 411/413 for a missing or oversized one"""
+        try:
+            if int(self.headers.get('Content-Length', 0)) > limit:
+                self.send_error(413, "Request body too large")
+                return None
+        except ValueError:
+            pass
+        body = self._request_body()
+        if body is None:
+            return None
+        data = bytearray()
+        while True:
+            chunk = body.read(UPLOAD_CHUNK)
+            if not chunk:
+                return bytes(data)
+            data += chunk
+            if len(data) > limit:
+                self.send_error(413, "Request body too large")
+                return None
+    
+    def handle_download_batch(self):
+        """
+        POST /download-batch: one archive covering the selected files and folders.
+
+        Takes the listing page's form (path=...&path=...&format=zip) or JSON
+        {"paths": [...], "format": "zip|tar|tgz|tzst"}. Paths are relative to
+        the served root and pass the same checks as /download/.
+        """
+        body = self._read_body(BATCH_MAX_BODY)
+        if body is None:
+            return
+        
+        try:
+            content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type == 'application/json':
+                request = json.loads(body.decode('utf-8'))
+                paths = request.get('paths')
+                archive_format = str(request.get('format', 'zip')).lower()
+                if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+                    raise ValueError("paths must be a list of strings")
+            else:
+                form = urllib.parse.parse_qs(body.decode('utf-8'), keep_blank_values=True)
+                paths = form.get('path', [])
+                archive_format = form.get('format', ['zip'])[0].lower()
+        except (ValueError, AttributeError, UnicodeDecodeError) as e:
+            self.send_error(400, f"Malformed batch request: {e}")
+            return
+        
+        if not paths:
+            self.send_error(400, "No paths selected")
+            return
+        if len(paths) > BATCH_MAX_PATHS:
+            self.send_error(413, f"At most {BATCH_MAX_PATHS} items per batch")
+            return
+        if archive_format != 'zip' and archive_format not in TAR_FORMATS:
+            self.send_error(400, f"Unknown archive format: {archive_format}")
+            return
+        if archive_format == 'tzst' and not ZSTD_AVAILABLE:
+            self.send_error(501, "tar.zst downloads need the zstandard module")
+            return
+        
+        selection = []
+        for relative_path in paths:
+            full_path = self.resolve_safe_path(relative_path.lstrip('/'))
+            if full_path is None:
+                self.send_error(403, "Access denied")
+                return
+            if not os.path.exists(full_path):
+                self.send_error(404, f"File or folder not found: {relative_path}")
+                return
+            selection.append(full_path)
+        
+        entries = list(iter_selection_entries(selection))
+        item_count = len(set(selection))
+        if item_count == 1:
+            name = os.path.basename(selection[0]) or "download"
+        else:
+            name = f"selection-{item_count}-items"
+        logger.log(f"Batch download: {item_count} items, {len(entries)} files as {archive_format}", "INFO")
+        
+        if archive_format == 'zip':
+            self.send_zip_archive(entries, name)
+        else:
+            self.send_tar_archive(entries, name, archive_format)
+    
+    def resolve_safe_path(self, relative_path):
+        """Absolute path for a client-supplied relative path, or None if it may escape the served root"""
+        # Security check: ensure the path is relative and doesn't try to escape the base directory
+        if relative_path.startswith('/') or '..' in relative_path:
+            return None
+        
+        # Construct the full path
+        base_dir = os.path.abspath(os.getcwd())
+        full_path = os.path.abspath(os.path.join(base_dir, relative_path))
+        
+        # Additional security: ensure the resolved path is within base directory
+        if full_path != base_dir and not full_path.startswith(base_dir + os.sep):
+            return None
+        return full_path
+    
+    def download_file(self, file_path):
+        """Serve a file for download"""
+        self.serve_file(
+            file_path,
+            download_name=os.path.basename(file_path),
+            head_only=self.command == 'HEAD'
+        )
+    
+    def serve_file(self, file_path, download_name=None, head_only=False):
+        """Send a regular file, honouring conditional and Range requests"""
+        headers_sent = False
+        label = download_name or os.path.basename(file_path)
+        try:
+            # Validators come from a plain stat, so a 304 never opens the file
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                self.send_error(404, "File not found")
+                return
+            
+            etag = file_etag(st)
+            if self._not_modified(st, etag):
+                self._send_not_modified(st, etag)
+                return
+            
+            try:
+                f = open(file_path, 'rb')
+            except OSError:
+                self.send_error(404, "File not found")
+                return
+            
+            with f:
+                st = os.fstat(f.fileno())
+                etag = file_etag(st)
+                file_size = st.st_size
+                last_modified = self.date_time_string(st.st_mtime)
+                
+                if download_name:
+                    content_type = 'application/octet-stream'
+                else:
+                    content_type = self.guess_type(file_path)
+                
+                ranges = None
+                if self._if_range_matches(st, etag):
+                    ranges = parse_range_header(self.headers.get('Range'), file_size)
+                
+                if ranges == []:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{file_size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                
+                # Whole-body responses of text-like files may be sent compressed (ranges stay identity)
+                compressible = (
+                    COMPRESS_MIN_SIZE <= file_size <= COMPRESS_MAX_SIZE
+                    and is_compressible(file_path, self.guess_type(file_path))
+                )
+                encoding = None
+                if compressible and not ranges:
+                    encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+                compressed_file = None
+                if encoding:
+                    data, compressed_path = compression_cache.get_or_create(file_path, etag, encoding, f)
+                    if data is None:
+                        # Open before answering so a concurrent eviction cannot break the response
+                        compressed_file = open(compressed_path, 'rb')
+                
+                self.send_response(206 if ranges else 200)
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('ETag', 'W/' + etag if encoding else etag)
+                self.send_header('Last-Modified', last_modified)
+                if compressible:
+                    self.send_header('Vary', 'Accept-Encoding')
+                if download_name:
+                    self.send_header('Content-Disposition', f'attachment; filename="{download_name}"')
+                if not encoding:
+                    # Only digests computed earlier; a download never waits for hashing
+                    for header, value in content_hashes.digest_headers(st):
+                        self.send_header(header, value)
+                
+                if encoding:
+                    if compressed_file is not None:
+                        length = os.fstat(compressed_file.fileno()).st_size
+                    else:
+                        length = len(data)
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Encoding', encoding)
+                    self.send_header('Content-Length', str(length))
+                    self.end_headers()
+                    headers_sent = True
+                    if compressed_file is not None:
+                        with compressed_file:
+                            if not head_only:
+                                self.send_file_body(compressed_file, 0, length, label=f"{label} ({encoding})",
+                                                    always_log=bool(download_name))
+                    elif not head_only:
+                        self.wfile.write(data)
+                    
+                elif not ranges:
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Length', str(file_size))
+                    self.end_headers()
+                    headers_sent = True
+                    if not head_only:
+                        self.send_file_body(f, 0, file_size, label=label, always_log=bool(download_name))
+                    
+                elif len(ranges) == 1:
+                    start, end = ranges[0]
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
+                    self.send_header('Content-Length', str(end - start + 1))
+                    self.end_headers()
+                    headers_sent = True
+                    if not head_only:
+                        self.send_file_body(
+                            f, start, end - start + 1,
+                            label=f"{label} [bytes {start}-{end}/{file_size}]",
+                            always_log=bool(download_name)
+                        )
+                    
+                else:
+                    boundary = os.urandom(12).hex()
+                    part_headers = [
+                        (
+                            f"\r\n--{boundary}\r\n"
+                            f"Content-Type: {content_type}\r\n"
+                            f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+                        ).encode('latin-1')
+                        for start, end in ranges
+                    ]
+                    closing = f"\r\n--{boundary}--\r\n".encode('latin-1')
+                    body_length = sum(len(h) for h in part_headers) + len(closing)
+                    body_length += sum(end - start + 1 for start, end in ranges)
+                    
+                    self.send_header('Content-Type', f'multipart/byteranges; boundary={boundary}')
+                    self.send_header('Content-Length', str(body_length))
+                    self.end_headers()
+                    headers_sent = True
+                    if not head_only:
+                        for part_header, (start, end) in zip(part_headers, ranges):
+                            self.wfile.write(part_header)
+                            self.send_file_body(f, start, end - start + 1)
+                        self.wfile.write(closing)
+                        if download_name:
+                            logger.log(f"File downloaded: {label} ({len(ranges)} ranges)", "INFO")
+            
+        except Exception as e:
+            logger.log(f"File download error: {e}", "ERROR")
+            if headers_sent:
+                self.close_connection = True
+            else:
+                self.send_error(500, "File download failed")
+    
+    def _not_modified(self, st, etag):
+        """True when the client's cached copy is still current (If-None-Match wins over If-Modified-Since)"""
+        inm = self.headers.get('If-None-Match')
+        if inm is not None:
+            return etag_matches(inm, etag)
+        
+        ims = self.headers.get('If-Modified-Since')
+        if not ims:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(ims)
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+        if since is None:
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        return int(st.st_mtime) <= since.timestamp()
+    
+    def _send_not_modified(self, st, etag):
+        """Send a bodiless 304 carrying the current validators"""
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.date_time_string(st.st_mtime))
+        self.end_headers()
+    
+    def _if_range_matches(self, st, etag):
+        """True when there is no If-Range or its validator still matches the file"""
+        if_range = self.headers.get('If-Range')
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith(('"', 'W/')):
+            # Strong comparison: a weak ETag (e.g. of a compressed response) never matches
+            return if_range == etag
+        return if_range == self.date_time_string(st.st_mtime)
+    
+    def copyfile(self, source, outputfile):
+        """Send static GET bodies through the transfer engine"""
+        self.send_file_body(source, 0, None, label=os.path.basename(urllib.parse.urlsplit(self.path).path))
+    
+    def send_file_body(self, f, offset=0, count=None, label="", always_log=False):
+        """Transfer part of an open file to the client and report the achieved rate"""
+        start = time.perf_counter()
+        
+        def report(sent, method):
+            elapsed = time.perf_counter() - start
+            if always_log or sent >= TRANSFER_LOG_THRESHOLD:
+                rate = sent / elapsed if elapsed > 0 else 0
+                logger.log(
+                    f"File downloaded: {label} ({self._format_size(sent)} in {elapsed:.2f}s, "
+                    f"{self._format_size(rate)}/s via {method})",
+                    "INFO"
+                )
+        
+        sent = transfer_file(self.connection, self.wfile, f, offset, count, report)[0]
+        if count is not None and sent < count:
+            # The file shrank: the response is shorter than its Content-Length,
+            # so the client can only tell by the connection closing
+            logger.log(f"File ended after {sent} of {count} bytes; closing the connection", "WARNING")
+            self.close_connection = True
+        return sent
+    
+    def download_folder_as_zip(self, folder_path, store=False):
+        """Send a folder as a zip archive"""
+        self.send_zip_archive(list(iter_zip_entries(folder_path)), os.path.basename(folder_path), store)
+    
+    def send_zip_archive(self, entries, folder_name, store=False):
+        """
+        Send (file_path, arcname, stat) entries as <folder_name>.zip.
+
+        An unchanged set of files is served from archive_cache with sendfile.
+        Otherwise the first request builds the archive into the cache while
+        streaming it, and requests for the same archive meanwhile stream
+        that build as it is written. HEAD requests and archives too large
+        for the cache are streamed directly.
+        """
+        zip_filename = f"{folder_name}.zip"
+        headers_sent = False
+        chunked = None
+        cached = None
+        key = build = None
+        leader = False
+        
+        try:
+            compression = zipfile.ZIP_STORED if store else zipfile.ZIP_DEFLATED
+            zip_size = None
+            shared = None
+            if self.command != 'HEAD' and archive_cache.accepts(entries):
+                key = (archive_cache.fingerprint(entries), compression)
+                cached_path, build, leader = archive_cache.open(key)
+                if cached_path:
+                    cached = open(cached_path, 'rb')
+                    zip_size = os.fstat(cached.fileno()).st_size
+                elif not leader:
+                    try:
+                        shared = build.reader(idle=getattr(self.server, 'wait_idle', None))
+                    except OSError:
+                        # The finished build was rejected or evicted by the cache: stream it here
+                        archive_cache.release(key, build)
+                        build = None
+            if zip_size is None and store:
+                # STORE mode: sizes are known, so the exact archive length can be announced
+                zip_size = ZipStream(None, compression).planned_size(entries)
+            
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/zip')
+            self.send_header('Content-Disposition', f'attachment; filename="{zip_filename}"')
+            if zip_size is not None:
+                self.send_header('Content-Length', str(zip_size))
+            else:
+                chunked = self._stream_framing()
+            self.end_headers()
+            headers_sent = True
+            if self.command == 'HEAD':
+                return
+            
+            if cached:
+                self.send_file_body(cached, 0, zip_size, f"{zip_filename} (cached archive)", always_log=True)
+                return
+            
+            if shared:
+                out = chunked or self.wfile
+                sent = 0
+                for data in shared:
+                    out.write(data)
+                    sent += len(data)
+                if chunked:
+                    chunked.close()
+                logger.log(
+                    f"Folder downloaded as zip: {folder_name} "
+                    f"({len(entries)} files, {sent} bytes sent from shared build)",
+                    "INFO"
+                )
+                return
+            
+            if leader:
+                archive = archive_cache.write_build(key, build, entries, compression, chunked or self.wfile)
+                if chunked:
+                    chunked.close()
+                logger.log(
+                    f"Folder downloaded as zip: {folder_name} "
+                    f"({archive.count} files, {archive.offset} bytes sent and cached)",
+                    "INFO"
+                )
+                return
+            
+            out = BufferedSocketWriter(chunked or self.wfile)
+            archive = ZipStream(out, compression)
+            total = archive.add_files(entries)
+            file_count = archive.count
+            archive.close()
+            out.flush()
+            if chunked:
+                chunked.close()
+            
+            logger.log(
+                f"Folder downloaded as zip: {folder_name} "
+                f"({file_count} files, {self._format_size(total)} read, {archive.offset} bytes sent)",
+                "INFO"
+            )
+            
+        except Exception as e:
+            logger.log(f"Folder zip download error: {e}", "ERROR")
+            if headers_sent:
+                # Too late for an error page; drop the connection so the client sees a truncated body
+                self.close_connection = True
+            else:
+                self.send_error(500, "Folder download failed")
+        finally:
+            if cached:
+                cached.close()
+            if build is not None:
+                if leader and not build.done:
+                    archive_cache.abandon(key, build)
+                archive_cache.release(key, build)
+    
+    def download_folder_as_tar(self, folder_path, archive_format):
+        """Send a folder as tar, tar.gz or tar.zst"""
+        self.send_tar_archive(list(iter_zip_entries(folder_path)), os.path.basename(folder_path), archive_format)
+    
+    def send_tar_archive(self, entries, folder_name, archive_format):
+        """
+        Stream (file_path, arcname, stat) entries as a tar, tar.gz or tar.zst.
+
+        Plain tar has an exact size, so it is sent with Content-Length and a
+        strong ETag and honours single Range requests (resumable downloads);
+        file data then goes out through sendfile. Compressed variants are
+        chunked. Either way memory use stays at one buffer.
+        """
+        extension, content_type, compression = TAR_FORMATS[archive_format]
+        headers_sent = False
+        chunked = None
+        
+        try:
+            tar = TarStream(entries)
+            start, end = 0, None
+            
+            if compression:
+                self.send_response(200)
+            else:
+                size = tar.size()
+                etag = f'"tar-{archive_cache.fingerprint(entries)}"'
+                ranges = None
+                if_range = self.headers.get('If-Range')
+                if not if_range or if_range.strip() == etag:
+                    ranges = parse_range_header(self.headers.get('Range'), size)
+                if ranges == []:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if ranges and len(ranges) == 1:
+                    start, end = ranges[0]
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                else:
+                    # Multiple ranges over a generated archive are not worth it: send it whole
+                    end = size - 1
+                    self.send_response(200)
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(end - start + 1))
+            
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Disposition', f'attachment; filename="{folder_name}{extension}"')
+            if compression:
+                chunked = self._stream_framing()
+            self.end_headers()
+            headers_sent = True
+            if self.command == 'HEAD':
+                return
+            
+            if compression:
+                compressed = CompressingWriter(chunked or self.wfile, compression)
+                out = BufferedSocketWriter(compressed)
+                sent = tar.write(out)
+                out.flush()
+                compressed.close()
+                if chunked:
+                    chunked.close()
+            else:
+                out = BufferedSocketWriter(self.wfile)
+                
+                def copy_file(f, offset, count):
+                    out.flush()
+                    return transfer_file(self.connection, self.wfile, f, offset, count)[0]
+                
+                sent = tar.write(out, start, end, copy_file)
+                out.flush()
+            
+            logger.log(
+                f"Folder downloaded as {archive_format}: {folder_name} "
+                f"({len(entries)} files, {self._format_size(sent)} of tar data)",
+                "INFO"
+            )
+            
+        except Exception as e:
+            logger.log(f"Folder tar download error: {e}", "ERROR")
+            if headers_sent:
+                self.close_connection = True
+            else:
+                self.send_error(500, "Folder download failed")
+    
+    def _stream_framing(self):
+        """
+        Pick the framing for a body of unknown length; call before end_headers().
+
+        Returns a ChunkedWriter on HTTP/1.1, or None when the body will be
+        delimited by closing the connection (HTTP/1.0).
+        """
+        if self.request_version >= 'HTTP/1.1' and self.protocol_version >= 'HTTP/1.1':
+            self.send_header('Transfer-Encoding', 'chunked')
+            return ChunkedWriter(self.wfile)
+        self.close_connection = True
+        return None
+    
+    def _send_json(self, status, payload):
+        """Send a JSON document with an exact Content-Length"""
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        encoding = None
+        if len(body) >= COMPRESS_MIN_SIZE:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+            if encoding:
+                body = compress_bytes(body, encoding)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+    
+    def handle_api_status(self):
+        """
+        Report engine load (pool utilization, queue depth, ...) and cache counters.
+
+        In multi-process mode the answering worker is named under "process":
+        its server and cache counters are its own, while search_index,
+        folder_sizes and watcher come from the parent and cover all workers.
+        """
+        engine_stats = getattr(self.server, 'stats', None)
+        self._send_json(200, {
+            "version": APP_VERSION,
+            "process": {
+                "pid": os.getpid(),
+                "worker": self.worker_index,
+                "shared": ["search_index", "folder_sizes", "watcher"] if self.worker_index is not None else [],
+            },
+            "server": engine_stats() if engine_stats else {},
+            "listing_cache": listing_cache.stats(),
+            "compression_cache": compression_cache.stats(),
+            "archive_cache": archive_cache.stats(),
+            "search_index": search_index.stats(),
+            "folder_sizes": folder_sizes.stats(),
+            "content_hashes": content_hashes.stats(),
+            "delta_signatures": delta_signatures.stats(),
+            "watcher": file_watcher.stats(),
+            "thumbnails": thumbnail_service.stats(),
+        })
+    
+    def handle_api_search(self):
+        """
+        Filename search over the whole tree: /api/search?q=&path=&mode=substring|prefix&limit=
+
+        Answered from the in-memory SearchIndex; "ready" is false while the
+        first walk is still running and results may be incomplete.
+        """
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        
+        def param(name, default=''):
+            return query.get(name, [default])[0]
+        
+        text = param('q').strip()
+        mode = param('mode', 'substring')
+        base = param('path').strip('/')
+        try:
+            limit = min(max(int(param('limit', str(SEARCH_DEFAULT_LIMIT))), 1), SEARCH_MAX_LIMIT)
+        except ValueError:
+            self._send_json(400, {"error": "limit must be an integer"})
+            return
+        if not text or mode not in ('substring', 'prefix'):
+            self._send_json(400, {"error": "q is required and mode must be substring|prefix"})
+            return
+        if base and self.resolve_safe_path(base) is None:
+            self._send_json(403, {"error": "Access denied"})
+            return
+        
+        matches, truncated = search_index.search(text, base, limit, prefix=mode == 'prefix')
+        results = []
+        for folder, name in matches:
+            # Fresh metadata for the few hits; anything deleted since the last refresh drops out
+            try:
+                st = os.stat(os.path.join(search_index.root, folder, name))
+            except OSError:
+                continue
+            entry = ListingEntry(name, stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime)
+            results.append(listing_entry_json(folder, entry))
+        
+        self._send_json(200, {
+            "query": text,
+            "mode": mode,
+            "path": base,
+            "ready": search_index.ready,
+            "truncated": truncated,
+            "results": results,
+        })
+    
+    def handle_api_hash(self):
+        """
+        Content digest of a file: /api/hash/<path>?algo=sha256|blake2b|md5
+
+        Hashed on the ContentHashes pool the first time; later requests for
+        the same file version are answered from the digest cache ("cached").
+        """
+        parts = urllib.parse.urlsplit(self.path)
+        relative = urllib.parse.unquote(parts.path[len('/api/hash/'):], errors='surrogatepass')
+        algorithm = urllib.parse.parse_qs(parts.query).get('algo', ['sha256'])[0].lower()
+        if algorithm not in HASH_ALGORITHMS:
+            self._send_json(400, {"error": f"algo must be one of {'|'.join(HASH_ALGORITHMS)}"})
+            return
+        full_path = self.resolve_safe_path(relative)
+        if full_path is None:
+            self._send_json(403, {"error": "Access denied"})
+            return
+        if not os.path.isfile(full_path):
+            self._send_json(404, {"error": "File not found"})
+            return
+        
+        start = time.perf_counter()
+        try:
+            hexdigest, st, cached = content_hashes.get(full_path, algorithm)
+        except OSError as e:
+            logger.log(f"Could not hash {relative}: {e}", "ERROR")
+            self._send_json(500, {"error": "Could not read file"})
+            return
+        
+        self._send_json(200, {
+            "path": relative,
+            "algorithm": algorithm,
+            "digest": hexdigest,
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "cached": cached,
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+    
+    def _delta_target(self, prefix):
+        """(full path, stat, block size) for a delta endpoint, or None after answering an error"""
+        parts = urllib.parse.urlsplit(self.path)
+        relative = urllib.parse.unquote(parts.path[len(prefix):], errors='surrogatepass')
+        full_path = self.resolve_safe_path(relative)
+        if full_path is None:
+            self.send_error(403, "Access denied")
+            return None
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            self.send_error(404, f"File not found: {relative}")
+            return None
+        block = urllib.parse.parse_qs(parts.query).get('block', [''])[0]
+        try:
+            block = int(block) if block else delta_block_size(st.st_size)
+        except ValueError:
+            block = 0
+        if not valid_delta_block(block):
+            self.send_error(400, f"block must be a power of two from {DELTA_MIN_BLOCK} to {DELTA_MAX_BLOCK}")
+            return None
+        return full_path, st, block
+    
+    def handle_api_signature(self):
+        """
+        Block signature of a file for delta downloads: /api/signature/<path>?block=
+
+        The body is the binary format of write_signature(). The ETag is the
+        file's own, so the client can pass it to /api/blocks as If-Match and
+        be sure the blocks belong to the version it matched against.
+        """
+        target = self._delta_target('/api/signature/')
+        if target is None:
+            return
+        full_path, st, block = target
+        etag = file_etag(st)
+        if etag_matches(self.headers.get('If-None-Match', ''), etag):
+            self._send_not_modified(st, etag)
+            return
+        try:
+            signature_path = delta_signatures.get(full_path, st, block)
+            f = open(signature_path, 'rb') if signature_path else None
+        except OSError as e:
+            logger.log(f"Signature failed for {os.path.basename(full_path)}: {e}", "ERROR")
+            f = None
+        if f is None:
+            self.send_error(503, "Signature not available, try again")
+            return
+        with f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.send_header('ETag', etag)
+            self.send_header('X-Block-Size', str(block))
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.send_file_body(f, label=f"signature of {os.path.basename(full_path)}")
+    
+    def handle_api_blocks(self):
+        """
+        Selected blocks of a file: /api/blocks/<path>?block=&ranges=0-3,10
+
+        Ranges are inclusive block indices, in the query or (for long lists)
+        as a POST body. The blocks are sent back to back in the order asked
+        for. With If-Match, a file that changed since its signature answers 412.
+        """
+        target = self._delta_target('/api/blocks/')
+        if target is None:
+            return
+        full_path, st, block = target
+        if self.command == 'POST':
+            body = self._read_body(DELTA_MAX_REQUEST)
+            if body is None:
+                return
+            text = body.decode('ascii', errors='replace')
+        else:
+            text = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).get('ranges', [''])[0]
+        
+        try:
+            f = open(full_path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            etag = file_etag(st)
+            if_match = self.headers.get('If-Match')
+            if if_match is not None and not etag_matches(if_match, etag):
+                self.send_error(412, "File changed since its signature was fetched")
+                return
+            ranges = parse_block_ranges(text, -(-st.st_size // block))
+            if ranges is None:
+                self.send_error(400, "ranges must list block indices like 0-3,10 within the file")
+                return
+            
+            spans = [(first * block, min((last + 1) * block, st.st_size)) for first, last in ranges]
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(sum(end - start for start, end in spans)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            sent = 0
+            for start, end in spans:
+                sent += self.send_file_body(f, start, end - start)
+            logger.log(
+                f"Delta download: {os.path.basename(full_path)} ({self._format_size(sent)} of "
+                f"{self._format_size(st.st_size)} in {len(spans)} ranges)",
+                "INFO"
+            )
+    
+    def handle_api_sizes(self):
+        """
+        Recursive folder sizes: /api/sizes?path=
+
+        Returns the folder's own total and one for each subfolder; totals still
+        being counted are null and are moved to the front of the scan.
+        """
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        base = query.get('path', [''])[0].strip('/')
+        full_path = self.resolve_safe_path(base)
+        if full_path is None:
+            self._send_json(403, {"error": "Access denied"})
+            return
+        folder = folder_sizes.relative(full_path)
+        if folder is None:
+            self._send_json(503, {"error": "Folder sizes are not available"})
+            return
+        
+        children = folder_sizes.children(folder)
+        if children is None:
+            if not os.path.isdir(full_path):
+                self._send_json(404, {"error": "Folder not found"})
+                return
+            folder_sizes.prioritize([folder])
+            children = {}
+        pending = [f"{folder}/{name}" if folder else name for name, totals in children.items() if totals is None]
+        if pending:
+            folder_sizes.prioritize(pending)
+        
+        def totals_json(totals):
+            return {"size": totals[0], "files": totals[1]} if totals is not None else None
+        
+        totals = folder_sizes.get(folder)
+        self._send_json(200, {
+            "path": base,
+            "ready": totals is not None,
+            **(totals_json(totals) or {"size": None, "files": None}),
+            "children": {name: totals_json(child) for name, child in children.items()},
+        })
+    
+    def handle_api_list(self):
+        """
+        JSON listing API: /api/list?path=&offset=&limit=&sort=name|size|mtime&order=asc|desc
+
+        With format=ndjson (or Accept: application/x-ndjson) entries are streamed
+        one JSON object per line in directory order while the folder is scanned,
+        so neither side holds the whole listing; sorting is not applied there.
+        """
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            
+            def param(name, default=''):
+                return query.get(name, [default])[0]
+            
+            relative_path = param('path')
+            full_path = self.resolve_safe_path(relative_path)
+            if full_path is None:
+                self._send_json(403, {"error": "Access denied"})
+                return
+            if not os.path.isdir(full_path):
+                self._send_json(404, {"error": f"Folder not found: {relative_path}"})
+                return
+            
+            try:
+                offset = max(int(param('offset', '0')), 0)
+                limit = param('limit')
+                limit = min(max(int(limit), 0), API_LIST_MAX_LIMIT) if limit else None
+            except ValueError:
+                self._send_json(400, {"error": "offset and limit must be integers"})
+                return
+            
+            sort = param('sort', 'name')
+            order = param('order', 'asc').lower()
+            if sort not in API_LIST_SORT_KEYS or order not in ('asc', 'desc'):
+                self._send_json(400, {"error": "sort must be name|size|mtime and order asc|desc"})
+                return
+            
+            ndjson = (param('format') == 'ndjson'
+                      or 'application/x-ndjson' in self.headers.get('Accept', ''))
+            base = relative_path.strip('/')
+            if ndjson:
+                self._stream_listing_ndjson(full_path, base, offset, limit)
+                return
+            
+            entries = list(iter_directory(full_path))
+            entries.sort(key=API_LIST_SORT_KEYS[sort], reverse=order == 'desc')
+            if limit is None:
+                limit = API_LIST_DEFAULT_LIMIT
+            page = entries[offset:offset + limit]
+            
+            self._send_json(200, {
+                "path": base,
+                "total": len(entries),
+                "offset": offset,
+                "limit": limit,
+                "sort": sort,
+                "order": order,
+                "entries": [listing_entry_json(base, e) for e in page],
+            })
+            
+        except Exception as e:
+            logger.log(f"Listing API error: {e}", "ERROR")
+            self._send_json(500, {"error": "Listing failed"})
+    
+    def _stream_listing_ndjson(self, full_path, base, offset, limit):
+        """Stream directory entries as NDJSON while scanning"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        chunked = self._stream_framing()
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        
+        out = BufferedSocketWriter(chunked or self.wfile, API_LIST_STREAM_BUFFER)
+        sent = 0
+        try:
+            for index, entry in enumerate(iter_directory(full_path)):
+                if index < offset:
+                    continue
+                if limit is not None and sent >= limit:
+                    break
+                line = json.dumps(listing_entry_json(base, entry), ensure_ascii=False)
+                out.write(line.encode('utf-8') + b"\n")
+                sent += 1
+            out.flush()
+            if chunked:
+                chunked.close()
+        except Exception as e:
+            logger.log(f"Listing stream error: {e}", "ERROR")
+            self.close_connection = True
+    
+    def list_directory(self, path):
+        """Generate modern directory listing with download buttons"""
+        try:
+            dir_stat = os.stat(path)
+        except OSError:
+            self.send_error(404, "Cannot read directory")
+            return None
+        
+        # Revalidation is answered from the directory's own stat, before any scan
+        etag = listing_etag(dir_stat, folder_sizes.generation(folder_sizes.relative(path)), self.allow_uploads)
+        if self._not_modified(dir_stat, etag):
+            self._send_not_modified(dir_stat, etag)
+            return None
+        
+        displaypath = urllib.parse.unquote(self.path, errors='surrogatepass')
+        cache_key = (path, displaypath, self.allow_uploads)
+        cached = listing_cache.get(cache_key, etag)
+        if cached is None:
+            try:
+                entries = scan_directory(path)
+            except OSError:
+                self.send_error(404, "Cannot read directory")
+                return None
+            
+            try:
+                html = self._generate_html(path, entries, displaypath)
+                cached = listing_cache.put(cache_key, etag, html.encode('utf-8', errors='surrogatepass'))
+            except Exception as e:
+                logger.log(f"Directory listing error: {e}", "ERROR")
+                self.send_error(500, "Internal server error")
+                return None
+        
+        body, variants = cached
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        if encoding in variants:
+            body = variants[encoding]
+        else:
+            encoding = None
+        
+        self.send_response(200)
+        self.send_header("Content-type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", self.date_time_string(dir_stat.st_mtime))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        return None
+    
+    def _generate_html(self, path, entries, displaypath):
+        """
+        Generate modern HTML interface with download buttons.
+
+        File and folder names are client-controlled (uploads), so every name,
+        path and URL is escaped here at render time.
+        """
+        breadcrumb = self._generate_breadcrumb(displaypath)
+        file_items = self._generate_file_list(path, entries)
+        upload_form = """<form class="upload-box" method="post" enctype="multipart/form-data" onsubmit="return uploadFiles(this)">
+            <input type="file" name="file" multiple required>
+            <button type="submit" class="download-btn upload">⬆️ Upload</button>
+            <span id="uploadStatus"></span>
+        </form>""" if self.allow_uploads else ""
+        
+        return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>PyServer - {html.escape(displaypath)}</title>
+    <link rel="stylesheet" href="{STATIC_ASSET_URLS['listing.css']}">
+    <script src="{STATIC_ASSET_URLS['listing.js']}" defer></script>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>📁 PyServer</h1>
+            <p>{html.escape(displaypath)}</p>
+        </div>
+        <div class="breadcrumb">
+            <a href="/">🏠 Home</a>
+            {breadcrumb}
+        </div>
+        <div class="search-box">
+            <input type="text" id="search" placeholder="🔍 Search files..." onkeyup="filterFiles()">
+            <div id="searchResults" class="search-results"></div>
+        </div>
+        {upload_form}
+        <form id="batchForm" method="post" action="/download-batch">
+            <div class="batch-bar">
+                <label><input type="checkbox" id="selectAll" onchange="toggleAll(this.checked)"> Select all</label>
+                <span id="selectedCount">0 selected</span>
+                <select name="format" title="Archive format">
+                    <option value="zip">ZIP</option>
+                    <option value="tar">TAR</option>
+                    <option value="tgz">TAR.GZ</option>
+                </select>
+                <button type="submit" id="batchDownload" class="download-btn" disabled>⬇️ Download selected</button>
+            </div>
+            <div class="file-list" id="fileList">
+                {file_items}
+            </div>
+        </form>
+    </div>
+</body>
+</html>"""
+    
+    def _generate_breadcrumb(self, path):
+        """Generate breadcrumb navigation"""
+        parts = [p for p in path.split('/') if p]
+        breadcrumb = ""
+        current = ""
+        
+        for part in parts:
+            current += f"/{part}"
+            href = html.escape(urllib.parse.quote(current), quote=True)
+            breadcrumb += f' <span>/</span> <a href="{href}">{html.escape(part)}</a>'
+        
+        return breadcrumb
+    
+    def _generate_file_list(self, path, entries):
+        """Generate file list HTML with download buttons from scan_directory() entries"""
+        items = []
+        
+        # Download links are relative to the served root; resolve the prefix once per listing
+        relative_dir = os.path.relpath(path, os.getcwd())
+        if relative_dir == os.curdir:
+            download_prefix = "/download/"
+            select_prefix = ""
+        else:
+            select_prefix = relative_dir.replace(os.sep, '/') + "/"
+            download_prefix = f"/download/{urllib.parse.quote(select_prefix)}"
+        
+        thumb_prefix = "/thumb/" + urllib.parse.quote(select_prefix)
+        
+        # Recursive folder sizes come from the background FolderSizes scan; never computed here
+        sizes_base = folder_sizes.relative(path)
+        sizes_children = folder_sizes.children(sizes_base) if sizes_base is not None else None
+        sizes_pending = []
+        
+        for entry in entries:
+            name = entry.name
+            displayname = linkname = name
+            mtime = datetime.datetime.fromtimestamp(entry.mtime).strftime('%Y-%m-%d %H:%M')
+            download_url = html.escape(download_prefix + urllib.parse.quote(name), quote=True)
+            
+            if entry.is_dir:
+                icon = "📁"
+                displayname += "/"
+                linkname += "/"
+                size_str = "-"
+                # Folders the scan does not enter (symlinks) stay "-"
+                if sizes_base is not None and (sizes_children is None or name in sizes_children):
+                    sizes_key = f"{sizes_base}/{name}" if sizes_base else name
+                    totals = sizes_children.get(name) if sizes_children is not None else None
+                    if totals is not None:
+                        size_str = f"{self._format_size(totals[0])} • {totals[1]:,} files"
+                    else:
+                        size_str = f'<span class="calculating" data-name="{html.escape(name, quote=True)}">calculating…</span>'
+                        sizes_pending.append(sizes_key)
+                download_btn = f'<a href="{download_url}" class="download-btn zip" title="Download as ZIP">📦 ZIP</a>'
+            else:
+                icon = self._get_file_icon(name)
+                if THUMBNAILS_AVAILABLE and os.path.splitext(name)[1].lower() in THUMB_EXTENSIONS:
+                    # Native lazy loading: only rows scrolled into view fetch their thumbnail
+                    thumb_url = html.escape(
+                        f"{thumb_prefix}{urllib.parse.quote(name)}?s={THUMB_SIZES[0]}&v={int(entry.mtime)}-{entry.size}",
+                        quote=True)
+                    icon = (f'<img class="thumb" src="{thumb_url}" loading="lazy" decoding="async" '
+                            f'width="48" height="48" alt="" onerror="this.replaceWith(\'{icon}\')">')
+                size_str = self._format_size(entry.size)
+                download_btn = f'<a href="{download_url}" class="download-btn" title="Download file">⬇️ Download</a>'
+            
+            select_value = html.escape(select_prefix + name, quote=True)
+            items.append(f"""
+                <div class="file-item">
+                    <input type="checkbox" class="select-item" name="path" value="{select_value}" onchange="updateSelection()">
+                    <div class="file-icon">{icon}</div>
+                    <div class="file-info">
+                        <a href="{html.escape(urllib.parse.quote(linkname), quote=True)}" class="file-name">{html.escape(displayname)}</a>
+                        <div class="file-meta">{size_str} • {mtime}</div>
+                    </div>
+                    <div class="file-actions">
+                        {download_btn}
+                    </div>
+                </div>
+                """)
+        
+        if sizes_pending:
+            folder_sizes.prioritize(sizes_pending)
+        
+        return "".join(items) if items else '<p style="text-align:center;padding:40px;color:#6B7280;">No files found</p>'
+        
+    def _get_file_icon(self, filename):
+        """Get emoji icon for file type"""
+        ext = os.path.splitext(filename)[1].lower()
+        
+        icons = {
+            '.txt': '📄', '.pdf': '📕', '.doc': '📘', '.docx': '📘',
+            '.jpg': '🖼️', '.jpeg': '🖼️', '.png': '🖼️', '.gif': '🖼️',
+            '.mp3': '🎵', '.mp4': '🎬', '.avi': '🎬',
+            '.zip': '📦', '.rar': '📦', '.7z': '📦',
+            '.py': '🐍', '.js': '📜', '.html': '🌐', '.css': '🎨',
+        }
+        
+        return icons.get(ext, '📄')
+    
+    def _format_size(self, size):
+        """Format file size"""
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if size < 1024.0:
+                return f"{size:.1f} {unit}"
+            size /= 1024.0
+        return f"{size:.1f} TB"
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Threaded HTTP server for handling multiple connections"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.active_threads = 0
+        self._active_lock = threading.Lock()
+
+    def process_request_thread(self, request, client_address):
+        """Count the connection's thread while it runs (daemon threads are not tracked in _threads)"""
+        with self._active_lock:
+            self.active_threads += 1
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self._active_lock:
+                self.active_threads -= 1
+
+    def stats(self):
+        """Number of live handler threads"""
+        return {"engine": "threaded", "active_threads": self.active_threads}
+
+
+# ============================================================================
+# ASYNCIO SERVER ENGINE
+# ============================================================================
+
+import asyncio
+import select
+
+ASYNC_WORKERS = 8             # Requests doing disk or CPU work at once (stat, scandir, reads, compression)
+ASYNC_THREADS = 64            # Threads for request handlers; one that is only waiting holds no worker slot
+ASYNC_BACKLOG = 512
+ASYNC_HEAD_LIMIT = 128 * 1024  # Request head bytes read by the event loop before the handler takes over
+ASYNC_SEND_HIGH_WATER = 1024 * 1024  # Queued response bytes that pause the handler writing them
+ASYNC_SEND_LOW_WATER = 256 * 1024    # ... until the event loop has sent them down to this
+ASYNC_SENDFILE_CHUNK = 8 * 1024 * 1024
+
+
+class _AsyncConnection:
+    """
+    Per-connection state shared by the event loop and the handler thread:
+    bytes received but not yet parsed, and the queue of response pieces the
+    loop sends (with the count of queued bytes for flow control).
+    """
+
+    __slots__ = ("sock", "address", "handler", "inbuf", "outbox", "queued", "cond", "failed")
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.handler = None
+        self.inbuf = bytearray()
+        self.outbox = None        # asyncio.Queue, created on the loop
+        self.queued = 0
+        self.cond = threading.Condition()
+        self.failed = None        # Send error; later writes raise it
+
+    def has_head(self):
+        return b"\r\n\r\n" in self.inbuf or b"\n\n" in self.inbuf
+
+
+class _AsyncRequestReader:
+    """
+    The handler's rfile: parses from the bytes the event loop already read,
+    and reads request bodies from the non-blocking socket in the handler
+    thread, giving up its worker slot while it waits for the client.
+    """
+
+    def __init__(self, server, conn, timeout):
+        self.server = server
+        self.conn = conn
+        self.timeout = timeout
+        self.closed = False
+
+    def _fill(self):
+        """Receive more bytes into inbuf; False at EOF"""
+        sock = self.conn.sock
+        while True:
+            try:
+                data = sock.recv(UPLOAD_CHUNK)
+            except (BlockingIOError, InterruptedError):
+                self.server.wait_idle(lambda: select.select([sock], [], [], self.timeout)[0], "the request body")
+                continue
+            if data:
+                self.conn.inbuf += data
+            return bool(data)
+
+    def readline(self, limit=-1):
+        buf = self.conn.inbuf
+        while True:
+            end = buf.find(b"\n") + 1
+            if end or (0 <= limit <= len(buf)) or not self._fill():
+                break
+        if not end:
+            end = len(buf)
+        if 0 <= limit < end:
+            end = limit
+        line = bytes(buf[:end])
+        del buf[:end]
+        return line
+
+    def read(self, size=-1):
+        buf = self.conn.inbuf
+        while (size < 0 or len(buf) < size) and self._fill():
+            pass
+        if size < 0:
+            size = len(buf)
+        data = bytes(buf[:size])
+        del buf[:size]
+        return data
+
+    def peek(self, size=1):
+        return bytes(self.conn.inbuf)
+
+    def close(self):
+        self.closed = True
+
+
+class _AsyncResponseWriter:
+    """
+    The handler's wfile: queues bytes and file ranges for the event loop to
+    send. A handler that runs more than ASYNC_SEND_HIGH_WATER ahead of its
+    client waits, without its worker slot, until the loop catches up.
+    """
+
+    def __init__(self, server, conn):
+        self.server = server
+        self.conn = conn
+        self.closed = False
+
+    def _post(self, item):
+        conn = self.conn
+        if conn.failed is not None:
+            raise conn.failed
+        self.server._loop.call_soon_threadsafe(conn.outbox.put_nowait, item)
+
+    def write(self, data):
+        if not data:
+            return 0
+        data = bytes(data)
+        conn = self.conn
+        with conn.cond:
+            conn.queued += len(data)
+        self._post(data)
+        with conn.cond:
+            backlog = conn.queued > ASYNC_SEND_HIGH_WATER
+        if backlog:
+            def drained():
+                with conn.cond:
+                    while conn.queued > ASYNC_SEND_LOW_WATER and conn.failed is None:
+                        if not conn.cond.wait(self.server.send_timeout):
+                            return False
+                    return True
+            self.server.wait_idle(drained, "the client to read")
+            if conn.failed is not None:
+                raise conn.failed
+        return len(data)
+
+    def queue_file(self, f, offset, count, done=None):
+        """
+        Have the loop send count bytes of f from offset (sendfile where
+        available); done(sent) is called on the loop afterwards. Returns count.
+        """
+        if not count:
+            if done is not None:
+                done(0)
+            return 0
+        if self.conn.failed is not None:
+            raise self.conn.failed
+        fd = os.dup(f.fileno())
+        try:
+            self._post((fd, offset, count, done))
+        except BaseException:
+            os.close(fd)
+            raise
+        return count
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncHTTPServer:
+    """
+    asyncio-based alternative to ThreadedHTTPServer.
+
+    The event loop thread owns the sockets: it accepts connections, waits
+    for requests on idle (keep-alive) sockets, reads each request head, and
+    sends every response byte with non-blocking sends, file bodies with
+    non-blocking sendfile. The regular EnhancedHTTPHandler then runs in a
+    thread, so every route behaves exactly as in the threaded engine, but
+    its rfile and wfile only hand bytes to and from the loop: a handler
+    thread is busy while it stats, lists, reads or compresses, and a file
+    download is finished by the loop after the handler returns. At most
+    ASYNC_WORKERS handlers do such work at once; one waiting for a slow
+    client (a streamed archive it runs ahead of, or an upload body) gives up
+    its worker slot. Idle connections are closed after KEEPALIVE_IDLE_TIMEOUT,
+    the timeout every engine advertises in its Keep-Alive header. Exposes
+    the serve_forever / shutdown / server_close interface ServerManager expects.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, server_address, RequestHandlerClass,
+                 workers=ASYNC_WORKERS, idle_timeout=KEEPALIVE_IDLE_TIMEOUT):
+        self.RequestHandlerClass = RequestHandlerClass
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self.send_timeout = RequestHandlerClass.timeout or idle_timeout
+        self.server_address = server_address
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.server_bind()
+            self.socket.listen(ASYNC_BACKLOG)
+            self.socket.setblocking(False)
+        except OSError:
+            self.socket.close()
+            raise
+        self.executor = ThreadPoolExecutor(max_workers=ASYNC_THREADS, thread_name_prefix="pyserver-io")
+        self.active_connections = 0
+        self.busy_workers = 0
+        self.waiting = 0
+        self._slots = threading.Semaphore(workers)
+        self._count_lock = threading.Lock()
+        self._loop = None
+        self._stop = None
+        self._started = threading.Event()
+        self._stopped = threading.Event()
+
+    # --------------------------------------------------------
+    # Lifecycle (socketserver-compatible)
+    # --------------------------------------------------------
+    def server_bind(self):
+        """Bind the listening socket (same hook as socketserver.TCPServer)"""
+        if self.allow_reuse_address:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.server_address)
+        self.server_address = self.socket.getsockname()
+
+    def serve_forever(self):
+        """Run the event loop until shutdown() is called"""
+        # Parking sockets needs add_reader(), which Windows' default ProactorEventLoop lacks
+        self._loop = asyncio.SelectorEventLoop()
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+            self._stopped.set()
+
+    def shutdown(self):
+        """Stop serve_forever() and wait for it to return"""
+        if not self._started.wait(timeout=5):
+            return
+        if not self._stopped.is_set():
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._stopped.wait(timeout=5)
+
+    def server_close(self):
+        """Release the listening socket and handler threads"""
+        self.socket.close()
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        """Open connections, worker slots in use and handlers waiting without one"""
+        return {
+            "engine": "asyncio",
+            "active_connections": self.active_connections,
+            "workers": self.workers,
+            "busy_workers": self.busy_workers,
+            "waiting": self.waiting,
+        }
+
+    # --------------------------------------------------------
+    # Event loop side
+    # --------------------------------------------------------
+    async def _main(self):
+        self._stop = asyncio.Event()
+        tasks = set()
+        accept_task = asyncio.ensure_future(self._accept_loop(tasks))
+        self._started.set()
+        await self._stop.wait()
+        accept_task.cancel()
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(accept_task, *tasks, return_exceptions=True)
+
+    async def _accept_loop(self, tasks):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                sock, address = await loop.sock_accept(self.socket)
+            except asyncio.CancelledError:
+                raise
+            except OSError as e:
+                logger.log(f"Accept failed: {e}", "ERROR")
+                await asyncio.sleep(0.1)
+                continue
+            sock.setblocking(False)
+            task = asyncio.ensure_future(self._serve_connection(_AsyncConnection(sock, address)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def _wait_ready(self, sock, timeout, writable=False):
+        """Wait without a thread until the socket is readable (or writable); False on timeout"""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = sock.fileno()
+        add, remove = (loop.add_writer, loop.remove_writer) if writable else (loop.add_reader, loop.remove_reader)
+        add(fd, lambda: ready.done() or ready.set_result(True))
+        try:
+            await asyncio.wait_for(ready, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            remove(fd)
+
+    async def _read_head(self, conn):
+        """Receive until conn.inbuf holds a whole request head; False on EOF or idle timeout"""
+        timeout = self.idle_timeout
+        while not conn.has_head() and len(conn.inbuf) < ASYNC_HEAD_LIMIT:
+            if not await self._wait_ready(conn.sock, timeout):
+                return False
+            try:
+                data = conn.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                continue
+            if not data:
+                return False
+            conn.inbuf += data
+            # Once a request has begun, the rest of its head gets the handler's timeout
+            timeout = self.send_timeout
+        return True
+
+    async def _send(self, conn, data):
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[conn.sock.send(view):]
+            except (BlockingIOError, InterruptedError):
+                if not await self._wait_ready(conn.sock, self.send_timeout, writable=True):
+                    raise socket.timeout("Client stopped reading")
+
+    async def _sendfile(self, conn, fd, offset, count):
+        """Send count bytes of fd from offset; returns the bytes sent (fewer if the file shrank)"""
+        loop = asyncio.get_running_loop()
+        sent = 0
+        while sent < count:
+            want = min(ASYNC_SENDFILE_CHUNK, count - sent)
+            if SENDFILE_AVAILABLE:
+                try:
+                    n = os.sendfile(conn.sock.fileno(), fd, offset + sent, want)
+                except (BlockingIOError, InterruptedError):
+                    if not await self._wait_ready(conn.sock, self.send_timeout, writable=True):
+                        raise socket.timeout("Client stopped reading")
+                    continue
+            else:
+                # Without sendfile the disk read happens off the loop
+                data = await loop.run_in_executor(None, _pread, fd, min(want, TRANSFER_CHUNK), offset + sent)
+                await self._send(conn, data)
+                n = len(data)
+            if not n:
+                break
+            sent += n
+        return sent
+
+    async def _pump(self, conn):
+        """Send what the handler queues until it finishes; returns its keep-alive verdict"""
+        while True:
+            item = await conn.outbox.get()
+            if isinstance(item, bool):
+                return item and conn.failed is None
+            if isinstance(item, bytes):
+                try:
+                    if conn.failed is None:
+                        await self._send(conn, item)
+                except OSError as e:
+                    conn.failed = e
+                with conn.cond:
+                    conn.queued -= len(item)
+                    conn.cond.notify_all()
+                continue
+            fd, offset, count, done = item
+            sent = 0
+            try:
+                if conn.failed is None:
+                    sent = await self._sendfile(conn, fd, offset, count)
+                    if sent != count:
+                        # The file shrank: the response is shorter than its Content-Length
+                        logger.log(f"File ended after {sent} of {count} bytes; closing the connection", "WARNING")
+                        conn.failed = IOError("File shrank while it was being sent")
+            except OSError as e:
+                conn.failed = e
+            finally:
+                os.close(fd)
+            if done is not None:
+                done(sent)
+
+    async def _serve_connection(self, conn):
+        loop = asyncio.get_running_loop()
+        conn.outbox = asyncio.Queue()
+        self.active_connections += 1
+        try:
+            while await self._read_head(conn):
+                loop.run_in_executor(self.executor, self._process, conn)
+                if not await self._pump(conn):
+                    break
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.log(f"Connection error from {conn.address[0]}: {e}", "ERROR")
+        finally:
+            self.active_connections -= 1
+            with conn.cond:
+                if conn.failed is None:
+                    conn.failed = ConnectionAbortedError("Connection closed")
+                conn.cond.notify_all()
+            while not conn.outbox.empty():
+                item = conn.outbox.get_nowait()
+                if isinstance(item, tuple):
+                    os.close(item[0])
+            self._close(conn)
+
+    # --------------------------------------------------------
+    # Handler thread side
+    # --------------------------------------------------------
+    def _count(self, name, delta):
+        with self._count_lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def wait_idle(self, wait, what):
+        """
+        Run wait() without holding a worker slot, then take one back: for
+        handlers waiting on their client, or on another request's work.
+        wait() returns False when it gives up, raising socket.timeout.
+        """
+        self._slots.release()
+        self._count("busy_workers", -1)
+        self._count("waiting", 1)
+        try:
+            ready = wait()
+        finally:
+            self._count("waiting", -1)
+            self._slots.acquire()
+            self._count("busy_workers", 1)
+        if not ready:
+            raise socket.timeout(f"Timed out waiting for {what}")
+
+    def _process(self, conn):
+        """Answer the request whose head is in conn.inbuf; posts the keep-alive verdict to the loop"""
+        keep_alive = False
+        self._slots.acquire()
+        self._count("busy_workers", 1)
+        try:
+            handler = conn.handler
+            if handler is None:
+                # Build the handler without BaseRequestHandler.__init__, which would
+                # run a blocking per-connection loop instead of a single request
+                handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+                handler.request = conn.sock
+                handler.client_address = conn.address
+                handler.server = self
+                handler.directory = os.getcwd()
+                handler.setup()
+                conn.sock.setblocking(False)  # setup() applied the handler's blocking timeout
+                handler.rfile.close()
+                handler.wfile.close()
+                handler.rfile = _AsyncRequestReader(self, conn, handler.timeout)
+                handler.wfile = _AsyncResponseWriter(self, conn)
+                conn.handler = handler
+            handler.handle_one_request()
+            keep_alive = not handler.close_connection
+        except Exception as e:
+            logger.log(f"Request error from {conn.address[0]}: {e}", "ERROR")
+        finally:
+            self._count("busy_workers", -1)
+            self._slots.release()
+            try:
+                self._loop.call_soon_threadsafe(conn.outbox.put_nowait, keep_alive)
+            except RuntimeError:
+                pass  # The loop is already closed
+
+    def _close(self, conn):
+        if conn.handler is not None:
+            try:
+                conn.handler.finish()
+            except Exception:
+                pass
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+
+
+def _pread(fd, size, offset):
+    """os.pread, or a seek and read where it is missing (Windows)"""
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+# ============================================================================
+# WORKER POOL SERVER ENGINE
+# ============================================================================
+
+import queue
+import selectors
+
+POOL_MAX_WORKERS = 16     # Upper bound on concurrently handled connections
+POOL_QUEUE_SIZE = 64      # Accepted connections allowed to wait for a worker
+POOL_RETRY_AFTER = 2      # Seconds suggested to clients turned away with 503
+
+_BUSY_BODY = b"Server busy, please retry shortly.\n"
+_BUSY_RESPONSE = (
+    b"HTTP/1.0 503 Service Unavailable\r\n"
+    b"Retry-After: %d\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"Content-Length: %d\r\n"
+    b"Connection: close\r\n\r\n%s"
+) % (POOL_RETRY_AFTER, len(_BUSY_BODY), _BUSY_BODY)
+
+
+class _PooledConnection:
+    """Per-connection state: the socket, its request handler and its idle deadline"""
+
+    __slots__ = ("sock", "address", "handler", "deadline")
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.handler = None
+        self.deadline = 0.0
+
+
+class PooledHTTPServer(http.server.HTTPServer):
+    """
+    HTTP server with a fixed worker pool and a bounded accept queue.
+
+    Accepted connections wait in a queue of POOL_QUEUE_SIZE for one of
+    POOL_MAX_WORKERS threads. When the queue is full the accept thread answers
+    503 with Retry-After itself and closes the socket, so load beyond the
+    configured capacity is shed instead of spawning more threads.
+
+    Connections enter the queue only once a request has arrived: new and
+    keep-alive sockets wait in a selector watched by one idle thread, so
+    clients between requests hold no worker. A worker answers the requests
+    a connection has sent and parks it again; parked connections are closed
+    after KEEPALIVE_IDLE_TIMEOUT.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128  # Listen backlog; admission control happens after accept()
+
+    def __init__(self, server_address, RequestHandlerClass,
+                 max_workers=POOL_MAX_WORKERS, queue_size=POOL_QUEUE_SIZE):
+        super().__init__(server_address, RequestHandlerClass)
+        self.max_workers = max_workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closing = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.busy_workers = 0
+        self.served = 0
+        self.rejected = 0
+        self._selector = selectors.DefaultSelector()
+        self._parked = {}   # socket -> _PooledConnection
+        self._parked_lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"pyserver-worker-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        self._workers.append(threading.Thread(target=self._idle_loop, name="pyserver-idle", daemon=True))
+        for worker in self._workers:
+            worker.start()
+
+    def process_request(self, request, client_address):
+        """Wait for the connection's first request; it is queued for a worker once it arrives"""
+        self._park(_PooledConnection(request, client_address))
+
+    def _enqueue(self, conn):
+        """Queue the connection for a worker, or shed it with 503 when saturated"""
+        try:
+            self._queue.put_nowait(conn)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            self._reject(conn.sock)
+
+    def _reject(self, request):
+        try:
+            # Drain what the client already sent so closing does not reset the connection
+            request.setblocking(False)
+            try:
+                request.recv(65536)
+            except OSError:
+                pass
+            request.settimeout(1.0)
+            request.sendall(_BUSY_RESPONSE)
+            request.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        finally:
+            request.close()
+
+    def _worker(self):
+        while not self._closing.is_set():
+            try:
+                conn = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._stats_lock:
+                self.busy_workers += 1
+            keep_alive = False
+            try:
+                keep_alive = self._process(conn)
+            except Exception:
+                self.handle_error(conn.sock, conn.address)
+            finally:
+                with self._stats_lock:
+                    self.busy_workers -= 1
+                    self.served += 1
+            if keep_alive and not self._closing.is_set():
+                self._park(conn)
+            else:
+                self._close(conn)
+
+    def _process(self, conn):
+        """Answer every request already received on conn. Returns True to keep it open."""
+        sock = conn.sock
+        handler = conn.handler
+        timeout = self.RequestHandlerClass.timeout
+        sock.settimeout(timeout)
+        if handler is None:
+            # Build the handler without BaseRequestHandler.__init__, which would
+            # keep this worker in a blocking per-connection loop between requests
+            handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+            handler.request = sock
+            handler.client_address = conn.address
+            handler.server = self
+            handler.directory = os.getcwd()
+            handler.setup()
+            conn.handler = handler
+        while True:
+            handler.handle_one_request()
+            if handler.close_connection:
+                return False
+            # A pipelined request may already be buffered; otherwise go back to idling
+            sock.setblocking(False)
+            try:
+                pending = handler.rfile.peek(1)
+            except OSError:
+                pending = b""
+            if not pending:
+                return True
+            sock.settimeout(timeout)
+
+    def _park(self, conn):
+        """Wait for the next request on conn without holding a worker"""
+        conn.deadline = time.monotonic() + KEEPALIVE_IDLE_TIMEOUT
+        with self._parked_lock:
+            if self._closing.is_set():
+                self._close(conn)
+                return
+            self._parked[conn.sock] = conn
+            self._selector.register(conn.sock, selectors.EVENT_READ, conn)
+        try:
+            self._wakeup_w.send(b"\0")
+        except OSError:
+            pass  # The wakeup buffer is full, so the idle thread is about to run anyway
+
+    def _idle_loop(self):
+        while not self._closing.is_set():
+            try:
+                events = self._selector.select(timeout=1.0)
+            except (OSError, ValueError):
+                break  # Selector closed by server_close()
+            ready = []
+            with self._parked_lock:
+                for key, _ in events:
+                    if key.data is None:
+                        try:
+                            while self._wakeup_r.recv(4096):
+                                pass
+                        except OSError:
+                            pass
+                        continue
+                    self._selector.unregister(key.fileobj)
+                    ready.append(self._parked.pop(key.fileobj))
+                now = time.monotonic()
+                expired = [conn for conn in self._parked.values() if conn.deadline <= now]
+                for conn in expired:
+                    self._selector.unregister(conn.sock)
+                    del self._parked[conn.sock]
+            for conn in ready:
+                self._enqueue(conn)
+            for conn in expired:
+                self._close(conn)
+
+    def _close(self, conn):
+        if conn.handler is not None:
+            try:
+                conn.handler.finish()
+            except Exception:
+                pass
+        self.shutdown_request(conn.sock)
+
+    def server_close(self):
+        """Stop the workers and close every queued or idle connection"""
+        super().server_close()
+        self._closing.set()
+        while True:
+            try:
+                conn = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+        with self._parked_lock:
+            parked = list(self._parked.values())
+            self._parked.clear()
+            self._selector.close()
+        for conn in parked:
+            self._close(conn)
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def stats(self):
+        """Pool utilization and queue depth"""
+        with self._stats_lock:
+            return {
+                "engine": "pooled",
+                "workers": self.max_workers,
+                "busy_workers": self.busy_workers,
+                "utilization": self.busy_workers / self.max_workers,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "idle_connections": len(self._parked),
+                "served": self.served,
+                "rejected": self.rejected,
+            }
+
+
+SERVER_ENGINES = {
+    "threaded": ThreadedHTTPServer,
+    "asyncio": AsyncHTTPServer,
+    "pooled": PooledHTTPServer,
+}
+
+
+# ============================================================================
+# FILESYSTEM WATCHER
+# ============================================================================
+
+import ctypes
+
+WATCH_QUEUE_MAX = 8192          # Pending change events; overflowing means "assume everything changed"
+WATCH_COALESCE_DELAY = 0.25     # Seconds a burst of events is gathered before it is published
+WATCH_POLL_INTERVAL = 5         # Seconds between passes of the polling backend
+WATCH_RATE_WINDOW = 10          # Seconds averaged for the events-per-second figure
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+_IN_ISDIR = 0x40000000
+_IN_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+                  | _IN_CREATE | _IN_DELETE | _IN_ONLYDIR | _IN_DONT_FOLLOW)
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+_libc = None
+
+
+def _load_inotify():
+    """libc with the inotify calls, or OSError where there is none"""
+    global _libc
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.ENOSYS, "inotify needs Linux")
+    if _libc is not None:
+        return _libc
+    # The process's own symbols include libc; find_library() would spawn ldconfig
+    libc = ctypes.CDLL(None, use_errno=True)
+    try:
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except AttributeError:
+        raise OSError(errno.ENOSYS, "libc has no inotify")
+    _libc = libc
+    return libc
+
+
+class _InotifyBackend:
+    """One inotify watch per folder; new folders are watched as they appear"""
+
+    name = "inotify"
+
+    def __init__(self, root, emit):
+        self.root = root
+        self.emit = emit
+        self._libc = _load_inotify()
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1: {os.strerror(err)}")
+        self._paths = {}   # watch descriptor -> relative folder
+        self._wds = {}     # relative folder -> watch descriptor
+        self._limit_logged = False
+
+    @property
+    def watched(self):
+        return len(self._wds)
+
+    def watch(self, folder):
+        """Watch one relative folder; False if it vanished, OSError at the watch limit"""
+        path = os.path.join(self.root, folder) if folder else self.root
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _IN_WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached (fs.inotify.max_user_watches)")
+            return False
+        self._paths[wd] = folder
+        self._wds[folder] = wd
+        return True
+
+    def seen(self, folder, mtime_ns):
+        pass  # Only the polling backend needs to know what the startup walk read
+
+    def _add_tree(self, relative):
+        pending = [relative]
+        while pending:
+            folder = pending.pop()
+            path = os.path.join(self.root, folder) if folder else self.root
+            if is_app_cache(path):
+                continue  # Our own cache writes would invalidate things endlessly
+            try:
+                if not self.watch(folder):
+                    continue  # Vanished or unreadable folders are simply skipped
+            except OSError:
+                if not self._limit_logged:
+                    self._limit_logged = True
+                    logger.log("inotify watch limit reached; new folders are not watched", "WARNING")
+                continue
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(f"{folder}/{entry.name}" if folder else entry.name)
+            except OSError:
+                pass
+
+    def _remove_tree(self, relative):
+        prefix = relative + "/"
+        for folder in [f for f in self._wds if f == relative or f.startswith(prefix)]:
+            wd = self._wds.pop(folder)
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def run(self, stop):
+        while not stop.is_set():
+            readable, _, _ = select.select([self.fd], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                name = data[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + length].rstrip(b"\0")
+                offset += _INOTIFY_EVENT.size + length
+                if mask & _IN_Q_OVERFLOW:
+                    self.emit(None)
+                    continue
+                folder = self._paths.get(wd)
+                if folder is None:
+                    continue
+                if mask & _IN_IGNORED:
+                    # The folder is gone; its parent reports the removal
+                    self._paths.pop(wd, None)
+                    if self._wds.get(folder) == wd:
+                        del self._wds[folder]
+                    continue
+                if not name:
+                    continue  # Events about the watched folder itself
+                if mask & _IN_ISDIR:
+                    child = f"{folder}/{os.fsdecode(name)}" if folder else os.fsdecode(name)
+                    if mask & (_IN_DELETE | _IN_MOVED_FROM):
+                        self._remove_tree(child)
+                    elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                        self._add_tree(child)
+                        self.emit(child)
+                elif is_upload_temp(os.fsdecode(name)):
+                    continue  # The finished upload's rename is reported under its real name
+                self.emit(folder)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PollingBackend:
+    """
+    Folder mtime polling where inotify is unavailable. It sees entries being
+    added, removed or renamed, not files changing in place.
+    """
+
+    name = "polling"
+
+    def __init__(self, root, emit, interval=WATCH_POLL_INTERVAL):
+        self.root = root
+        self.emit = emit
+        self.interval = interval
+        self._mtimes = {}   # relative folder -> st_mtime_ns, filled by the startup walk
+
+    @property
+    def watched(self):
+        return len(self._mtimes)
+
+    def watch(self, folder):
+        return True  # Folders are polled from the mtime seen() records
+
+    def seen(self, folder, mtime_ns):
+        self._mtimes[folder] = mtime_ns
+
+    def _scan(self, relative, recursive=True):
+        """
+        Record the mtime of relative, and of every subfolder below it (or, if
+        not recursive, of the subfolders not seen before). Returns the folders read.
+        """
+        found = []
+        pending = [relative]
+        while pending:
+            folder = pending.pop()
+            path = os.path.join(self.root, folder) if folder else self.root
+            try:
+                self._mtimes[folder] = os.stat(path).st_mtime_ns
+                with os.scandir(path) as it:
+                    for entry in it:
+                        child = f"{folder}/{entry.name}" if folder else entry.name
+                        if (entry.is_dir(follow_symlinks=False) and not is_app_cache(entry.path)
+                                and (recursive or child not in self._mtimes)):
+                            pending.append(child)
+            except OSError:
+                continue
+            found.append(folder)
+        return found
+
+    def run(self, stop):
+        while not stop.wait(self.interval):
+            for folder, mtime_ns in list(self._mtimes.items()):
+                if stop.is_set():
+                    return
+                if folder not in self._mtimes:
+                    continue  # Dropped with a removed parent during this pass
+                path = os.path.join(self.root, folder) if folder else self.root
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    prefix = folder + "/"
+                    for gone in [f for f in self._mtimes if f == folder or f.startswith(prefix)]:
+                        del self._mtimes[gone]
+                    continue
+                if st.st_mtime_ns != mtime_ns:
+                    for changed in self._scan(folder, recursive=False):
+                        self.emit(changed)
+
+    def close(self):
+        pass
+
+
+class FileWatcher:
+    """
+    Reports which folders below the served root changed.
+
+    A backend thread (inotify, or mtime polling where inotify is missing or
+    its watch limit is too low) feeds a bounded queue that holds each
+    folder at most once until it is dispatched, so a burst of events in one
+    folder costs one slot. A dispatcher thread gathers each burst for
+    WATCH_COALESCE_DELAY and calls every subscriber once with the set of
+    changed relative folders. When events were lost
+    (queue or kernel overflow) subscribers get None: assume anything changed.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.backend = None
+        self.events = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.dropped = 0
+        self.overflows = 0
+        self._subscribers = []
+        self._queue = queue.Queue(WATCH_QUEUE_MAX)
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._overflowed = False
+        self._samples = deque()   # (time, events) for the rate figure
+        self._stop = threading.Event()
+        self._threads = []
+        self._seed = ()
+
+    @property
+    def running(self):
+        return bool(self._threads)
+
+    def subscribe(self, callback):
+        """callback(folders) with a set of relative folder paths, or None"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def start(self, root, seed=()):
+        """
+        Watch root. Its startup walk reads every folder once and hands each
+        read to the seed listeners (objects with seed(folder, info) and
+        seeded(), like SearchIndex and FolderSizes), so they need no walk of
+        their own.
+        """
+        self.stop()
+        self.root = os.path.abspath(root)
+        self._seed = tuple(seed)
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run_backend, name="watcher", daemon=True),
+            threading.Thread(target=self._dispatch, name="watcher-dispatch", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        self.backend = None
+
+    def _run_backend(self):
+        # Watching a large tree starts with a full walk, so do it off the caller's thread
+        try:
+            backend = _InotifyBackend(self.root, self._emit)
+        except OSError as e:
+            logger.log(f"inotify unavailable ({e}); polling for changes every {WATCH_POLL_INTERVAL}s", "WARNING")
+            backend = _PollingBackend(self.root, self._emit)
+        self.backend = backend
+        try:
+            backend = self.backend = self._walk(backend)
+            if not self._stop.is_set():
+                logger.log(f"Watching {backend.watched} folders for changes ({backend.name})", "INFO")
+            backend.run(self._stop)
+        except Exception as e:
+            logger.log(f"File watcher stopped: {e}", "ERROR")
+        finally:
+            self.backend.close()
+
+    def _walk(self, backend):
+        """
+        The startup walk: watch each folder, then read it once and pass the
+        read on to the seed listeners. Falls back to polling when inotify
+        runs out of watches. Returns the backend to run.
+        """
+        read = {}   # relative folder -> mtime_ns, for a switch to polling half-way
+        pending = [""]
+        while pending and not self._stop.is_set():
+            folder = pending.pop()
+            try:
+                if not backend.watch(folder):
+                    continue  # Vanished or unreadable folders are simply skipped
+            except OSError as e:
+                logger.log(f"{e}; polling for changes every {WATCH_POLL_INTERVAL}s", "WARNING")
+                backend.close()
+                backend = self.backend = _PollingBackend(self.root, self._emit)
+                for known, mtime_ns in read.items():
+                    backend.seen(known, mtime_ns)
+            info = read_folder(os.path.join(self.root, folder) if folder else self.root)
+            if info is None:
+                continue
+            read[folder] = info.mtime_ns
+            backend.seen(folder, info.mtime_ns)
+            for listener in self._seed:
+                listener.seed(folder, info)
+            pending.extend(f"{folder}/{name}" if folder else name for name in info.subdirs)
+        if not self._stop.is_set():
+            for listener in self._seed:
+                listener.seeded()
+        return backend
+
+    def _emit(self, folder):
+        self.events += 1
+        with self._queued_lock:
+            if folder in self._queued:
+                self.coalesced += 1
+                return
+            try:
+                self._queue.put_nowait(folder)
+            except queue.Full:
+                self.dropped += 1
+                self._overflowed = True
+                return
+            self._queued.add(folder)
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # Let the rest of the burst arrive, then publish it as one batch
+            self._stop.wait(WATCH_COALESCE_DELAY)
+            folders = {first}
+            with self._queued_lock:
+                while True:
+                    try:
+                        folders.add(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._queued.clear()
+            if self._overflowed or None in folders:
+                self._overflowed = False
+                self.overflows += 1
+                folders = None
+            self.batches += 1
+            now = time.monotonic()
+            self._samples.append((now, self.events))
+            while self._samples[0][0] < now - WATCH_RATE_WINDOW:
+                self._samples.popleft()
+            for callback in self._subscribers:
+                try:
+                    callback(folders)
+                except Exception as e:
+                    logger.log(f"Change subscriber failed: {e}", "ERROR")
+
+    def stats(self):
+        now = time.monotonic()
+        recent = [(t, n) for t, n in list(self._samples) if t >= now - WATCH_RATE_WINDOW]
+        rate = 0.0
+        if recent:
+            rate = (self.events - recent[0][1]) / max(now - recent[0][0], 1.0)
+        backend = self.backend
+        return {
+            "backend": backend.name if backend else None,
+            "watched_folders": backend.watched if backend else 0,
+            "events": self.events,
+            "events_per_second": round(rate, 1),
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "overflows": self.overflows,
+        }
+
+
+file_watcher = FileWatcher()
+
+
+# ============================================================================
+# BACKGROUND SERVICES
+# ============================================================================
+
+def drop_cached_folders(root, folders):
+    """Drop this process's cached listings and archives for changed relative folders (None: all)"""
+    if folders is None:
+        listing_cache.invalidate()
+        return
+    for relative in folders:
+        path = os.path.join(root, relative) if relative else root
+        listing_cache.invalidate_folder(path)
+        archive_cache.invalidate_folder(path)
+
+
+def _invalidate_changed(folders):
+    """FileWatcher subscriber: drop what is cached about the changed folders"""
+    drop_cached_folders(file_watcher.root, folders)
+    if folders is None:
+        search_index.refresh_soon()
+        folder_sizes.invalidate(None)
+        return
+    for relative in folders:
+        search_index.invalidate(relative)
+        folder_sizes.invalidate(relative)
+
+
+file_watcher.subscribe(_invalidate_changed)
+
+_upload_sweep_stop = threading.Event()
+
+
+def _sweep_upload_sessions(stop):
+    """Discard abandoned resumable uploads every UPLOAD_SESSION_SWEEP seconds"""
+    while not stop.wait(UPLOAD_SESSION_SWEEP):
+        try:
+            UploadSession.expire()
+        except Exception as e:
+            logger.log(f"Upload session cleanup failed: {e}", "ERROR")
+
+
+def start_background_services(directory):
+    """
+    Start the helpers that serve requests from memory (search index, ...).
+    They run once per server: worker processes reach them through the parent.
+    """
+    global _upload_sweep_stop
+    # One walk of the tree, by the watcher, seeds the index and the sizes
+    search_index.start(directory, periodic=False, seeded=True)  # Kept current by _invalidate_changed
+    folder_sizes.start(directory, seeded=True)
+    file_watcher.start(directory, seed=(search_index, folder_sizes))
+    _upload_sweep_stop = threading.Event()
+    threading.Thread(target=_sweep_upload_sessions, args=(_upload_sweep_stop,),
+                     name="upload-sweep", daemon=True).start()
+
+
+def stop_background_services():
+    _upload_sweep_stop.set()
+    file_watcher.stop()
+    search_index.stop()
+    folder_sizes.stop()
+    thumbnail_service.shutdown()
+    content_hashes.shutdown()
+
+
+# ============================================================================
+# MULTI-PROCESS WORKER MODE
+# ============================================================================
+
+import signal
+
+MULTIPROCESS_AVAILABLE = hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT") and not ANDROID
+WORKER_STARTUP_TIMEOUT = 10   # Seconds every worker has to bind the port and report ready
+WORKER_STATS_INTERVAL = 1.0   # Seconds between request-count reports from each worker
+WORKER_SHUTDOWN_TIMEOUT = 5   # Seconds workers get to exit before they are killed
+# Background services the parent runs once for all workers, and what workers may call on them
+WORKER_SHARED_SERVICES = {
+    "search_index": ("search", "stats", "ready"),
+    "folder_sizes": ("get", "generation", "children", "prioritize", "stats"),
+    "file_watcher": ("stats",),
+}
+
+
+class ReusePortMixin:
+    """Set SO_REUSEPORT before binding so several processes can listen on one port"""
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def _counting_handler(handler_class):
+    """Subclass handler_class so every parsed request bumps a per-process counter"""
+    lock = threading.Lock()
+
+    class CountingHandler(handler_class):
+        requests_served = 0
+
+        def parse_request(self):
+            ok = super().parse_request()
+            if ok:
+                with lock:
+                    CountingHandler.requests_served += 1
+            return ok
+
+    return CountingHandler
+
+
+class _WorkerChannel:
+    """Worker end of the message pipe: one JSON object per line"""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self._lock = threading.Lock()
+
+    def send(self, kind, **fields):
+        fields["type"] = kind
+        data = (json.dumps(fields) + "\n").encode("utf-8")
+        with self._lock:
+            try:
+                while data:
+                    data = data[os.write(self.fd, data):]
+            except OSError:
+                pass  # Parent is gone; the control pipe reports EOF and we exit
+
+
+class _SharedServices:
+    """Worker end of the service socket: one JSON call at a time, answered by the parent"""
+
+    def __init__(self, sock):
+        self._file = sock.makefile("rwb")
+        self._lock = threading.Lock()
+
+    def call(self, service, method, *args, **kwargs):
+        request = (json.dumps([service, method, args, kwargs]) + "\n").encode("utf-8")
+        with self._lock:
+            self._file.write(request)
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise OSError("The server process closed the service socket")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(f"{service}.{method}: {reply['error']}")
+        return reply["result"]
+
+
+class _RemoteService:
+    """Worker-side stand-in for one of the parent's services; results arrive as JSON (tuples become lists)"""
+
+    def __init__(self, shared, name, root):
+        self._shared = shared
+        self._name = name
+        self.root = root
+
+    def __getattr__(self, attr):
+        if attr not in WORKER_SHARED_SERVICES[self._name]:
+            raise AttributeError(attr)
+        return lambda *args, **kwargs: self._shared.call(self._name, attr, *args, **kwargs)
 
 
-# --------------------------------------------------------
-# Global instance (singleton)
-# --------------------------------------------------------
-logger = Logger(app_name="PyServer")
+class _RemoteSearchIndex(_RemoteService):
+    @property
+    def ready(self):
+        return self._shared.call(self._name, "ready")
 
 
-# ============================================================================
-# ENHANCED HTTP REQUEST HANDLER
-# ============================================================================
+class _RemoteFolderSizes(_RemoteService):
+    relative = FolderSizes.relative   # Only needs the root, so it is answered locally
 
-import zipfile
-import tempfile
-import shutil
 
-class EnhancedHTTPHandler(http.server.SimpleHTTPRequestHandler):
-    """HTTP handler with modern UI, file management, and download functionality"""
-    
-    server_version = f"PyServer/{APP_VERSION}"
-    
-    def log_message(self, format, *args):
-        """Override to use our logger"""
-        message = f"{self.address_string()} - {format % args}"
-        logger.log(message, "INFO")
-    
-    def log_error(self, format, *args):
-        """Override error logging"""
-        message = f"{self.address_string()} - {format % args}"
-        logger.log(message, "ERROR")
-    
-    def end_headers(self):
-        """Add CORS and security headers"""
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', '*')
-        self.send_header('X-Content-Type-Options', 'nosniff')
-        super().end_headers()
-    
-    def do_OPTIONS(self):
-        """Handle preflight requests"""
-        self.send_response(200)
-        self.end_headers()
-    
-    def do_GET(self):
-        """Handle GET requests including download endpoints"""
-        # Check if this is a download request
-        if self.path.startswith('/download/'):
-            self.handle_download()
-        else:
-            super().do_GET()
-    
-    def handle_download(self):
-        """Handle file/folder download requests"""
-        try:
-            # Extract the path from /download/url/path
-            download_path = self.path[10:]  # Remove '/download/' prefix
-            download_path = urllib.parse.unquote(download_path)
-            
-            # Security check: ensure the path is relative and doesn't try to escape the base directory
-            if download_path.startswith('/') or '..' in download_path:
-                self.send_error(403, "Access denied")
-                return
-            
-            # Construct the full path
-            full_path = os.path.abspath(os.path.join(os.getcwd(), download_path))
-            base_dir = os.path.abspath(os.getcwd())
-            
-            # Additional security: ensure the resolved path is within base directory
-            if not full_path.startswith(base_dir):
-                self.send_error(403, "Access denied")
-                return
-            
-            if not os.path.exists(full_path):
-                self.send_error(404, f"File or folder not found: {download_path}")
+def _serve_worker_services(sock):
+    """Parent side of one worker's service socket: answer its calls until it closes"""
+    with sock, sock.makefile("rwb") as f:
+        for line in f:
+            try:
+                service, method, args, kwargs = json.loads(line)
+                if method not in WORKER_SHARED_SERVICES.get(service, ()):
+                    raise AttributeError(f"{service}.{method} is not shared with workers")
+                value = getattr(globals()[service], method)
+                reply = {"result": value(*args, **kwargs) if callable(value) else value}
+            except Exception as e:
+                reply = {"error": str(e)}
+            try:
+                f.write((json.dumps(reply) + "\n").encode("utf-8"))
+                f.flush()
+            except OSError:
                 return
-            
-            if os.path.isfile(full_path):
-                # Download single file
-                self.download_file(full_path)
-            elif os.path.isdir(full_path):
-                # Download folder as zip
-                self.download_folder_as_zip(full_path)
-            else:
-                self.send_error(400, "Invalid download target")
-                
-        except Exception as e:
-            logger.log(f"Download error: {e}", "ERROR")
-            self.send_error(500, f"Download failed: {str(e)}")
-    
-    def download_file(self, file_path):
-        """Serve a file for download"""
-        try:
-            file_size = os.path.getsize(file_path)
-            file_name = os.path.basename(file_path)
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/octet-stream')
-            self.send_header('Content-Disposition', f'attachment; filename="{file_name}"')
-            self.send_header('Content-Length', str(file_size))
-            self.end_headers()
-            
-            with open(file_path, 'rb') as f:
-                shutil.copyfileobj(f, self.wfile)
-                
-            logger.log(f"File downloaded: {file_name}", "INFO")
-            
-        except Exception as e:
-            logger.log(f"File download error: {e}", "ERROR")
-            self.send_error(500, "File download failed")
-    
-    def download_folder_as_zip(self, folder_path):
-        """Compress and download a folder as zip"""
+
+
+def _run_worker(address, engine_class, handler_class, ctrl_fd, msg_fd, service_sock, index):
+    """Body of a forked worker process. Returns its exit code."""
+    global search_index, folder_sizes, file_watcher
+    # The parent may have used these before forking (a server restarted with
+    # processes=N); a fork copies their state but none of their threads
+    forget_zip_worker_pools()
+    content_hashes.after_fork()
+    thumbnail_service.after_fork()
+    archive_cache.after_fork()
+    channel = _WorkerChannel(msg_fd)
+    logger.forward_to(lambda message, level: channel.send("log", message=message, level=level))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is handled by the parent
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    handler = _counting_handler(handler_class)
+    server_class = type(f"ReusePort{engine_class.__name__}", (ReusePortMixin, engine_class), {})
+    try:
+        server = server_class(address, handler)
+    except Exception as e:
+        channel.send("error", message=str(e))
+        return 1
+
+    # The parent runs the watcher, search index and folder sizes once for every worker
+    root = os.getcwd()
+    shared = _SharedServices(service_sock)
+    search_index = _RemoteSearchIndex(shared, "search_index", root)
+    folder_sizes = _RemoteFolderSizes(shared, "folder_sizes", root)
+    file_watcher = _RemoteService(shared, "file_watcher", root)
+    handler.worker_index = index
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    channel.send("ready", pid=os.getpid())
+
+    def report():
         try:
-            folder_name = os.path.basename(folder_path)
-            zip_filename = f"{folder_name}.zip"
-            
-            # Create temporary zip file
-            temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-            temp_zip.close()
-            
-            # Create zip file
-            with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(folder_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        # Create relative path for zip
-                        arcname = os.path.relpath(file_path, os.path.dirname(folder_path))
-                        zipf.write(file_path, arcname)
-            
-            # Get zip file size
-            zip_size = os.path.getsize(temp_zip.name)
-            
-            # Send zip file
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/zip')
-            self.send_header('Content-Disposition', f'attachment; filename="{zip_filename}"')
-            self.send_header('Content-Length', str(zip_size))
-            self.end_headers()
-            
-            with open(temp_zip.name, 'rb') as f:
-                shutil.copyfileobj(f, self.wfile)
-            
-            # Clean up temporary file
-            os.unlink(temp_zip.name)
-            
-            logger.log(f"Folder downloaded as zip: {folder_name}", "INFO")
-            
-        except Exception as e:
-            logger.log(f"Folder zip download error: {e}", "ERROR")
-            # Clean up temporary file if it exists
-            if 'temp_zip' in locals():
-                try:
-                    os.unlink(temp_zip.name)
-                except:
-                    pass
-            self.send_error(500, "Folder download failed")
-    
-    def list_directory(self, path):
-        """Generate modern directory listing with download buttons"""
+            server_stats = server.stats()
+        except Exception:
+            server_stats = {}
+        channel.send("stats", requests=handler.requests_served, server=server_stats,
+                     listing_cache=listing_cache.stats())
+
+    # The parent writes one JSON line per batch of changed folders to the
+    # control pipe; end of file means it was closed, either by shutdown() or
+    # because the parent exited.
+    buffer = b""
+    while True:
+        readable, _, _ = select.select([ctrl_fd], [], [], WORKER_STATS_INTERVAL)
+        if not readable:
+            report()
+            continue
+        data = os.read(ctrl_fd, 65536)
+        if not data:
+            break
+        *lines, buffer = (buffer + data).split(b"\n")
+        for line in lines:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = {"type": "changed", "folders": None}  # Torn by a full pipe: drop everything
+            if message.get("type") == "changed":
+                drop_cached_folders(root, message["folders"])
+
+    server.shutdown()
+    server.server_close()
+    thumbnail_service.shutdown()
+    content_hashes.shutdown()
+    thread.join(timeout=WORKER_SHUTDOWN_TIMEOUT)
+    report()
+    return 0
+
+
+class _WorkerProcess:
+    """Parent-side bookkeeping for one forked worker"""
+
+    __slots__ = ("index", "pid", "ctrl_fd", "msg_fd", "service_sock", "buffer", "ready", "error",
+                 "exit_code", "requests", "server_stats", "cache_stats")
+
+    def __init__(self, index, pid, ctrl_fd, msg_fd, service_sock):
+        self.index = index
+        self.pid = pid
+        self.ctrl_fd = ctrl_fd
+        self.msg_fd = msg_fd
+        self.service_sock = service_sock
+        self.buffer = b""
+        self.ready = False
+        self.error = None
+        self.exit_code = None
+        self.requests = 0
+        self.server_stats = {}
+        self.cache_stats = {}
+
+
+class MultiProcessServer:
+    """
+    Runs several forked copies of a server engine on one port.
+
+    Every worker binds its own SO_REUSEPORT socket, so the kernel spreads
+    connections across processes and listing rendering and ZIP compression
+    are no longer limited to one core by the GIL. Workers forward their log
+    lines and request counters over a pipe; the parent re-logs them as
+    "[worker N] ..." and reports per-worker counts from stats(). Closing a
+    worker's control pipe (shutdown, or the parent dying) makes it stop.
+
+    Background services (file watcher, search index, folder sizes) run
+    once, in the parent: workers call them over a per-worker service
+    socket, and the parent forwards every batch of changed folders down the
+    control pipes so each worker can drop its own cached listings and
+    archives.
+    Exposes the serve_forever / shutdown / server_close interface
+    ServerManager expects.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, server_address, RequestHandlerClass,
+                 engine=DEFAULT_ENGINE, processes=2):
+        self.server_address = server_address
+        self.engine = engine
+        self.workers = []
+        self._selector = selectors.DefaultSelector()
+        self._serving = threading.Event()
+        self._stopping = threading.Event()
+        self._stopped = threading.Event()
+        self._ctrl_lock = threading.Lock()
         try:
-            file_list = os.listdir(path)
-        except OSError:
-            self.send_error(404, "Cannot read directory")
-            return None
-        
-        file_list.sort(key=lambda a: (not os.path.isdir(os.path.join(path, a)), a.lower()))
-        displaypath = urllib.parse.unquote(self.path, errors='surrogatepass')
-        
+            for index in range(processes):
+                self._spawn(index, SERVER_ENGINES[engine], RequestHandlerClass)
+            self._wait_ready()
+            file_watcher.subscribe(self._forward_changes)
+        except BaseException:
+            self._stopping.set()
+            self._close_control()
+            self._drain()
+            self.server_close()
+            raise
+
+    # --------------------------------------------------------
+    # Startup
+    # --------------------------------------------------------
+    def _spawn(self, index, engine_class, handler_class):
+        ctrl_read, ctrl_write = os.pipe()
+        msg_read, msg_write = os.pipe()
+        service_parent, service_child = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                # Drop the parent's ends, including those of earlier workers,
+                # so every control pipe has exactly one writer: the parent
+                os.close(ctrl_write)
+                os.close(msg_read)
+                service_parent.close()
+                for worker in self.workers:
+                    os.close(worker.ctrl_fd)
+                    os.close(worker.msg_fd)
+                    worker.service_sock.close()
+                code = _run_worker(self.server_address, engine_class, handler_class,
+                                   ctrl_read, msg_write, service_child, index)
+            finally:
+                os._exit(code)
+
+        os.close(ctrl_read)
+        os.close(msg_write)
+        os.set_blocking(ctrl_write, False)  # A stuck worker must not stall the file watcher
+        service_child.close()
+        worker = _WorkerProcess(index, pid, ctrl_write, msg_read, service_parent)
+        self.workers.append(worker)
+        self._selector.register(msg_read, selectors.EVENT_READ, worker)
+        threading.Thread(target=_serve_worker_services, args=(service_parent,),
+                         name=f"worker-{index}-services", daemon=True).start()
+
+    def _wait_ready(self):
+        """Block until every worker is listening; raise OSError if one failed to bind"""
+        deadline = time.monotonic() + WORKER_STARTUP_TIMEOUT
+        while not all(worker.ready for worker in self.workers):
+            failed = [w for w in self.workers if w.error or w.msg_fd is None]
+            if failed:
+                raise OSError(failed[0].error or f"Worker {failed[0].index} exited during startup")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise OSError("Timed out waiting for worker processes to start")
+            self._pump(min(remaining, 0.5))
+
+    # --------------------------------------------------------
+    # Lifecycle (socketserver-compatible)
+    # --------------------------------------------------------
+    def serve_forever(self):
+        """Relay worker logs and counters until shutdown() is called"""
+        self._serving.set()
         try:
-            self.send_response(200)
-            self.send_header("Content-type", "text/html; charset=utf-8")
-            self.end_headers()
-            
-            html = self._generate_html(path, file_list, displaypath)
-            self.wfile.write(html.encode('utf-8', errors='surrogatepass'))
-        except Exception as e:
-            logger.log(f"Directory listing error: {e}", "ERROR")
-            self.send_error(500, "Internal server error")
-    
-    def _generate_html(self, path, file_list, displaypath):
-        """Generate modern HTML interface with download buttons"""
-        breadcrumb = self._generate_breadcrumb(displaypath)
-        file_items = self._generate_file_list(path, file_list)
-        
-        return f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>PyServer - {displaypath}</title>
-<style>
-    * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-    body {{
-        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        min-height: 100vh;
-        padding: 20px;
-    }}
-    .container {{
-        max-width: 1200px;
-        margin: 0 auto;
-        background: white;
-        border-radius: 16px;
-        box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-        overflow: hidden;
-    }}
-    .header {{
-        background: linear-gradient(135deg, #6366F1 0%, #4F46E5 100%);
-        color: white;
-        padding: 30px;
-        text-align: center;
-    }}
-    .header h1 {{ font-size: 2em; font-weight: 600; }}
-    .breadcrumb {{
-        background: #F9FAFB;
-        padding: 15px 30px;
-        border-bottom: 1px solid #E5E7EB;
-        display: flex;
-        align-items: center;
-        flex-wrap: wrap;
-        word-break: break-word;
-    }}
-    .breadcrumb a {{
-        color: #6366F1;
-        text-decoration: none;
-        margin: 0 5px;
-    }}
-    .breadcrumb a:hover {{ text-decoration: underline; }}
-    .file-list {{ padding: 20px; }}
-
-    .file-item {{
-        display: flex;
-        align-items: flex-start;
-        justify-content: space-between;
-        gap: 10px;
-        padding: 15px;
-        border-bottom: 1px solid #E5E7EB;
-        transition: background 0.2s;
-        flex-wrap: nowrap;
-        word-break: break-word;
-    }}
-    .file-item:hover {{ background: #F9FAFB; }}
-    .file-icon {{
-        font-size: 28px;
-        margin-right: 10px;
-        min-width: 28px;
-        margin-top: 2px;
-    }}
-    .file-info {{
-        flex: 1 1 auto;
-        min-width: 0;
-        overflow: hidden;
-    }}
-    .file-name {{
-        color: #111827;
-        text-decoration: none;
-        font-weight: 500;
-        display: block;
-        word-wrap: anywhere;
-        white-space: normal;
-    }}
-    .file-name:hover {{ color: #6366F1; }}
-    .file-meta {{
-        color: #6B7280;
-        font-size: 0.85em;
-        margin-top: 5px;
-    }}
-    .file-actions {{
-        flex-shrink: 0;
-        display: flex;
-        align-items: flex-start;
-        justify-content: flex-end;
-        gap: 8px;
-        min-width: 120px;
-    }}
-    .download-btn {{
-        background: #10B981;
-        color: white;
-        border: none;
-        padding: 8px 14px;
-        border-radius: 6px;
-        cursor: pointer;
-        text-decoration: none;
-        font-size: 0.85em;
-        white-space: nowrap;
-        transition: background 0.2s;
-    }}
-    .download-btn:hover {{ background: #059669; }}
-    .download-btn.zip {{
-        background: #F59E0B;
-    }}
-    .download-btn.zip:hover {{
-        background: #D97706;
-    }}
-    .search-box {{
-        padding: 20px 30px;
-        background: #F9FAFB;
-        border-bottom: 1px solid #E5E7EB;
-    }}
-    .search-box input {{
-        width: 100%;
-        padding: 12px 20px;
-        border: 2px solid #E5E7EB;
-        border-radius: 8px;
-        font-size: 14px;
-    }}
-    .search-box input:focus {{
-        outline: none;
-        border-color: #6366F1;
-    }}
-
-    @media (max-width: 768px) {{
-        body {{ padding: 0; }}
-        .container {{ border-radius: 0; }}
-        .file-item {{
-            flex-direction: row;
-            align-items: flex-start;
-            padding: 12px;
-        }}
-        .file-info {{
-            flex: 1 1 auto;
-            overflow-wrap: anywhere;
-        }}
-        .file-actions {{
-            gap: 6px;
-            min-width: auto;
-        }}
-        .download-btn {{
-            padding: 7px 10px;
-            font-size: 0.8em;
-        }}
-    }}
-
-    @media (max-width: 480px) {{
-        .header h1 {{ font-size: 1.6em; }}
-        .file-meta {{ font-size: 0.8em; }}
-        .download-btn {{
-            padding: 6px 8px;
-            font-size: 0.78em;
-        }}
-    }}
-</style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>📁 PyServer</h1>
-            <p>{displaypath}</p>
-        </div>
-        <div class="breadcrumb">
-            <a href="/">🏠 Home</a>
-            {breadcrumb}
-        </div>
-        <div class="search-box">
-            <input type="text" id="search" placeholder="🔍 Search files..." onkeyup="filterFiles()">
-        </div>
-        <div class="file-list" id="fileList">
-            {file_items}
-        </div>
-    </div>
-    <script>
-        function filterFiles() {{
-            const input = document.getElementById('search');
-            const filter = input.value.toUpperCase();
-            const items = document.querySelectorAll('.file-item');
-            
-            items.forEach(item => {{
-                const name = item.querySelector('.file-name').textContent;
-                item.style.display = name.toUpperCase().indexOf(filter) > -1 ? '' : 'none';
-            }});
-        }}
-    </script>
-</body>
-</html>"""
-    
-    def _generate_breadcrumb(self, path):
-        """Generate breadcrumb navigation"""
-        parts = [p for p in path.split('/') if p]
-        breadcrumb = ""
-        current = ""
-        
-        for part in parts:
-            current += f"/{part}"
-            breadcrumb += f' <span>/</span> <a href="{urllib.parse.quote(current)}">{part}</a>'
-        
-        return breadcrumb
-    
-    def _generate_file_list(self, path, file_list):
-        """Generate file list HTML with download buttons"""
-        html = ""
-        
-        for name in file_list:
-            fullname = os.path.join(path, name)
-            displayname = linkname = name
-            
+            while not self._stopping.is_set():
+                self._pump(0.5)
+                self._reap()
+            self._drain()
+        finally:
+            self._stopped.set()
+
+    def shutdown(self):
+        """Ask every worker to finish and wait until all have exited"""
+        self._stopping.set()
+        self._close_control()
+        if self._serving.is_set():
+            self._stopped.wait(timeout=WORKER_SHUTDOWN_TIMEOUT + 2)
+        else:
+            self._drain()
+
+    def server_close(self):
+        """Release the pipes and service sockets of the workers"""
+        file_watcher.unsubscribe(self._forward_changes)
+        self._close_control()
+        for worker in self.workers:
+            self._close_messages(worker)
             try:
-                is_dir = os.path.isdir(fullname)
-                stat = os.stat(fullname)
-                size = stat.st_size
-                mtime = datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
-                
-                # Get the relative path from the current directory
-                current_dir = os.getcwd()
-                relative_path = os.path.relpath(fullname, current_dir)
-                
-                if is_dir:
-                    icon = "📁"
-                    displayname += "/"
-                    linkname += "/"
-                    size_str = "-"
-                    download_btn = f'<a href="/download/{urllib.parse.quote(relative_path)}" class="download-btn zip" title="Download as ZIP">📦 ZIP</a>'
-                else:
-                    icon = self._get_file_icon(name)
-                    size_str = self._format_size(size)
-                    download_btn = f'<a href="/download/{urllib.parse.quote(relative_path)}" class="download-btn" title="Download file">⬇️ Download</a>'
-                
-                html += f"""
-                <div class="file-item">
-                    <div class="file-icon">{icon}</div>
-                    <div class="file-info">
-                        <a href="{urllib.parse.quote(linkname)}" class="file-name">{displayname}</a>
-                        <div class="file-meta">{size_str} • {mtime}</div>
-                    </div>
-                    <div class="file-actions">
-                        {download_btn}
-                    </div>
-                </div>
-                """
+                # Wakes the service thread blocked reading this socket
+                worker.service_sock.shutdown(socket.SHUT_RDWR)
             except OSError:
-                continue
-        
-        return html if html else '<p style="text-align:center;padding:40px;color:#6B7280;">No files found</p>'
-        
-    def _get_file_icon(self, filename):
-        """Get emoji icon for file type"""
-        ext = os.path.splitext(filename)[1].lower()
-        
-        icons = {
-            '.txt': '📄', '.pdf': '📕', '.doc': '📘', '.docx': '📘',
-            '.jpg': '🖼️', '.jpeg': '🖼️', '.png': '🖼️', '.gif': '🖼️',
-            '.mp3': '🎵', '.mp4': '🎬', '.avi': '🎬',
-            '.zip': '📦', '.rar': '📦', '.7z': '📦',
-            '.py': '🐍', '.js': '📜', '.html': '🌐', '.css': '🎨',
+                pass
+        self._selector.close()
+
+    def stats(self):
+        """Per-worker request counts and engine stats, plus totals"""
+        workers = [
+            {
+                "worker": worker.index,
+                "pid": worker.pid,
+                "alive": worker.exit_code is None,
+                "requests": worker.requests,
+                "server": worker.server_stats,
+                "listing_cache": worker.cache_stats,
+            }
+            for worker in self.workers
+        ]
+        return {
+            "engine": f"multiprocess/{self.engine}",
+            "processes": len(workers),
+            "requests": sum(w["requests"] for w in workers),
+            "workers": workers,
         }
-        
-        return icons.get(ext, '📄')
-    
-    def _format_size(self, size):
-        """Format file size"""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024.0:
-                return f"{size:.1f} {unit}"
-            size /= 1024.0
-        return f"{size:.1f} TB"
 
-class ThreadedHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
-    """Threaded HTTP server for handling multiple connections"""
-    allow_reuse_address = True
-    daemon_threads = True
+    # --------------------------------------------------------
+    # Worker messages
+    # --------------------------------------------------------
+    def _pump(self, timeout):
+        """Read whatever the workers have sent within timeout seconds"""
+        if not self._selector.get_map():
+            time.sleep(timeout)
+            return
+        for key, _ in self._selector.select(timeout):
+            worker = key.data
+            try:
+                data = os.read(worker.msg_fd, 65536)
+            except OSError:
+                data = b""
+            if not data:
+                self._close_messages(worker)
+                continue
+            worker.buffer += data
+            *lines, worker.buffer = worker.buffer.split(b"\n")
+            for line in lines:
+                try:
+                    self._handle_message(worker, json.loads(line))
+                except ValueError:
+                    logger.log(f"[worker {worker.index}] Malformed message: {line[:200]!r}", "WARNING")
+
+    def _handle_message(self, worker, message):
+        kind = message.get("type")
+        if kind == "log":
+            logger.log(f"[worker {worker.index}] {message.get('message', '')}",
+                       message.get("level", "INFO"))
+        elif kind == "stats":
+            worker.requests = message.get("requests", 0)
+            worker.server_stats = message.get("server", {})
+            worker.cache_stats = message.get("listing_cache", {})
+        elif kind == "ready":
+            worker.ready = True
+        elif kind == "error":
+            worker.error = message.get("message", "unknown error")
+
+    def _close_messages(self, worker):
+        if worker.msg_fd is not None:
+            try:
+                self._selector.unregister(worker.msg_fd)
+            except (KeyError, ValueError):
+                pass
+            os.close(worker.msg_fd)
+            worker.msg_fd = None
+
+    def _close_control(self):
+        with self._ctrl_lock:
+            for worker in self.workers:
+                if worker.ctrl_fd is not None:
+                    os.close(worker.ctrl_fd)
+                    worker.ctrl_fd = None
+
+    def _forward_changes(self, folders):
+        """FileWatcher subscriber: pass changed folders on, so workers drop their cached copies"""
+        line = json.dumps({"type": "changed",
+                           "folders": sorted(folders) if folders is not None else None}) + "\n"
+        data = line.encode("utf-8")
+        with self._ctrl_lock:
+            for worker in self.workers:
+                if worker.ctrl_fd is None:
+                    continue
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(worker.ctrl_fd, view):]
+                except BlockingIOError:
+                    pass  # The worker has stopped reading; a torn line makes it drop everything
+                except OSError:
+                    pass  # The worker exited; _reap reports it
+
+    # --------------------------------------------------------
+    # Process management
+    # --------------------------------------------------------
+    def _reap(self):
+        """Notice workers that died on their own"""
+        for worker in self.workers:
+            if worker.exit_code is None and self._wait(worker, block=False) and not self._stopping.is_set():
+                logger.log(f"Worker {worker.index} (pid {worker.pid}) exited unexpectedly "
+                           f"with status {worker.exit_code}", "ERROR")
+
+    def _drain(self):
+        """Collect final logs and counters, then reap every worker, killing stragglers"""
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+        while self._selector.get_map() and time.monotonic() < deadline:
+            self._pump(0.2)
+        for worker in self.workers:
+            # The pipe reports EOF slightly before the process can be reaped
+            while worker.exit_code is None and not self._wait(worker, block=False):
+                if time.monotonic() >= deadline:
+                    logger.log(f"Worker {worker.index} did not stop in time, killing it", "WARNING")
+                    try:
+                        os.kill(worker.pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+                    self._wait(worker, block=True)
+                    break
+                time.sleep(0.05)
+
+    def _wait(self, worker, block):
+        """waitpid() wrapper; True once the worker has exited"""
+        try:
+            pid, status = os.waitpid(worker.pid, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            pid, status = worker.pid, 0
+        if pid == 0:
+            return False
+        worker.exit_code = os.waitstatus_to_exitcode(status)
+        return True
 
 
 # ============================================================================
@@ -738,16 +7459,31 @@ class ServerManager:
         self.server_thread = None
         self.is_running = False
         self.port = DEFAULT_PORT
+        self.engine = DEFAULT_ENGINE
+        self.processes = DEFAULT_PROCESSES
         self.directory = None
         self._lock = threading.Lock()
         self._stop_event = threading.Event()
     
-    def start(self, directory: str, port: int = DEFAULT_PORT) -> tuple[bool, str]:
-        """Start the HTTP server. Returns (success, message)"""
+    def start(self, directory: str, port: int = DEFAULT_PORT,
+              engine: str = DEFAULT_ENGINE, processes: int = DEFAULT_PROCESSES,
+              allow_uploads: bool = ALLOW_UPLOADS) -> tuple[bool, str]:
+        """
+        Start the HTTP server with the given engine (see SERVER_ENGINES).
+        processes > 1 runs that many worker processes on the port (see MultiProcessServer).
+        allow_uploads lets clients on the network add files (see _uploads_allowed).
+        Returns (success, message)
+        """
         with self._lock:
             if self.is_running:
                 return False, "Server already running"
             
+            if engine not in SERVER_ENGINES:
+                return False, f"Unknown server engine: {engine}"
+            
+            if processes > 1 and not MULTIPROCESS_AVAILABLE:
+                return False, "Multiple worker processes need fork() and SO_REUSEPORT"
+            
             try:
                 # Validate directory
                 if not directory or not os.path.isdir(directory):
@@ -769,7 +7505,13 @@ class ServerManager:
                 os.chdir(directory)
                 
                 # Create and start server
-                self.server = ThreadedHTTPServer(("", port), EnhancedHTTPHandler)
+                self.engine = engine
+                self.processes = processes
+                EnhancedHTTPHandler.allow_uploads = allow_uploads
+                if processes > 1:
+                    self.server = MultiProcessServer(("", port), EnhancedHTTPHandler, engine, processes)
+                else:
+                    self.server = SERVER_ENGINES[engine](("", port), EnhancedHTTPHandler)
                 self.server.daemon_threads = True
                 self.server.allow_reuse_address = True
                 
@@ -787,8 +7529,13 @@ class ServerManager:
                     return False, "Server thread failed to start"
                 
                 self.is_running = True
+                # Started after the workers are forked; they reach these services through us
+                start_background_services(directory)
                 
-                logger.log(f"Server started on port {port}", "INFO")
+                if processes > 1:
+                    logger.log(f"Server started on port {port} ({engine} engine, {processes} processes)", "INFO")
+                else:
+                    logger.log(f"Server started on port {port} ({engine} engine)", "INFO")
                 return True, f"Server started successfully on port {port}"
                 
             except OSError as e:
@@ -821,6 +7568,11 @@ class ServerManager:
                 
                 # Shutdown server
                 if self.server:
+                    try:
+                        logger.log(f"Server stats: {self.server.stats()}", "INFO")
+                    except Exception:
+                        pass
+                    
                     try:
                         self.server.shutdown()
                     except Exception as e:
@@ -839,6 +7591,15 @@ class ServerManager:
                 
                 self.server_thread = None
                 self.is_running = False
+                stop_background_services()
+                
+                stats = listing_cache.stats()
+                logger.log(
+                    f"Listing cache: {stats['hits']} hits, {stats['misses']} misses, "
+                    f"{stats['evictions']} evictions",
+                    "INFO"
+                )
+                listing_cache.invalidate()
                 
                 logger.log("Server stopped", "INFO")
                 return True, "Server stopped successfully"
@@ -1170,7 +7931,7 @@ class MainScreen(Screen):
             padding=dp(18),
             spacing=dp(10),
             size_hint_y=None,
-            height=dp(190),
+            height=dp(236),
             elevation=3,
             radius=[dp(16)]
         )
@@ -1208,6 +7969,16 @@ class MainScreen(Screen):
         )
         dir_card.add_widget(browse_btn)
 
+        # Off by default: anyone on the network could otherwise add files
+        uploads_row = BoxLayout(orientation='horizontal', spacing=dp(6), size_hint_y=None, height=dp(36))
+        self.uploads_checkbox = MDCheckbox(active=ALLOW_UPLOADS, size_hint=(None, None), size=(dp(36), dp(36)))
+        uploads_row.add_widget(self.uploads_checkbox)
+        uploads_row.add_widget(MDLabel(
+            text="Allow uploads from the network",
+            theme_text_color="Secondary"
+        ))
+        dir_card.add_widget(uploads_row)
+
         content.add_widget(dir_card)
 
         # =============== QR CODE CARD ==================
@@ -1456,8 +8227,10 @@ class MainScreen(Screen):
         self.show_loading("Starting server...")
         
         # Start server in background
+        allow_uploads = self.uploads_checkbox.active
+        
         def start_thread():
-            success, message = self.server_manager.start(directory, DEFAULT_PORT)
+            success, message = self.server_manager.start(directory, DEFAULT_PORT, allow_uploads=allow_uploads)
             Clock.schedule_once(lambda dt: self.on_server_started(success, message), 0)
         
         threading.Thread(target=start_thread, daemon=True).start()
@@ -1682,9 +8455,20 @@ class MainScreen(Screen):
     
     def show_settings(self):
         """Show settings dialog"""
+        cache = listing_cache.stats()
+        workers = ""
+        server = self.server_manager.server
+        if isinstance(server, MultiProcessServer):
+            counts = ", ".join(str(w["requests"]) for w in server.stats()["workers"])
+            workers = f"\nWorker processes: {len(server.workers)} (requests: {counts})"
         dialog = MDDialog(
             title="Settings",
-            text=f"Port: {DEFAULT_PORT}\nBuffer Size: {BUFFER_SIZE} bytes",
+            text=(
+                f"Port: {DEFAULT_PORT}\nBuffer Size: {BUFFER_SIZE} bytes\n"
+                f"Zero-copy sendfile: {'Yes' if SENDFILE_AVAILABLE else 'No'}\n"
+                f"Listing cache: {cache['entries']} entries, {cache['hits']} hits / {cache['misses']} misses"
+                f"{workers}"
+            ),
             buttons=[
                 MDRaisedButton(text="OK", on_release=lambda x: dialog.dismiss())
             ]
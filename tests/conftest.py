@@ -0,0 +1,62 @@
+"""
+Shared fixtures. main.py imports Kivy at module level, so every test
+module skips itself where Kivy is not installed; Kivy must not parse
+pytest's argv.
+"""
+
+import http.client
+import os
+import re
+import sys
+import urllib.parse
+
+import pytest
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """
+    A threaded server with uploads enabled on a free port, serving an empty
+    folder. Yields (base_url, root); tests add the files they need.
+    """
+    import main
+    root = tmp_path_factory.mktemp("served")
+    cwd = os.getcwd()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(main, "UPLOAD_SESSION_DIR", str(tmp_path_factory.mktemp("sessions")))
+        manager = main.ServerManager()
+        ok, message = manager.start(str(root), 0, "threaded", allow_uploads=True)
+        assert ok, message
+        try:
+            yield f"http://127.0.0.1:{manager.server.server_address[1]}", root
+        finally:
+            manager.stop()
+            os.chdir(cwd)
+
+
+@pytest.fixture
+def fetch(server):
+    """fetch(method, path, body=None, headers=None) -> (response, body) on a fresh connection"""
+    netloc = urllib.parse.urlsplit(server[0]).netloc
+
+    def fetch(method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection(netloc, timeout=10)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response, response.read()
+        finally:
+            conn.close()
+    return fetch
+
+
+@pytest.fixture
+def folder(server, request):
+    """A fresh folder under the served root for one test"""
+    path = server[1] / re.sub(r"\W", "_", request.node.name)
+    path.mkdir()
+    return path
@@ -0,0 +1,154 @@
+import io
+import os
+import threading
+import zipfile
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "APP_CACHE_DIR", str(tmp_path / "cache"))
+    return main.ArchiveCache(budget=64 * 1024 * 1024)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """served/photos/{a.txt, trip/b.txt} with a sibling served/music; returns (served, entries)"""
+    served = tmp_path / "served"
+    (served / "photos" / "trip").mkdir(parents=True)
+    (served / "music").mkdir()
+    (served / "photos" / "a.txt").write_bytes(b"a" * 50000)
+    (served / "photos" / "trip" / "b.txt").write_bytes(os.urandom(50000))
+    (served / "music" / "c.txt").write_bytes(b"c")
+    return served, list(main.iter_zip_entries(str(served / "photos")))
+
+
+def build(cache, entries, client=None):
+    """Build the archive as the first request would; returns (key, bytes sent to the client)"""
+    key = (cache.fingerprint(entries), zipfile.ZIP_DEFLATED)
+    path, handle, leader = cache.open(key)
+    assert path is None and leader
+    client = client or io.BytesIO()
+    try:
+        cache.write_build(key, handle, entries, zipfile.ZIP_DEFLATED, client)
+    finally:
+        cache.release(key, handle)
+    return key, client.getvalue() if isinstance(client, io.BytesIO) else None
+
+
+class BrokenClient:
+    def write(self, data):
+        raise ConnectionResetError("client went away")
+
+
+def test_first_download_is_cached(cache, tree):
+    _, entries = tree
+    key, sent = build(cache, entries)
+    with zipfile.ZipFile(io.BytesIO(sent)) as archive:
+        assert sorted(archive.namelist()) == ["photos/a.txt", "photos/trip/b.txt"]
+    path, handle, leader = cache.open(key)
+    assert handle is None and not leader
+    with open(path, "rb") as f:
+        assert f.read() == sent
+    assert cache.stats()["builds"] == 1
+
+
+def test_member_folders_stop_at_the_archive(tree):
+    served, entries = tree
+    assert main.ArchiveCache.member_folders(entries) == {
+        str(served / "photos"), str(served / "photos" / "trip")}
+    selection = list(main.iter_selection_entries([str(served / "music" / "c.txt"), str(served / "photos")]))
+    assert main.ArchiveCache.member_folders(selection) == {
+        str(served / "music"), str(served / "photos"), str(served / "photos" / "trip")}
+
+
+@pytest.mark.parametrize("changed, evicted", [
+    ("photos", True),
+    ("photos/trip", True),
+    ("music", False),
+    ("", False),
+    ("..", False),
+])
+def test_invalidation_is_limited_to_the_archived_tree(cache, tree, changed, evicted):
+    served, entries = tree
+    key, _ = build(cache, entries)
+    cache.invalidate_folder(os.path.join(str(served), changed) if changed else str(served))
+    assert (cache.disk.get(key) is None) == evicted
+
+
+def test_concurrent_requests_follow_one_build(cache, tree):
+    _, entries = tree
+    key = (cache.fingerprint(entries), zipfile.ZIP_DEFLATED)
+    _, first, leader = cache.open(key)
+    _, second, follower_leads = cache.open(key)
+    assert leader and not follower_leads and second is first
+    received = []
+    reader = second.reader()
+    thread = threading.Thread(target=lambda: received.append(b"".join(reader)))
+    thread.start()
+    client = io.BytesIO()
+    cache.write_build(key, first, entries, zipfile.ZIP_DEFLATED, client)
+    cache.release(key, first)
+    thread.join(10)
+    cache.release(key, second)
+    assert received == [client.getvalue()]
+    assert cache.stats()["builds"] == 1 and cache.stats()["coalesced"] == 1
+
+
+def test_build_outlives_a_lost_first_client_while_followed(cache, tree):
+    _, entries = tree
+    key = (cache.fingerprint(entries), zipfile.ZIP_DEFLATED)
+    _, handle, _ = cache.open(key)
+    _, follower, _ = cache.open(key)
+    received = []
+    reader = follower.reader()
+    thread = threading.Thread(target=lambda: received.append(b"".join(reader)))
+    thread.start()
+    with pytest.raises(ConnectionResetError):
+        cache.write_build(key, handle, entries, zipfile.ZIP_DEFLATED, BrokenClient())
+    cache.release(key, handle)
+    thread.join(10)
+    cache.release(key, follower)
+    with zipfile.ZipFile(io.BytesIO(received[0])) as archive:
+        assert archive.testzip() is None
+    assert cache.disk.get(key) is not None
+
+
+def test_build_without_followers_stops_with_its_client(cache, tree):
+    _, entries = tree
+    with pytest.raises(ConnectionResetError):
+        build(cache, entries, BrokenClient())
+    key = (cache.fingerprint(entries), zipfile.ZIP_DEFLATED)
+    assert cache.disk.get(key) is None
+    assert cache.stats()["cancelled"] == 1
+    assert [n for n in os.listdir(cache.disk.directory) if n.endswith(".tmp")] == []
+
+
+def test_abandoned_build_fails_its_followers(cache, tree):
+    _, entries = tree
+    key = (cache.fingerprint(entries), zipfile.ZIP_DEFLATED)
+    _, handle, _ = cache.open(key)
+    _, follower, _ = cache.open(key)
+    reader = follower.reader()
+    cache.abandon(key, handle)
+    cache.release(key, handle)
+    with pytest.raises(IOError):
+        b"".join(reader)
+    cache.release(key, follower)
+    # The next request starts over
+    assert cache.open(key)[2]
+
+
+def test_repeated_http_downloads_build_once(fetch, folder):
+    (folder / "x.txt").write_bytes(b"x" * 10000)
+    builds = main.archive_cache.stats()["builds"]
+    first, body = fetch("GET", f"/download/{folder.name}")
+    assert first.status == 200
+    second, again = fetch("GET", f"/download/{folder.name}")
+    assert again == body
+    assert second.getheader("Content-Length") == str(len(body))
+    assert main.archive_cache.stats()["builds"] == builds + 1
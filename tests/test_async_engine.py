@@ -0,0 +1,110 @@
+import os
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def async_server(tmp_path_factory):
+    """The asyncio engine with uploads on a free port, serving a folder with one 32 MB file"""
+    root = tmp_path_factory.mktemp("served")
+    (root / "big").mkdir()
+    with open(root / "big" / "data.bin", "wb") as f:
+        f.write(os.urandom(1024 * 1024) * 32)
+    cwd = os.getcwd()
+    manager = main.ServerManager()
+    ok, message = manager.start(str(root), 0, "asyncio", allow_uploads=True)
+    assert ok, message
+    try:
+        yield manager.server, root
+    finally:
+        manager.stop()
+        os.chdir(cwd)
+
+
+def read_all(sock):
+    data = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return data
+        data += chunk
+
+
+def test_pipelined_requests_are_answered_in_order(async_server):
+    server, root = async_server
+    port = server.server_address[1]
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+        sock.sendall(b"GET /big/data.bin HTTP/1.1\r\nHost: x\r\nRange: bytes=0-9\r\n\r\n"
+                     b"GET /big/ HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        data = read_all(sock)
+    first, _, rest = data.partition(b"\r\n\r\n")
+    assert first.startswith(b"HTTP/1.1 206")
+    with open(root / "big" / "data.bin", "rb") as f:
+        assert rest[:10] == f.read(10)
+    assert rest[10:].startswith(b"HTTP/1.1 200")
+    assert b"data.bin" in rest
+
+
+def test_archive_downloads_waiting_on_a_stalled_build_hold_no_worker_slots(async_server):
+    port = async_server[0].server_address[1]
+    request = b"GET /download/big?mode=store HTTP/1.1\r\nHost: x\r\n\r\n"
+    sockets = []
+
+    def drain(sock):
+        try:
+            while sock.recv(65536):
+                pass
+        except OSError:
+            pass
+
+    try:
+        # The first download builds the shared archive and never reads, so the
+        # build stalls; more readers than worker slots catch up and wait on it
+        leader = socket.create_connection(("127.0.0.1", port), timeout=10)
+        leader.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        leader.sendall(request)
+        sockets.append(leader)
+        time.sleep(0.5)
+        for _ in range(main.ASYNC_WORKERS + 4):
+            sock = socket.create_connection(("127.0.0.1", port), timeout=10)
+            sock.sendall(request)
+            sockets.append(sock)
+            threading.Thread(target=drain, args=(sock,), daemon=True).start()
+        time.sleep(1)
+        started = time.monotonic()
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=10) as response:
+            assert response.status == 200
+        assert time.monotonic() - started < 5
+    finally:
+        for sock in sockets:
+            sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+
+
+def test_file_download_is_sent_from_the_loop(async_server):
+    server, root = async_server
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/big/data.bin", timeout=20) as response:
+        body = response.read()
+    assert body == (root / "big" / "data.bin").read_bytes()
+    # The handler gave its worker slot back as soon as the file was queued
+    deadline = time.monotonic() + 2
+    while server.stats()["busy_workers"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert server.stats()["busy_workers"] == 0
+
+
+def test_upload_body_is_read_through_the_loop(async_server):
+    server, root = async_server
+    data = os.urandom(3 * 1024 * 1024)
+    request = urllib.request.Request(f"http://127.0.0.1:{server.server_address[1]}/big/upload.bin",
+                                     data=data, method="PUT")
+    with urllib.request.urlopen(request, timeout=20) as response:
+        assert response.status == 201
+    assert (root / "big" / "upload.bin").read_bytes() == data
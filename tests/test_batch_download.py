@@ -0,0 +1,93 @@
+import io
+import json
+import tarfile
+import urllib.parse
+import zipfile
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+FORM = {"Content-Type": "application/x-www-form-urlencoded"}
+JSON = {"Content-Type": "application/json"}
+
+
+def test_unique_name():
+    taken = set()
+    assert [main.unique_name(n, taken) for n in ["a.txt", "A.txt", "a.txt"]] == ["a.txt", "A (2).txt", "a (3).txt"]
+    assert main.unique_name("photos.2024", taken, is_dir=True) == "photos.2024"
+    assert main.unique_name("photos.2024", taken, is_dir=True) == "photos.2024 (2)"
+
+
+def test_selection_entries(tmp_path):
+    (tmp_path / "x").mkdir()
+    (tmp_path / "y").mkdir()
+    (tmp_path / "x" / "a.txt").write_bytes(b"1")
+    (tmp_path / "y" / "a.txt").write_bytes(b"2")
+    (tmp_path / "x" / "sub").mkdir()
+    (tmp_path / "x" / "sub" / "b.txt").write_bytes(b"3")
+    selection = [str(tmp_path / "x"), str(tmp_path / "x" / "a.txt"), str(tmp_path / "y" / "a.txt"),
+                 str(tmp_path / "x"), str(tmp_path / "missing")]
+    names = {arcname: path for path, arcname, _ in main.iter_selection_entries(selection)}
+    assert names == {
+        "x/a.txt": str(tmp_path / "x" / "a.txt"),
+        "x/sub/b.txt": str(tmp_path / "x" / "sub" / "b.txt"),
+        "a.txt": str(tmp_path / "x" / "a.txt"),
+        "a (2).txt": str(tmp_path / "y" / "a.txt"),
+    }
+
+
+@pytest.fixture
+def tree(folder):
+    (folder / "docs").mkdir()
+    (folder / "docs" / "a.txt").write_bytes(b"alpha")
+    (folder / "b.txt").write_bytes(b"beta")
+    return folder
+
+
+def test_form_selection_as_zip(fetch, tree):
+    body = urllib.parse.urlencode([("path", f"{tree.name}/docs"), ("path", f"{tree.name}/b.txt")])
+    response, data = fetch("POST", "/download-batch", body, FORM)
+    assert response.status == 200
+    assert 'filename="selection-2-items.zip"' in response.getheader("Content-Disposition")
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert {name: archive.read(name) for name in archive.namelist()} == {
+            "docs/a.txt": b"alpha", "b.txt": b"beta"}
+
+
+def test_json_selection_as_tar(fetch, tree):
+    body = json.dumps({"paths": [f"{tree.name}/docs"], "format": "tar"})
+    response, data = fetch("POST", "/download-batch", body, JSON)
+    assert response.status == 200
+    assert 'filename="docs.tar"' in response.getheader("Content-Disposition")
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        assert archive.extractfile("docs/a.txt").read() == b"alpha"
+
+
+def test_listing_offers_the_selection_form(fetch, tree):
+    _, body = fetch("GET", f"/{tree.name}/")
+    assert b'action="/download-batch"' in body
+    assert f'name="path" value="{tree.name}/b.txt"'.encode() in body
+
+
+@pytest.mark.parametrize("body, headers, status", [
+    ("", FORM, 400),
+    ("path=x&format=rar", FORM, 400),
+    ('{"paths": "x"}', JSON, 400),
+    ("{not json", JSON, 400),
+    ("path=../etc/passwd", FORM, 403),
+    ("path=no-such-file", FORM, 404),
+], ids=["empty", "format", "paths-type", "json", "escape", "missing"])
+def test_bad_requests(fetch, body, headers, status):
+    response, _ = fetch("POST", "/download-batch", body, headers)
+    assert response.status == status
+
+
+def test_limits(fetch, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_PATHS", 2)
+    response, _ = fetch("POST", "/download-batch", "path=a&path=b&path=c", FORM)
+    assert response.status == 413
+    monkeypatch.setattr(main, "BATCH_MAX_BODY", 10)
+    response, _ = fetch("POST", "/download-batch", "path=" + "a" * 100, FORM)
+    assert response.status == 413
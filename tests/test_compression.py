@@ -0,0 +1,129 @@
+import gzip
+import os
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.mark.parametrize("header, coding, expected", [
+    ("gzip", "gzip", True),
+    ("deflate, gzip;q=0.5", "gzip", True),
+    ("gzip;q=0", "gzip", False),
+    ("*", "br", True),
+    ("identity", "gzip", False),
+    ("", "gzip", False),
+    (None, "gzip", False),
+])
+def test_accepts_encoding(header, coding, expected):
+    assert main.accepts_encoding(header, coding) is expected
+
+
+def test_choose_encoding_prefers_brotli(monkeypatch):
+    monkeypatch.setattr(main, "BROTLI_AVAILABLE", True)
+    assert main.choose_encoding("gzip, br") == "br"
+    assert main.choose_encoding("gzip, br;q=0") == "gzip"
+    monkeypatch.setattr(main, "BROTLI_AVAILABLE", False)
+    assert main.choose_encoding("br") is None
+
+
+@pytest.mark.parametrize("path, content_type, expected", [
+    ("a.bin", "text/plain; charset=utf-8", True),
+    ("a.bin", "application/json", True),
+    ("notes.log", "application/octet-stream", True),
+    ("photo.jpg", "image/jpeg", False),
+    ("archive.zip", None, False),
+])
+def test_is_compressible(path, content_type, expected):
+    assert main.is_compressible(path, content_type) is expected
+
+
+@pytest.mark.parametrize("encoding", main.supported_encodings())
+def test_streaming_compression_round_trip(encoding):
+    data = b"some text to compress\n" * 10000
+    out = []
+
+    class Sink:
+        write = out.append
+
+    writer = main.CompressingWriter(Sink(), encoding)
+    for i in range(0, len(data), 4096):
+        writer.write(data[i:i + 4096])
+    writer.close()
+    compressed = b"".join(out)
+    assert len(compressed) < len(data) // 10
+    if encoding == "gzip":
+        assert gzip.decompress(compressed) == data
+    else:
+        assert main.brotli.decompress(compressed) == data
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "APP_CACHE_DIR", str(tmp_path / "cache"))
+    return main.CompressionCache()
+
+
+def test_small_variants_stay_in_memory(cache, tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"hello\n" * 1000)
+    with open(tmp_path / "a.txt", "rb") as f:
+        data, path = cache.get_or_create(str(tmp_path / "a.txt"), '"1"', "gzip", f)
+        assert path is None
+        assert gzip.decompress(data) == b"hello\n" * 1000
+        assert cache.get_or_create(str(tmp_path / "a.txt"), '"1"', "gzip", f) == (data, None)
+    assert os.listdir(tmp_path / "cache" / "compressed") == []
+
+
+def test_large_variants_go_to_disk(cache, tmp_path):
+    # Hex text compresses about 2:1, well past the in-memory limit
+    text = os.urandom(main.COMPRESS_MEMORY_ITEM_LIMIT * 2).hex().encode()
+    (tmp_path / "big.txt").write_bytes(text)
+    with open(tmp_path / "big.txt", "rb") as f:
+        data, path = cache.get_or_create(str(tmp_path / "big.txt"), '"1"', "gzip", f)
+        assert data is None
+        with open(path, "rb") as g:
+            assert gzip.decompress(g.read()) == text
+        assert cache.get_or_create(str(tmp_path / "big.txt"), '"1"', "gzip", f) == (None, path)
+        # A new version of the file is compressed again
+        assert cache.get_or_create(str(tmp_path / "big.txt"), '"2"', "gzip", f)[1] != path
+    assert not [name for name in os.listdir(tmp_path / "cache" / "compressed") if name.endswith(".tmp")]
+
+
+def test_text_files_are_sent_compressed(fetch, folder):
+    text = b"line of text\n" * 2000
+    (folder / "notes.txt").write_bytes(text)
+    response, body = fetch("GET", f"/{folder.name}/notes.txt", headers={"Accept-Encoding": "gzip"})
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert response.getheader("Vary") == "Accept-Encoding"
+    assert int(response.getheader("Content-Length")) == len(body) < len(text)
+    assert gzip.decompress(body) == text
+
+    # Ranges and clients that do not ask get the identity body
+    headers = {"Accept-Encoding": "gzip", "Range": "bytes=0-3"}
+    response, body = fetch("GET", f"/{folder.name}/notes.txt", headers=headers)
+    assert response.status == 206
+    assert response.getheader("Content-Encoding") is None
+    assert body == b"line"
+    response, body = fetch("GET", f"/{folder.name}/notes.txt")
+    assert response.getheader("Content-Encoding") is None
+    assert body == text
+
+
+@pytest.mark.parametrize("name, data", [
+    ("tiny.txt", b"too small to bother"),
+    ("photo.jpg", b"\xff\xd8" * 5000),
+], ids=["small", "image"])
+def test_other_files_are_sent_as_is(fetch, folder, name, data):
+    (folder / name).write_bytes(data)
+    response, body = fetch("GET", f"/{folder.name}/{name}", headers={"Accept-Encoding": "gzip"})
+    assert response.getheader("Content-Encoding") is None
+    assert body == data
+
+
+def test_listing_is_sent_compressed(fetch, folder):
+    for i in range(50):
+        (folder / f"file-{i}.txt").write_bytes(b"x")
+    response, body = fetch("GET", f"/{folder.name}/", headers={"Accept-Encoding": "gzip"})
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert b"file-49.txt" in gzip.decompress(body)
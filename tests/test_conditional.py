@@ -0,0 +1,93 @@
+import email.utils
+import os
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.mark.parametrize("header, expected", [
+    ('"a"', True),
+    ('W/"a"', True),
+    ('"b", "a"', True),
+    ("*", True),
+    ('"b"', False),
+    ("a", False),
+])
+def test_etag_matches_is_weak(header, expected):
+    assert main.etag_matches(header, 'W/"a"') is expected
+    assert main.etag_matches(header, '"a"') is expected
+
+
+def test_listing_etag_covers_generation_and_uploads(tmp_path):
+    st = os.stat(tmp_path)
+    tags = {main.listing_etag(st), main.listing_etag(st, 1), main.listing_etag(st, uploads=True)}
+    assert len(tags) == 3
+    assert all(tag.startswith("W/") for tag in tags)
+
+
+@pytest.fixture
+def served(fetch, folder):
+    (folder / "file.bin").write_bytes(b"cached content")
+    return f"/{folder.name}/file.bin", os.stat(folder / "file.bin")
+
+
+def test_file_validators(fetch, served):
+    path, st = served
+    response, _ = fetch("GET", path)
+    assert response.getheader("ETag") == main.file_etag(st)
+    assert response.getheader("Last-Modified") == email.utils.formatdate(st.st_mtime, usegmt=True)
+
+
+def test_file_if_none_match(fetch, served):
+    path, st = served
+    response, body = fetch("GET", path, headers={"If-None-Match": main.file_etag(st)})
+    assert response.status == 304
+    assert body == b""
+    assert response.getheader("ETag") == main.file_etag(st)
+    response, body = fetch("GET", path, headers={"If-None-Match": '"other"'})
+    assert response.status == 200
+    assert body == b"cached content"
+
+
+def test_file_if_modified_since(fetch, served):
+    path, st = served
+    response, _ = fetch("GET", path, headers={"If-Modified-Since": email.utils.formatdate(st.st_mtime, usegmt=True)})
+    assert response.status == 304
+    response, _ = fetch("GET", path, headers={"If-Modified-Since": email.utils.formatdate(st.st_mtime - 60, usegmt=True)})
+    assert response.status == 200
+    response, _ = fetch("GET", path, headers={"If-Modified-Since": "not a date"})
+    assert response.status == 200
+
+
+def test_if_none_match_wins_over_if_modified_since(fetch, served):
+    path, st = served
+    headers = {"If-None-Match": '"other"', "If-Modified-Since": email.utils.formatdate(st.st_mtime, usegmt=True)}
+    response, _ = fetch("GET", path, headers=headers)
+    assert response.status == 200
+
+
+def test_changed_file_is_sent_again(fetch, served, folder):
+    path, st = served
+    (folder / "file.bin").write_bytes(b"new content, new size")
+    response, body = fetch("GET", path, headers={"If-None-Match": main.file_etag(st)})
+    assert response.status == 200
+    assert body == b"new content, new size"
+
+
+def test_listing_revalidation(fetch, folder):
+    (folder / "a.txt").write_bytes(b"a")
+    response, _ = fetch("GET", f"/{folder.name}/")
+    etag = response.getheader("ETag")
+    assert etag.startswith("W/")
+    assert response.getheader("Cache-Control") == "no-cache"
+    response, body = fetch("GET", f"/{folder.name}/", headers={"If-None-Match": etag})
+    assert response.status == 304
+    assert body == b""
+
+    (folder / "b.txt").write_bytes(b"b")
+    response, body = fetch("GET", f"/{folder.name}/", headers={"If-None-Match": etag})
+    assert response.status == 200
+    assert response.getheader("ETag") != etag
+    assert b"b.txt" in body
@@ -0,0 +1,198 @@
+import importlib.util
+import io
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+TOOL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools", "delta_fetch.py")
+
+
+@pytest.fixture(scope="module")
+def client():
+    """tools/delta_fetch.py, which is a script rather than a package"""
+    spec = importlib.util.spec_from_file_location("delta_fetch", TOOL)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def signatures(tmp_path, monkeypatch):
+    """The server's signature cache, moved to an empty folder"""
+    monkeypatch.setattr(main, "APP_CACHE_DIR", str(tmp_path / "cache"))
+    signatures = main.DeltaSignatures()
+    monkeypatch.setattr(main, "delta_signatures", signatures)
+    monkeypatch.setattr(main.content_hashes, "journal", str(tmp_path / "cache" / "digests.log"))
+    return signatures
+
+
+def signature_of(data, block):
+    out = io.BytesIO()
+    main.write_signature(io.BytesIO(data), len(data), block, out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("size, block", [
+    (0, main.DELTA_MIN_BLOCK),
+    (10 ** 10, 128 * 1024),
+    (10 ** 12, main.DELTA_MAX_BLOCK),
+])
+def test_delta_block_size(size, block):
+    assert main.delta_block_size(size) == block
+    assert main.valid_delta_block(block)
+
+
+@pytest.mark.parametrize("block", [main.DELTA_MIN_BLOCK // 2, 5000, main.DELTA_MAX_BLOCK * 2])
+def test_invalid_block_sizes(block):
+    assert not main.valid_delta_block(block)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("0-3,10", [(0, 3), (10, 10)]),
+    (" 5 , 7-7 ,", [(5, 5), (7, 7)]),
+    ("", None),
+    ("3-1", None),
+    ("0-20", None),
+    ("a-b", None),
+])
+def test_parse_block_ranges(text, expected):
+    assert main.parse_block_ranges(text, 20) == expected
+
+
+def test_signature_format(client):
+    block = main.DELTA_MIN_BLOCK
+    data = os.urandom(block * 3 + 100)
+    sig = client.Signature(signature_of(data, block))
+    assert (sig.block, sig.size, sig.count) == (block, len(data), 4)
+    assert sig.length(3) == 100
+    for index in range(4):
+        chunk = data[index * block:(index + 1) * block]
+        assert sig.weak[index] == main.zlib.adler32(chunk)
+        assert sig.strong[index] == client.strong_digest(chunk)
+    with pytest.raises(ValueError):
+        client.Signature(signature_of(data, block)[:-1])
+
+
+def test_blocks_are_found_at_any_offset(client):
+    block = main.DELTA_MIN_BLOCK
+    new = os.urandom(block * 8 + 10)
+    # The old copy lacks a prefix and one block in the middle, and has junk inserted
+    old = b"junk" + new[block:block * 4] + os.urandom(77) + new[block * 5:]
+    sig = client.Signature(signature_of(new, block))
+    found = client.match_blocks(old, sig)
+    assert set(found) == {1, 2, 3, 5, 6, 7, 8}
+    assert client.missing_ranges(sig, found) == [(0, 0), (4, 4)]
+
+    fetched = io.BytesIO(new[:block] + new[block * 4:block * 5])
+    out = io.BytesIO()
+    client.rebuild(old, sig, found, fetched, out)
+    assert out.getvalue() == new
+
+
+def test_signatures_are_cached(signatures, tmp_path):
+    (tmp_path / "f").write_bytes(os.urandom(50_000))
+    st = os.stat(tmp_path / "f")
+    path = signatures.get(str(tmp_path / "f"), st, main.DELTA_MIN_BLOCK)
+    with open(path, "rb") as f:
+        assert f.read() == signature_of((tmp_path / "f").read_bytes(), main.DELTA_MIN_BLOCK)
+    assert signatures.get(str(tmp_path / "f"), st, main.DELTA_MIN_BLOCK) == path
+    assert signatures.stats()["computed"] == 1
+    # Another block size is another signature
+    assert signatures.get(str(tmp_path / "f"), st, main.DELTA_MIN_BLOCK * 2) != path
+
+
+def test_concurrent_requests_share_one_signature(signatures, tmp_path, monkeypatch):
+    (tmp_path / "f").write_bytes(os.urandom(50_000))
+    st = os.stat(tmp_path / "f")
+    started = threading.Event()
+    release = threading.Event()
+    real_write_signature = main.write_signature
+
+    def slow_write_signature(*args):
+        started.set()
+        release.wait(5)
+        real_write_signature(*args)
+    monkeypatch.setattr(main, "write_signature", slow_write_signature)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(signatures.get(str(tmp_path / "f"), st, 8192)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 1 and results[0]
+    assert signatures.stats()["computed"] == 1
+
+
+def test_signature_of_a_changing_file_is_discarded(signatures, tmp_path):
+    (tmp_path / "f").write_bytes(b"x" * 10_000)
+    st = os.stat(tmp_path / "f")
+    (tmp_path / "f").write_bytes(b"y" * 20_000)
+    with pytest.raises(OSError):
+        signatures.get(str(tmp_path / "f"), st, main.DELTA_MIN_BLOCK)
+    assert signatures.stats()["disk"]["entries"] == 0
+    assert not [name for name in os.listdir(signatures.disk.directory) if name.endswith(".tmp")]
+
+
+def test_signature_and_blocks_api(fetch, folder, signatures):
+    data = os.urandom(20_000)
+    (folder / "f.bin").write_bytes(data)
+    response, body = fetch("GET", f"/api/signature/{folder.name}/f.bin?block=4096")
+    assert response.status == 200
+    assert response.getheader("X-Block-Size") == "4096"
+    assert body == signature_of(data, 4096)
+    etag = response.getheader("ETag")
+    assert fetch("GET", f"/api/signature/{folder.name}/f.bin?block=4096",
+                 headers={"If-None-Match": etag})[0].status == 304
+    response, body = fetch("HEAD", f"/api/signature/{folder.name}/f.bin?block=4096")
+    assert response.getheader("Content-Length") == str(len(signature_of(data, 4096))) and body == b""
+
+    response, body = fetch("GET", f"/api/blocks/{folder.name}/f.bin?block=4096&ranges=4,0-1",
+                           headers={"If-Match": etag})
+    assert response.status == 200
+    assert body == data[16384:] + data[:8192]
+    response, body = fetch("POST", f"/api/blocks/{folder.name}/f.bin?block=4096", b"2",
+                           headers={"If-Match": etag})
+    assert body == data[8192:12288]
+
+    (folder / "f.bin").write_bytes(data[::-1])
+    response, _ = fetch("GET", f"/api/blocks/{folder.name}/f.bin?block=4096&ranges=0",
+                        headers={"If-Match": etag})
+    assert response.status == 412
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/api/signature/{folder}/f.bin?block=5000", 400),
+    ("/api/blocks/{folder}/f.bin?block=4096&ranges=9", 400),
+    ("/api/signature/../etc/passwd", 403),
+    ("/api/signature/{folder}/missing.bin", 404),
+    ("/api/blocks/{folder}", 404),
+], ids=["block", "ranges", "escape", "missing", "folder"])
+def test_delta_api_rejects(fetch, folder, signatures, path, status):
+    (folder / "f.bin").write_bytes(b"x" * 10_000)
+    response, _ = fetch("GET", path.format(folder=folder.name))
+    assert response.status == status
+
+
+def test_delta_fetch_end_to_end(client, server, folder, signatures, tmp_path, capsys):
+    old = os.urandom(300_000)
+    new = old[:100_000] + b"inserted" + old[100_000:250_000] + os.urandom(5000) + old[260_000:]
+    (folder / "app.log").write_bytes(new)
+    (tmp_path / "app.log").write_bytes(old)
+
+    client.delta_fetch(f"{server[0]}/{folder.name}/app.log", str(tmp_path / "app.log"), str(tmp_path / "app.log"))
+    assert (tmp_path / "app.log").read_bytes() == new
+    assert not os.path.exists(str(tmp_path / "app.log") + ".delta-tmp")
+    downloaded = int(capsys.readouterr().out.split("downloaded ")[1].split()[0])
+    assert downloaded < len(new) // 4
+
+    # Without an old copy everything is downloaded
+    client.delta_fetch(f"{server[0]}/{folder.name}/app.log", str(tmp_path / "none"), str(tmp_path / "fresh"))
+    assert (tmp_path / "fresh").read_bytes() == new
@@ -0,0 +1,61 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "APP_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def put(cache, key, size):
+    temp = cache.temp_path()
+    with open(temp, "wb") as f:
+        f.write(b"x" * size)
+    return cache.put_file(key, temp)
+
+
+def used(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if not entry.name.endswith(".tmp"))
+
+
+def test_budget_holds_across_processes_sharing_the_directory(cache_dir, monkeypatch):
+    monkeypatch.setattr(main, "DISK_CACHE_RESCAN_INTERVAL", 0)
+    # Two instances over one directory, as in two worker processes
+    workers = [main.DiskCache("shared", 10_000), main.DiskCache("shared", 10_000)]
+    for i in range(20):
+        put(workers[i % 2], ("file", i), 1000)
+        assert used(cache_dir / "shared") <= 10_000
+    assert workers[0].get(("file", 19)) or workers[1].get(("file", 19))
+
+
+def test_budget_evicts_least_recently_used_across_processes(cache_dir, monkeypatch):
+    monkeypatch.setattr(main, "DISK_CACHE_RESCAN_INTERVAL", 0)
+    first, second = main.DiskCache("shared", 3000), main.DiskCache("shared", 3000)
+    put(first, "a", 1000)
+    put(first, "b", 1000)
+    put(second, "c", 1000)
+    path = first.get("a")   # now the most recently used, for both
+    past = time.time() - 60
+    os.utime(first.get("b"), (past, past))
+    put(second, "d", 1000)
+    assert os.path.exists(path)
+    assert first.get("b") is None
+
+
+def test_opening_keeps_recent_temporary_files(cache_dir):
+    directory = cache_dir / "shared"
+    directory.mkdir()
+    fresh, stale = directory / "fresh.tmp", directory / "stale.tmp"
+    fresh.write_bytes(b"in progress elsewhere")
+    stale.write_bytes(b"left by a crash")
+    past = time.time() - main.DISK_CACHE_STALE_TEMP - 60
+    os.utime(stale, (past, past))
+    main.DiskCache("shared", 10_000).get("anything")
+    assert fresh.exists()
+    assert not stale.exists()
@@ -0,0 +1,122 @@
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def sizes(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "c").mkdir()
+    (tmp_path / "top.bin").write_bytes(b"x" * 10)
+    (tmp_path / "a" / "one.bin").write_bytes(b"x" * 100)
+    (tmp_path / "a" / "b" / "two.bin").write_bytes(b"x" * 1000)
+    (tmp_path / "a" / "b" / "three.bin").write_bytes(b"x" * 1)
+    # Neither temporary uploads nor symlinks are counted
+    (tmp_path / "a" / ".upload-x.part").write_bytes(b"x" * 5000)
+    os.symlink(tmp_path / "a", tmp_path / "c" / "link")
+    sizes = main.FolderSizes()
+    sizes.start(str(tmp_path))
+    wait_for(lambda: sizes.stats()["ready"])
+    yield sizes
+    sizes.stop()
+
+
+def test_totals(sizes):
+    assert sizes.get("") == (1111, 4)
+    assert sizes.get("a") == (1101, 3)
+    assert sizes.get("a/b") == (1001, 2)
+    assert sizes.get("c") == (0, 0)
+    assert sizes.children("a") == {"b": (1001, 2)}
+    assert sizes.children("missing") is None
+    stats = sizes.stats()
+    assert (stats["bytes"], stats["files"], stats["folders"]) == (1111, 4, 4)
+
+
+def test_relative(sizes, tmp_path):
+    assert sizes.relative(str(tmp_path)) == ""
+    assert sizes.relative(str(tmp_path / "a" / "b")) == "a/b"
+    assert sizes.relative(str(tmp_path.parent)) is None
+
+
+def test_changes_are_carried_up(sizes, tmp_path):
+    generations = {folder: sizes.generation(folder) for folder in ["", "a", "a/b", "c"]}
+    (tmp_path / "a" / "b" / "two.bin").write_bytes(b"x" * 2000)
+    sizes.invalidate("a/b")
+    wait_for(lambda: sizes.get("") == (2111, 4))
+    assert sizes.get("a") == (2101, 3)
+    # Every listing showing a changed figure gets a new ETag; the others keep theirs
+    assert sizes.generation("a/b") > generations["a/b"]
+    assert sizes.generation("a") > generations["a"]
+    assert sizes.generation("") > generations[""]
+    assert sizes.generation("c") == generations["c"]
+    # Only the changed folder was read again
+    assert sizes.stats()["folders_read"] == 5
+
+
+def test_new_and_removed_folders(sizes, tmp_path):
+    (tmp_path / "c" / "new").mkdir()
+    (tmp_path / "c" / "new" / "f.bin").write_bytes(b"x" * 50)
+    sizes.invalidate("c")
+    wait_for(lambda: sizes.get("") == (1161, 5))
+    assert sizes.get("c/new") == (50, 1)
+
+    for name in ["two.bin", "three.bin"]:
+        (tmp_path / "a" / "b" / name).unlink()
+    (tmp_path / "a" / "b").rmdir()
+    sizes.invalidate("a/b")
+    wait_for(lambda: sizes.get("") == (160, 3))
+    assert sizes.get("a/b") is None
+    assert sizes.children("a") == {}
+
+
+def test_seeded_start_reads_nothing(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "f.bin").write_bytes(b"x" * 7)
+    sizes = main.FolderSizes()
+    sizes.start(str(tmp_path), seeded=True)
+    try:
+        for folder in ["", "a"]:
+            sizes.seed(folder, main.read_folder(str(tmp_path / folder)))
+        sizes.seeded()
+        wait_for(lambda: sizes.stats()["ready"])
+        assert sizes.get("") == (7, 1)
+        assert sizes.stats()["folders_read"] == 0
+    finally:
+        sizes.stop()
+
+
+def test_sizes_api(fetch, folder):
+    (folder / "sub").mkdir()
+    (folder / "sub" / "f.bin").write_bytes(b"x" * 300)
+
+    def sizes():
+        response, body = fetch("GET", f"/api/sizes?path={folder.name}")
+        assert response.status == 200
+        return json.loads(body)
+
+    wait_for(lambda: sizes()["children"].get("sub") is not None)
+    result = sizes()
+    assert result["ready"]
+    assert (result["size"], result["files"]) == (300, 1)
+    assert result["children"] == {"sub": {"size": 300, "files": 1}}
+
+    _, body = fetch("GET", f"/{folder.name}/")
+    assert "300.0 B • 1 files".encode() in body
+
+
+@pytest.mark.parametrize("path, status", [("../etc", 403), ("no-such-folder", 404)], ids=["escape", "missing"])
+def test_sizes_api_rejects(fetch, path, status):
+    response, _ = fetch("GET", f"/api/sizes?path={path}")
+    assert response.status == status
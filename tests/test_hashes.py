@@ -0,0 +1,171 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.fixture
+def hashes(tmp_path):
+    hashes = main.ContentHashes(str(tmp_path / "cache" / "digests.log"))
+    yield hashes
+    hashes.shutdown()
+
+
+@pytest.fixture
+def served_hashes(tmp_path, monkeypatch):
+    """Point the server's digest cache at an empty journal"""
+    monkeypatch.setattr(main.content_hashes, "journal", str(tmp_path / "digests.log"))
+    monkeypatch.setattr(main.content_hashes, "_digests", main.OrderedDict())
+    monkeypatch.setattr(main.content_hashes, "_journal_id", None)
+    return main.content_hashes
+
+
+@pytest.mark.parametrize("size", [0, 1000, main.HASH_MMAP_MIN + 12345], ids=["empty", "read", "mapped"])
+@pytest.mark.parametrize("algorithm", main.HASH_ALGORITHMS)
+def test_hash_file(tmp_path, size, algorithm):
+    data = os.urandom(size)
+    (tmp_path / "f").write_bytes(data)
+    assert main.hash_file(str(tmp_path / "f"), algorithm) == hashlib.new(algorithm, data).hexdigest()
+
+
+def test_digests_are_computed_once(hashes, tmp_path):
+    (tmp_path / "f").write_bytes(b"hello")
+    expected = hashlib.sha256(b"hello").hexdigest()
+    hexdigest, st, cached = hashes.get(str(tmp_path / "f"), "sha256")
+    assert (hexdigest, st.st_size, cached) == (expected, 5, False)
+    assert hashes.get(str(tmp_path / "f"), "sha256")[2] is True
+    assert (hashes.stats()["computed"], hashes.stats()["hits"]) == (1, 1)
+
+    # A new version of the file misses
+    (tmp_path / "f").write_bytes(b"hello, again")
+    hexdigest, _, cached = hashes.get(str(tmp_path / "f"), "sha256")
+    assert (hexdigest, cached) == (hashlib.sha256(b"hello, again").hexdigest(), False)
+
+
+def test_concurrent_requests_share_one_computation(hashes, tmp_path, monkeypatch):
+    (tmp_path / "f").write_bytes(b"x" * 1000)
+    started = threading.Event()
+    release = threading.Event()
+    real_hash_file = main.hash_file
+
+    def slow_hash_file(path, algorithm):
+        started.set()
+        release.wait(5)
+        return real_hash_file(path, algorithm)
+    monkeypatch.setattr(main, "hash_file", slow_hash_file)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(hashes.get(str(tmp_path / "f"), "md5")[0]))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [hashlib.md5(b"x" * 1000).hexdigest()] * 4
+    assert hashes.stats()["computed"] == 1
+
+
+def test_journal_survives_restarts(hashes, tmp_path):
+    (tmp_path / "f").write_bytes(b"data")
+    hexdigest = hashes.get(str(tmp_path / "f"), "blake2b")[0]
+    st = os.stat(tmp_path / "f")
+
+    # Another process (or the next run) reads the journal
+    other = main.ContentHashes(hashes.journal)
+    assert other.known(st, "blake2b", sync=True) == hexdigest
+    assert other.get(str(tmp_path / "f"), "blake2b")[2] is True
+    assert other.stats()["computed"] == 0
+
+    # And sees lines appended after its first look
+    other.record(os.stat(tmp_path), "md5", "0" * 32)
+    assert hashes.known(os.stat(tmp_path), "md5", sync=True) == "0" * 32
+
+
+def test_journal_is_compacted(hashes, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "HASH_CACHE_ENTRIES", 2)
+    st = os.stat(tmp_path)
+    for i in range(5):
+        hashes.record(st, "md5", f"{i:032x}")
+    with open(hashes.journal) as f:
+        lines = f.read().splitlines()
+    assert len(lines) <= 4
+    assert lines[-1].endswith(f"{4:032x}")
+    assert main.ContentHashes(hashes.journal).known(st, "md5", sync=True) == f"{4:032x}"
+
+
+def test_file_changing_while_hashed_is_not_remembered(hashes, tmp_path, monkeypatch):
+    (tmp_path / "f").write_bytes(b"before")
+    real_hash_file = main.hash_file
+
+    def racing_hash_file(path, algorithm):
+        result = real_hash_file(path, algorithm)
+        with open(path, "ab") as f:
+            f.write(b" and after")
+        return result
+    monkeypatch.setattr(main, "hash_file", racing_hash_file)
+    hashes.get(str(tmp_path / "f"), "sha256")
+    assert hashes.stats()["known"] == 0
+    assert not os.path.exists(hashes.journal)
+
+
+def test_digest_headers(hashes, tmp_path):
+    (tmp_path / "f").write_bytes(b"abc")
+    st = os.stat(tmp_path / "f")
+    assert hashes.digest_headers(st) == []
+    hashes.get(str(tmp_path / "f"), "sha256")
+    hashes.get(str(tmp_path / "f"), "md5")
+    hashes.get(str(tmp_path / "f"), "blake2b")
+    sha256 = base64.b64encode(hashlib.sha256(b"abc").digest()).decode()
+    md5 = base64.b64encode(hashlib.md5(b"abc").digest()).decode()
+    assert hashes.digest_headers(st) == [
+        ("Repr-Digest", f"sha-256=:{sha256}:"),
+        ("Digest", f"SHA-256={sha256}, MD5={md5}"),
+    ]
+
+
+def test_hash_api(fetch, folder, served_hashes):
+    data = os.urandom(3000)
+    (folder / "f.bin").write_bytes(data)
+    response, body = fetch("GET", f"/api/hash/{folder.name}/f.bin?algo=md5")
+    assert response.status == 200
+    result = json.loads(body)
+    assert (result["digest"], result["algorithm"], result["size"], result["cached"]) == (
+        hashlib.md5(data).hexdigest(), "md5", 3000, False)
+    assert json.loads(fetch("GET", f"/api/hash/{folder.name}/f.bin?algo=md5")[1])["cached"]
+
+    # Downloads carry the digests known by now, and never wait for one
+    response, _ = fetch("GET", f"/{folder.name}/f.bin")
+    assert response.getheader("Digest") == "MD5=" + base64.b64encode(hashlib.md5(data).digest()).decode()
+    assert response.getheader("Repr-Digest") is None
+
+
+def test_verified_uploads_are_known(fetch, folder, served_hashes):
+    data = os.urandom(2000)
+    digest = hashlib.sha256(data).hexdigest()
+    _, body = fetch("POST", "/api/upload", json.dumps({"path": folder.name, "name": "up.bin", "size": 2000}))
+    url = "/api/upload/" + json.loads(body)["id"]
+    fetch("PUT", f"{url}?offset=0", data)
+    response, _ = fetch("POST", f"{url}/finish", json.dumps({"sha256": digest}))
+    assert response.status == 201
+    result = json.loads(fetch("GET", f"/api/hash/{folder.name}/up.bin")[1])
+    assert (result["digest"], result["cached"]) == (digest, True)
+
+
+@pytest.mark.parametrize("path, status", [
+    ("{folder}/f.bin?algo=sha1", 400),
+    ("../etc/passwd", 403),
+    ("{folder}/missing.bin", 404),
+    ("{folder}", 404),
+], ids=["algo", "escape", "missing", "folder"])
+def test_hash_api_rejects(fetch, folder, path, status):
+    (folder / "f.bin").write_bytes(b"x")
+    response, _ = fetch("GET", "/api/hash/" + path.format(folder=folder.name))
+    assert response.status == status
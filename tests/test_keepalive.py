@@ -0,0 +1,113 @@
+import socket
+import urllib.parse
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.fixture
+def connect(server):
+    """connect() -> (socket, file) on a fresh raw connection to the server"""
+    host, port = urllib.parse.urlsplit(server[0]).netloc.split(":")
+    opened = []
+
+    def connect():
+        sock = socket.create_connection((host, int(port)), timeout=5)
+        opened.append(sock)
+        return sock, sock.makefile("rb")
+    yield connect
+    for sock in opened:
+        sock.close()
+
+
+def read_response(f):
+    """(status, headers, body) of the next response, framed by its Content-Length"""
+    status = int(f.readline().split()[1])
+    headers = {}
+    while True:
+        line = f.readline().decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, f.read(int(headers.get("content-length", 0)))
+
+
+def closed(f):
+    try:
+        return f.read(1) == b""
+    except socket.timeout:
+        return False
+
+
+def test_requests_share_one_connection(connect, folder):
+    (folder / "a.txt").write_bytes(b"a")
+    sock, f = connect()
+    for n in range(1, 4):
+        sock.sendall(f"GET /{folder.name}/a.txt HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        status, headers, body = read_response(f)
+        assert (status, body) == (200, b"a")
+        assert headers["keep-alive"] == f"timeout={main.KEEPALIVE_IDLE_TIMEOUT}, max={main.KEEPALIVE_MAX_REQUESTS - n}"
+
+
+def test_pipelined_requests(connect, folder):
+    (folder / "a.txt").write_bytes(b"a")
+    sock, f = connect()
+    request = f"GET /{folder.name}/a.txt HTTP/1.1\r\nHost: x\r\n\r\n".encode()
+    sock.sendall(request * 3)
+    assert [read_response(f)[2] for _ in range(3)] == [b"a"] * 3
+
+
+@pytest.mark.parametrize("request_head", [
+    "GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n",
+    "GET / HTTP/1.0\r\n\r\n",
+])
+def test_connection_closes_when_asked(connect, request_head):
+    sock, f = connect()
+    sock.sendall(request_head.encode())
+    status, headers, _ = read_response(f)
+    assert status == 200
+    assert "keep-alive" not in headers
+    assert closed(f)
+
+
+def test_not_found_keeps_the_connection(connect):
+    sock, f = connect()
+    sock.sendall(b"GET /no-such-file HTTP/1.1\r\nHost: x\r\n\r\nGET / HTTP/1.1\r\nHost: x\r\n\r\n")
+    assert read_response(f)[0] == 404
+    assert read_response(f)[0] == 200
+
+
+def test_malformed_request_closes_the_connection(connect):
+    sock, f = connect()
+    sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\nX-Long: " + b"x" * 70000 + b"\r\n\r\n")
+    status, headers, _ = read_response(f)
+    assert status == 431
+    assert closed(f)
+
+
+def test_unused_body_is_drained(connect):
+    sock, f = connect()
+    sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\nContent-Length: 5\r\n\r\nhello"
+                 b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+    assert read_response(f)[0] == 200
+    assert read_response(f)[0] == 200
+
+
+def test_connection_closes_after_its_quota(connect, monkeypatch):
+    monkeypatch.setattr(main, "KEEPALIVE_MAX_REQUESTS", 2)
+    sock, f = connect()
+    sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n" * 2)
+    assert "connection" not in read_response(f)[1]
+    assert read_response(f)[1]["connection"] == "close"
+    assert closed(f)
+
+
+def test_idle_connection_times_out(connect, monkeypatch):
+    monkeypatch.setattr(main.EnhancedHTTPHandler, "timeout", 0.5)
+    sock, f = connect()
+    sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+    assert read_response(f)[0] == 200
+    assert closed(f)
@@ -0,0 +1,116 @@
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+# ----------------------------------------------------------------------------
+# Listing cache
+# ----------------------------------------------------------------------------
+def test_cache_hit_needs_the_same_validator():
+    cache = main.ListingCache(compress=False)
+    assert cache.get("k", "v1") is None
+    cache.put("k", "v1", b"body")
+    assert cache.get("k", "v1") == (b"body", {})
+    # A changed directory drops the stale rendering
+    assert cache.get("k", "v2") is None
+    assert cache.get("k", "v1") is None
+    assert cache.stats()["entries"] == 0
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 3)
+
+
+def test_cache_evicts_least_recently_used_by_count():
+    cache = main.ListingCache(max_entries=2, compress=False)
+    cache.put("a", "v", b"a")
+    cache.put("b", "v", b"b")
+    cache.get("a", "v")
+    cache.put("c", "v", b"c")
+    assert cache.get("b", "v") is None
+    assert cache.get("a", "v") and cache.get("c", "v")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_evicts_by_bytes_and_skips_oversized_bodies():
+    cache = main.ListingCache(max_bytes=100, compress=False)
+    cache.put("a", "v", b"x" * 60)
+    cache.put("b", "v", b"x" * 60)
+    assert cache.get("a", "v") is None
+    assert cache.stats()["bytes"] == 60
+    assert cache.put("big", "v", b"x" * 101) == (b"x" * 101, {})
+    assert cache.get("big", "v") is None
+
+
+def test_cache_keeps_compressed_variants():
+    cache = main.ListingCache()
+    body = b"<tr><td>row</td></tr>\n" * 500
+    _, variants = cache.put("k", "v", body)
+    assert set(variants) == set(main.supported_encodings())
+    assert all(len(data) < len(body) for data in variants.values())
+    assert cache.get("k", "v")[1] == variants
+
+
+def test_invalidate_folder_drops_every_rendering(tmp_path):
+    cache = main.ListingCache(compress=False)
+    cache.put((str(tmp_path), "/x/", False), "v", b"1")
+    cache.put((str(tmp_path) + "/", "/x/", True), "v", b"2")
+    cache.put((str(tmp_path / "other"), "/x/other/", False), "v", b"3")
+    cache.invalidate_folder(str(tmp_path))
+    assert cache.stats()["entries"] == 1
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+
+
+def test_repeated_listing_is_served_from_the_cache(fetch, folder):
+    (folder / "a.txt").write_bytes(b"a")
+    fetch("GET", f"/{folder.name}/")
+    hits = main.listing_cache.stats()["hits"]
+    response, body = fetch("GET", f"/{folder.name}/")
+    assert response.status == 200
+    assert b"a.txt" in body
+    assert main.listing_cache.stats()["hits"] == hits + 1
+
+    (folder / "b.txt").write_bytes(b"b")
+    response, body = fetch("GET", f"/{folder.name}/")
+    assert b"b.txt" in body
+
+
+# ----------------------------------------------------------------------------
+# scandir listing engine
+# ----------------------------------------------------------------------------
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "b.txt").write_bytes(b"12345")
+    (tmp_path / "A.txt").write_bytes(b"")
+    (tmp_path / "zdir").mkdir()
+    (tmp_path / "Cdir").mkdir()
+    (tmp_path / (main.UPLOAD_TEMP_PREFIX + "x.part")).write_bytes(b"unfinished")
+    (tmp_path / "broken").symlink_to(tmp_path / "missing")
+    (tmp_path / "link").symlink_to(tmp_path / "zdir")
+    return tmp_path
+
+
+def test_scan_directory_sorts_folders_first(tree):
+    entries = main.scan_directory(str(tree))
+    assert [e.name for e in entries] == ["Cdir", "link", "zdir", "A.txt", "b.txt"]
+    by_name = {e.name: e for e in entries}
+    assert by_name["link"].is_dir
+    assert not by_name["b.txt"].is_dir
+    assert by_name["b.txt"].size == 5
+    assert by_name["b.txt"].mtime == (tree / "b.txt").stat().st_mtime
+
+
+def test_read_folder_does_not_follow_symlinks(tree):
+    read = main.read_folder(str(tree))
+    assert sorted(read.names) == ["A.txt", "Cdir", "b.txt", "broken", "link", "zdir"]
+    assert sorted(read.subdirs) == ["Cdir", "zdir"]
+    assert (read.bytes, read.files) == (5, 2)
+    assert read.mtime_ns == tree.stat().st_mtime_ns
+    assert main.read_folder(str(tree / "missing")) is None
+
+
+def test_listing_page_leaves_out_unfinished_uploads(fetch, folder):
+    (folder / "done.txt").write_bytes(b"done")
+    (folder / (main.UPLOAD_TEMP_PREFIX + "y.part")).write_bytes(b"unfinished")
+    response, body = fetch("GET", f"/{folder.name}/")
+    assert b"done.txt" in body
+    assert main.UPLOAD_TEMP_PREFIX.encode() not in body
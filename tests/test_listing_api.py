@@ -0,0 +1,89 @@
+import json
+import os
+import urllib.parse
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.fixture
+def listed(fetch, folder):
+    """A folder with three files of distinct sizes and mtimes and one subfolder"""
+    for index, (name, size) in enumerate([("b.txt", 30), ("A.txt", 10), ("c.txt", 20)]):
+        (folder / name).write_bytes(b"x" * size)
+        os.utime(folder / name, (1_000_000 + index, 1_000_000 + index))
+    (folder / "sub").mkdir()
+
+    def api(**params):
+        params.setdefault("path", folder.name)
+        response, body = fetch("GET", "/api/list?" + urllib.parse.urlencode(params))
+        return response, body
+    return api, folder
+
+
+def names(body):
+    return [entry["name"] for entry in json.loads(body)["entries"]]
+
+
+@pytest.mark.parametrize("params, expected", [
+    ({}, ["A.txt", "b.txt", "c.txt", "sub"]),
+    ({"order": "desc"}, ["sub", "c.txt", "b.txt", "A.txt"]),
+    ({"sort": "mtime"}, ["b.txt", "A.txt", "c.txt", "sub"]),
+    ({"offset": "1", "limit": "2"}, ["b.txt", "c.txt"]),
+    ({"offset": "9"}, []),
+])
+def test_sorting_and_paging(listed, params, expected):
+    api, _ = listed
+    response, body = api(**params)
+    assert response.status == 200
+    assert names(body) == expected
+    assert json.loads(body)["total"] == 4
+
+
+def test_sort_by_size(listed):
+    api, _ = listed
+    response, body = api(sort="size", order="desc")
+    # The subfolder's own size depends on the filesystem
+    assert [name for name in names(body) if name != "sub"] == ["b.txt", "c.txt", "A.txt"]
+
+
+def test_entries_describe_the_files(listed):
+    api, folder = listed
+    response, body = api()
+    assert response.getheader("Content-Type").startswith("application/json")
+    page = json.loads(body)
+    assert (page["path"], page["offset"], page["limit"]) == (folder.name, 0, main.API_LIST_DEFAULT_LIMIT)
+    entry = page["entries"][0]
+    assert entry == {"name": "A.txt", "path": f"{folder.name}/A.txt", "type": "file",
+                     "size": 10, "mtime": 1_000_001}
+    assert page["entries"][-1]["type"] == "dir"
+
+
+@pytest.mark.parametrize("params, status", [
+    ({"offset": "x"}, 400),
+    ({"sort": "color"}, 400),
+    ({"order": "up"}, 400),
+    ({"path": "../.."}, 403),
+    ({"path": "no-such-folder"}, 404),
+])
+def test_bad_requests(listed, params, status):
+    api, _ = listed
+    response, body = api(**params)
+    assert response.status == status
+    assert "error" in json.loads(body)
+
+
+def test_ndjson_streams_entries(listed, fetch):
+    api, folder = listed
+    response, body = api(format="ndjson")
+    assert response.getheader("Content-Type").startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in body.decode().splitlines()]
+    assert sorted(entry["name"] for entry in lines) == ["A.txt", "b.txt", "c.txt", "sub"]
+
+    response, body = api(format="ndjson", offset="1", limit="2")
+    assert len(body.decode().splitlines()) == 2
+
+    response, body = fetch("GET", f"/api/list?path={folder.name}", headers={"Accept": "application/x-ndjson"})
+    assert len(body.decode().splitlines()) == 4
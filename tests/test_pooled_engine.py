@@ -0,0 +1,109 @@
+import http.client
+import http.server
+import json
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """/block waits until the test releases it; anything else answers at once"""
+
+    protocol_version = "HTTP/1.1"
+    timeout = 10
+    release = None
+
+    def do_GET(self):
+        if self.path == "/block":
+            self.release.wait(10)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def pool():
+    """A pooled server with one worker and room for one queued connection"""
+    Handler.release = threading.Event()
+    server = main.PooledHTTPServer(("127.0.0.1", 0), Handler, max_workers=1, queue_size=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        Handler.release.set()
+        server.shutdown()
+        server.server_close()
+
+
+def connect(server):
+    return http.client.HTTPConnection(*server.server_address, timeout=10)
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_excess_load_is_shed_with_503(pool):
+    busy, queued, shed = connect(pool), connect(pool), connect(pool)
+    busy.request("GET", "/block")
+    wait_for(lambda: pool.stats()["busy_workers"] == 1)
+    queued.request("GET", "/")
+    wait_for(lambda: pool.stats()["queue_depth"] == 1)
+
+    shed.request("GET", "/")
+    response = shed.getresponse()
+    assert response.status == 503
+    assert response.getheader("Retry-After") == str(main.POOL_RETRY_AFTER)
+    assert response.read() == main._BUSY_BODY
+
+    Handler.release.set()
+    for conn in (busy, queued):
+        response = conn.getresponse()
+        assert (response.status, response.read()) == (200, b"ok")
+    stats = pool.stats()
+    assert (stats["rejected"], stats["queue_capacity"], stats["workers"]) == (1, 1, 1)
+
+
+def test_idle_keep_alive_connections_hold_no_worker(pool):
+    connections = [connect(pool) for _ in range(5)]
+    for _ in range(2):
+        for conn in connections:
+            conn.request("GET", "/")
+            response = conn.getresponse()
+            assert response.read() == b"ok"
+            assert not response.will_close
+    wait_for(lambda: pool.stats()["idle_connections"] == 5)
+    assert pool.stats()["busy_workers"] == 0
+    assert pool.stats()["served"] >= 5
+    for conn in connections:
+        conn.close()
+
+
+def test_status_reports_the_pool(tmp_path):
+    cwd = os.getcwd()
+    manager = main.ServerManager()
+    ok, message = manager.start(str(tmp_path), 0, "pooled")
+    assert ok, message
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", manager.server.server_address[1], timeout=10)
+        conn.request("GET", "/api/status")
+        status = json.loads(conn.getresponse().read())["server"]
+        assert status["engine"] == "pooled"
+        assert status["workers"] == main.POOL_MAX_WORKERS
+        conn.close()
+    finally:
+        manager.stop()
+        os.chdir(cwd)
@@ -0,0 +1,133 @@
+import email.utils
+import os
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("items=0-5", None),
+    ("bytes=", None),
+    ("bytes=5-2", None),
+    ("bytes=a-b", None),
+    ("bytes=-", None),
+    ("bytes=0-0", [(0, 0)]),
+    ("bytes=10-", [(10, 99)]),
+    ("bytes=-10", [(90, 99)]),
+    ("bytes=-500", [(0, 99)]),
+    ("bytes=90-500", [(90, 99)]),
+    ("bytes=0-9, 5-19, 30-39", [(0, 19), (30, 39)]),
+    ("bytes=20-29,10-19", [(10, 29)]),
+    ("bytes=100-200", []),
+    ("bytes=-0", []),
+])
+def test_parse_range_header(header, expected):
+    assert main.parse_range_header(header, 100) == expected
+
+
+def test_parse_range_header_caps_parts():
+    spec = ",".join(f"{i * 2}-{i * 2}" for i in range(main.MAX_RANGES + 1))
+    assert main.parse_range_header("bytes=" + spec, 1000) is None
+
+
+@pytest.fixture
+def served_file(fetch, folder):
+    """(get, data, stat) for a binary file; get(headers) fetches it"""
+    data = bytes(range(256)) * 40
+    path = folder / "data.bin"
+    path.write_bytes(data)
+    return (lambda headers: fetch("GET", f"/{folder.name}/data.bin", headers=headers)), data, os.stat(path)
+
+
+def test_single_range(served_file):
+    get, data, _ = served_file
+    response, body = get({"Range": "bytes=100-199"})
+    assert response.status == 206
+    assert response.getheader("Content-Range") == f"bytes 100-199/{len(data)}"
+    assert body == data[100:200]
+
+
+def test_suffix_range(served_file):
+    get, data, _ = served_file
+    response, body = get({"Range": "bytes=-16"})
+    assert response.status == 206
+    assert body == data[-16:]
+
+
+def test_multiple_ranges(served_file):
+    get, data, _ = served_file
+    response, body = get({"Range": "bytes=0-9,1000-1009"})
+    assert response.status == 206
+    content_type = response.getheader("Content-Type")
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    boundary = content_type.split("boundary=")[1].encode()
+    parts = [part for part in body.split(b"--" + boundary) if part.strip(b"\r\n-")]
+    assert len(parts) == 2
+    assert parts[0].endswith(b"\r\n\r\n" + data[0:10] + b"\r\n")
+    assert b"Content-Range: bytes 1000-1009/%d" % len(data) in parts[1]
+    assert parts[1].endswith(b"\r\n\r\n" + data[1000:1010] + b"\r\n")
+    assert int(response.getheader("Content-Length")) == len(body)
+
+
+def test_unsatisfiable_range(served_file):
+    get, data, _ = served_file
+    response, body = get({"Range": f"bytes={len(data)}-"})
+    assert response.status == 416
+    assert response.getheader("Content-Range") == f"bytes */{len(data)}"
+    assert body == b""
+
+
+def test_malformed_range_sends_everything(served_file):
+    get, data, _ = served_file
+    response, body = get({"Range": "bytes=9-1"})
+    assert response.status == 200
+    assert body == data
+
+
+def test_if_range_with_current_date(served_file):
+    get, data, st = served_file
+    headers = {"Range": "bytes=0-9", "If-Range": email.utils.formatdate(st.st_mtime, usegmt=True)}
+    response, body = get(headers)
+    assert response.status == 206
+    assert body == data[:10]
+
+
+def test_if_range_with_other_date_sends_everything(served_file):
+    get, data, st = served_file
+    headers = {"Range": "bytes=0-9", "If-Range": email.utils.formatdate(st.st_mtime - 3600, usegmt=True)}
+    response, body = get(headers)
+    assert response.status == 200
+    assert body == data
+
+
+def test_if_range_with_current_etag(served_file):
+    get, data, st = served_file
+    response, _ = get({})
+    assert response.getheader("ETag") == main.file_etag(st)
+    assert not main.file_etag(st).startswith("W/")
+    response, body = get({"Range": "bytes=0-9", "If-Range": main.file_etag(st)})
+    assert response.status == 206
+    assert body == data[:10]
+
+
+@pytest.mark.parametrize("validator", ["weak", "stale"])
+def test_if_range_with_weak_or_stale_etag_sends_everything(served_file, validator):
+    get, data, st = served_file
+    etag = "W/" + main.file_etag(st) if validator == "weak" else '"0-0-0"'
+    response, body = get({"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status == 200
+    assert body == data
+
+
+def test_compressed_response_has_weak_etag(fetch, folder):
+    (folder / "page.html").write_text("<p>hello</p>\n" * 500)
+    etag = main.file_etag(os.stat(folder / "page.html"))
+    response, _ = fetch("GET", f"/{folder.name}/page.html", headers={"Accept-Encoding": "gzip"})
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert response.getheader("ETag") == "W/" + etag
+    response, _ = fetch("GET", f"/{folder.name}/page.html", headers={"If-None-Match": "W/" + etag})
+    assert response.status == 304
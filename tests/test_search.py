@@ -0,0 +1,110 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def index(tmp_path):
+    (tmp_path / "music" / "live").mkdir(parents=True)
+    for path in ["Report 2024.pdf", "music/report-draft.txt", "music/live/Encore Report.mp3", "music/song.mp3"]:
+        (tmp_path / path).write_bytes(b"x")
+    index = main.SearchIndex(refresh_interval=3600)
+    index.start(str(tmp_path))
+    wait_for(lambda: index.ready)
+    yield index
+    index.stop()
+
+
+def test_substring_search(index):
+    matches, truncated = index.search("REPORT")
+    assert not truncated
+    # Shallower folders first
+    assert matches[0] == ("", "Report 2024.pdf")
+    assert set(matches) == {("", "Report 2024.pdf"), ("music", "report-draft.txt"),
+                            ("music/live", "Encore Report.mp3")}
+    assert index.search("report mp3")[0] == [("music/live", "Encore Report.mp3")]
+    assert index.search("   ") == ([], False)
+
+
+def test_prefix_search(index):
+    assert set(index.search("report", prefix=True)[0]) == {("", "Report 2024.pdf"), ("music", "report-draft.txt")}
+    assert index.search("live", prefix=True)[0] == [("music", "live")]
+
+
+def test_search_below_a_folder_and_limit(index):
+    assert {m[0] for m in index.search("report", base="/music/")[0]} == {"music", "music/live"}
+    assert index.search("report", base="mus")[0] == []
+    matches, truncated = index.search("report", limit=2)
+    assert len(matches) == 2 and truncated
+
+
+def test_refresh_rescans_changed_folders(index, tmp_path):
+    (tmp_path / "music" / "report-draft.txt").rename(tmp_path / "music" / "final.txt")
+    (tmp_path / "music" / "new").mkdir()
+    (tmp_path / "music" / "new" / "report-new.txt").write_bytes(b"x")
+    (tmp_path / "music" / "live" / "Encore Report.mp3").unlink()
+    (tmp_path / "music" / "live").rmdir()
+    index.refresh()
+    assert set(index.search("report")[0]) == {("", "Report 2024.pdf"), ("music/new", "report-new.txt")}
+    assert "music/live" not in index._dirs
+    stats = index.stats()
+    assert stats["refreshes"] == 1 and stats["rescanned_folders"] >= 1
+
+
+def test_indexing_stops_at_the_entry_limit(tmp_path):
+    for i in range(20):
+        (tmp_path / f"d{i}").mkdir()
+        (tmp_path / f"d{i}" / "f").write_bytes(b"")
+    index = main.SearchIndex(max_entries=10)
+    index.start(str(tmp_path))
+    wait_for(lambda: index.ready)
+    index.stop()
+    assert index.stats()["truncated"]
+
+
+def test_search_api(fetch, folder):
+    (folder / "Holiday Photos").mkdir()
+    (folder / "Holiday Photos" / "beach.jpg").write_bytes(b"12345")
+
+    def search(text):
+        response, body = fetch("GET", f"/api/search?q={text}&path={folder.name}")
+        assert response.status == 200
+        return json.loads(body)
+
+    # The watcher brings the new folder into the index
+    wait_for(lambda: search("beach")["results"])
+    result = search("BEACH")
+    assert result["ready"] and not result["truncated"]
+    assert result["results"] == [{
+        "name": "beach.jpg",
+        "path": f"{folder.name}/Holiday Photos/beach.jpg",
+        "type": "file",
+        "size": 5,
+        "mtime": (folder / "Holiday Photos" / "beach.jpg").stat().st_mtime,
+    }]
+
+    # Deleted files drop out even before the index catches up
+    (folder / "Holiday Photos" / "beach.jpg").unlink()
+    assert search("beach")["results"] == []
+
+
+@pytest.mark.parametrize("query, status", [
+    ("", 400),
+    ("q=x&mode=regex", 400),
+    ("q=x&limit=many", 400),
+    ("q=x&path=../etc", 403),
+], ids=["no-query", "mode", "limit", "escape"])
+def test_search_api_rejects(fetch, query, status):
+    response, _ = fetch("GET", "/api/search?" + query)
+    assert response.status == status
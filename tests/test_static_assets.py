@@ -0,0 +1,50 @@
+import gzip
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def test_asset_names_carry_a_content_hash():
+    assert set(main.STATIC_ASSET_URLS) == {"listing.css", "listing.js"}
+    for url in main.STATIC_ASSET_URLS.values():
+        name = url[len(main.STATIC_URL_PREFIX):]
+        data, _, _ = main.STATIC_ASSETS[name]
+        assert name.split(".")[1] == main.hashlib.sha256(data).hexdigest()[:12]
+
+
+def test_listing_links_the_assets(fetch, folder):
+    _, body = fetch("GET", f"/{folder.name}/")
+    for url in main.STATIC_ASSET_URLS.values():
+        assert url.encode() in body
+
+
+@pytest.mark.parametrize("asset", ["listing.css", "listing.js"])
+def test_asset_is_cached_forever(fetch, asset):
+    url = main.STATIC_ASSET_URLS[asset]
+    data, content_type, _ = main.STATIC_ASSETS[url[len(main.STATIC_URL_PREFIX):]]
+    response, body = fetch("GET", url)
+    assert response.status == 200
+    assert body == data
+    assert response.getheader("Content-Type") == content_type
+    assert response.getheader("Cache-Control") == IMMUTABLE
+
+    response, body = fetch("GET", url, headers={"If-None-Match": response.getheader("ETag")})
+    assert response.status == 304
+    assert body == b""
+
+    response, body = fetch("GET", url, headers={"Accept-Encoding": "gzip"})
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert gzip.decompress(body) == data
+
+    response, body = fetch("HEAD", url)
+    assert response.getheader("Content-Length") == str(len(data))
+    assert body == b""
+
+
+def test_unknown_asset(fetch):
+    response, _ = fetch("GET", main.STATIC_URL_PREFIX + "listing.000000000000.css")
+    assert response.status == 404
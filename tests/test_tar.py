@@ -0,0 +1,121 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.fixture
+def entries(tmp_path):
+    """(path, arcname, stat) entries, including an empty file and a name too long for ustar"""
+    contents = {
+        "tree/a.txt": b"hello tar\n" * 100,
+        "tree/empty.bin": b"",
+        "tree/block.bin": os.urandom(main.TAR_BLOCK),
+        "tree/" + "déjà-" * 40 + ".txt": b"long unicode name",
+    }
+    result = []
+    for i, (arcname, data) in enumerate(contents.items()):
+        path = tmp_path / f"{i}.bin"
+        path.write_bytes(data)
+        result.append((str(path), arcname, os.stat(path)))
+    return result, contents
+
+
+def read_tar(data, mode="r:"):
+    with tarfile.open(fileobj=io.BytesIO(data), mode=mode) as tar:
+        return {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+
+
+def test_tar_stream_round_trip(entries):
+    entries, contents = entries
+    tar = main.TarStream(entries)
+    out = io.BytesIO()
+    assert tar.write(out) == tar.size() == len(out.getvalue())
+    assert tar.size() % main.TAR_RECORD == 0
+    assert read_tar(out.getvalue()) == contents
+
+
+@pytest.mark.parametrize("start, end", [(0, 0), (100, 5000), (511, 512), (1024, None)])
+def test_tar_stream_byte_ranges(entries, start, end):
+    tar = main.TarStream(entries[0])
+    whole = io.BytesIO()
+    tar.write(whole)
+    part = io.BytesIO()
+    tar.write(part, start, end)
+    assert part.getvalue() == whole.getvalue()[start:None if end is None else end + 1]
+
+
+def test_tar_stream_fails_on_a_changed_file(entries):
+    entries, _ = entries
+    with open(entries[0][0], "ab") as f:
+        f.write(b"more")
+    tar = main.TarStream(entries)
+    out = io.BytesIO()
+    # Growth is cut at the stat'd size; shrinking cannot be hidden
+    tar.write(out)
+    with open(entries[0][0], "wb") as f:
+        f.write(b"less")
+    with pytest.raises(IOError):
+        tar.write(io.BytesIO())
+
+
+@pytest.fixture
+def tree(folder):
+    (folder / "sub").mkdir()
+    (folder / "a.txt").write_bytes(b"alpha" * 1000)
+    (folder / "sub" / "b.bin").write_bytes(os.urandom(70_000))
+    return folder
+
+
+def test_tar_download(fetch, tree):
+    response, body = fetch("GET", f"/download/{tree.name}?format=tar")
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "application/x-tar"
+    assert response.getheader("Content-Length") == str(len(body))
+    assert f'filename="{tree.name}.tar"' in response.getheader("Content-Disposition")
+    members = read_tar(body)
+    assert members[f"{tree.name}/a.txt"] == b"alpha" * 1000
+    assert members[f"{tree.name}/sub/b.bin"] == (tree / "sub" / "b.bin").read_bytes()
+
+
+def test_tar_download_resumes(fetch, tree):
+    response, whole = fetch("GET", f"/download/{tree.name}?format=tar")
+    etag = response.getheader("ETag")
+    response, body = fetch("GET", f"/download/{tree.name}?format=tar",
+                           headers={"Range": "bytes=1000-", "If-Range": etag})
+    assert response.status == 206
+    assert response.getheader("Content-Range") == f"bytes 1000-{len(whole) - 1}/{len(whole)}"
+    assert body == whole[1000:]
+
+    # The tree changed since: start over
+    (tree / "c.txt").write_bytes(b"new")
+    response, body = fetch("GET", f"/download/{tree.name}?format=tar",
+                           headers={"Range": "bytes=1000-", "If-Range": etag})
+    assert response.status == 200
+    assert f"{tree.name}/c.txt" in read_tar(body)
+
+
+def test_tgz_download(fetch, tree):
+    response, body = fetch("GET", f"/download/{tree.name}?format=tgz")
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "application/gzip"
+    assert response.getheader("Content-Length") is None
+    assert read_tar(body, "r:gz")[f"{tree.name}/a.txt"] == b"alpha" * 1000
+
+
+def test_tzst_download(fetch, tree):
+    response, body = fetch("GET", f"/download/{tree.name}?format=tzst")
+    if not main.ZSTD_AVAILABLE:
+        assert response.status == 501
+        return
+    data = main.zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)).read()
+    assert read_tar(data)[f"{tree.name}/a.txt"] == b"alpha" * 1000
+
+
+def test_unknown_archive_format(fetch, tree):
+    response, _ = fetch("GET", f"/download/{tree.name}?format=rar")
+    assert response.status == 400
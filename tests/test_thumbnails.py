@@ -0,0 +1,102 @@
+import concurrent.futures
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("kivy")
+pytest.importorskip("PIL")
+import main  # noqa: E402
+from PIL import Image  # noqa: E402
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "APP_CACHE_DIR", str(tmp_path / "cache"))
+    service = main.ThumbnailService(budget=10 * 1024 * 1024, workers=2)
+    yield service
+    service.shutdown()
+
+
+def call(fn, *args):
+    """fn(*args) on another thread; fails instead of hanging the suite if it deadlocks"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn(*args)), daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), "call deadlocked"
+    return result[0]
+
+
+class InlineExecutor:
+    """Runs every job during submit(), so it is done before add_done_callback"""
+
+    def submit(self, fn, *args):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def image(tmp_path, name="photo.jpg", size=(1200, 800)):
+    path = tmp_path / name
+    Image.new("RGB", size, (10, 120, 200)).save(path)
+    return str(path), os.stat(path)
+
+
+def test_renders_and_caches(service, tmp_path):
+    path, st = image(tmp_path)
+    thumb = call(service.get, path, st, 128)
+    with Image.open(thumb) as rendered:
+        assert rendered.format == "JPEG"
+        assert max(rendered.size) == 128
+    assert call(service.get, path, st, 128) == thumb
+    assert service.stats()["rendered"] == 1
+
+
+def test_edited_image_gets_a_new_thumbnail(service, tmp_path):
+    path, st = image(tmp_path)
+    first = call(service.get, path, st, 128)
+    path, st2 = image(tmp_path, size=(600, 900))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert call(service.get, path, os.stat(path), 128) != first
+
+
+def test_invalid_image_does_not_deadlock(service, tmp_path):
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(b"not an image")
+    st = os.stat(path)
+    assert call(service.get, str(path), st, 128) is None
+    assert call(service.get, str(path), st, 128) is None
+    assert service.stats()["failed"] == 1
+    # Other images still render afterwards
+    good, good_st = image(tmp_path)
+    assert call(service.get, good, good_st, 128) is not None
+
+
+@pytest.mark.parametrize("valid", [True, False])
+def test_render_finished_before_callback(service, tmp_path, monkeypatch, valid):
+    monkeypatch.setattr(service, "_executor", lambda: InlineExecutor())
+    if valid:
+        path, st = image(tmp_path)
+    else:
+        (tmp_path / "broken.jpg").write_bytes(b"nope")
+        path, st = str(tmp_path / "broken.jpg"), os.stat(tmp_path / "broken.jpg")
+    assert (call(service.get, path, st, 256) is not None) == valid
+    assert service.stats()["rendering"] == 0
+    assert (call(service.get, path, st, 256) is not None) == valid
+
+
+def test_concurrent_requests_share_one_render(service, tmp_path):
+    path, st = image(tmp_path)
+    threads = [threading.Thread(target=service.get, args=(path, st, 128)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert service.stats()["rendered"] == 1
@@ -0,0 +1,86 @@
+import io
+import os
+import socket
+import urllib.parse
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+def receive(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+@pytest.mark.skipif(not main.SENDFILE_AVAILABLE, reason="needs os.sendfile")
+def test_transfer_file_uses_sendfile_for_real_files(tmp_path):
+    data = os.urandom(300_000)
+    (tmp_path / "f.bin").write_bytes(data)
+    reports = []
+    a, b = socket.socketpair()
+    with a, b, open(tmp_path / "f.bin", "rb") as f:
+        sent, method = main.transfer_file(a, None, f, 1000, 200_000, lambda *r: reports.append(r))
+        assert receive(b, 200_000) == data[1000:201_000]
+    assert (sent, method) == (200_000, "sendfile")
+    assert reports == [(200_000, "sendfile")]
+
+
+def test_transfer_file_copies_objects_without_a_descriptor():
+    data = os.urandom(600_000)
+    out = io.BytesIO()
+    sent, method = main.transfer_file(None, out, io.BytesIO(data), 100)
+    assert (sent, method) == (len(data) - 100, "buffered copy")
+    assert out.getvalue() == data[100:]
+
+
+def test_transfer_file_stops_at_end_of_file(tmp_path):
+    (tmp_path / "f.bin").write_bytes(b"x" * 10)
+    out = io.BytesIO()
+    with open(tmp_path / "f.bin", "rb") as f:
+        assert main.transfer_file(None, out, f, 4, 100)[0] == 6
+
+
+def test_download_and_head(fetch, folder):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    (folder / "big.bin").write_bytes(data)
+    response, body = fetch("GET", f"/{folder.name}/big.bin")
+    assert response.status == 200
+    assert response.getheader("Content-Length") == str(len(data))
+    assert body == data
+    response, body = fetch("HEAD", f"/{folder.name}/big.bin")
+    assert response.getheader("Content-Length") == str(len(data))
+    assert body == b""
+
+
+def test_file_that_shrinks_while_sent_closes_the_connection(server, folder, monkeypatch):
+    path = folder / "shrinking.bin"
+    path.write_bytes(b"x" * 100_000)
+    original = main.EnhancedHTTPHandler.send_file_body
+
+    def shrink_then_send(self, f, offset=0, count=None, *args, **kwargs):
+        # The headers promised the old size
+        with open(path, "r+b") as g:
+            g.truncate(1000)
+        return original(self, f, offset, count, *args, **kwargs)
+
+    monkeypatch.setattr(main.EnhancedHTTPHandler, "send_file_body", shrink_then_send)
+    netloc = urllib.parse.urlsplit(server[0]).netloc
+    host, port = netloc.split(":")
+    with socket.create_connection((host, int(port)), timeout=5) as sock:
+        sock.sendall(f"GET /{folder.name}/shrinking.bin HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        data = b""
+        while True:
+            chunk = sock.recv(65536)  # Times out if the connection is kept open
+            if not chunk:
+                break
+            data += chunk
+    head, _, body = data.partition(b"\r\n\r\n")
+    assert b"Content-Length: 100000" in head
+    assert len(body) == 1000
@@ -0,0 +1,203 @@
+import hashlib
+import io
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.fixture
+def session_dir(tmp_path, monkeypatch):
+    """Keep resumable-upload sessions in a temporary folder"""
+    path = tmp_path / "sessions"
+    monkeypatch.setattr(main, "UPLOAD_SESSION_DIR", str(path))
+    return path
+
+
+def visible(folder):
+    return sorted(name for name in os.listdir(folder) if not main.is_upload_temp(name))
+
+
+def test_session_state_machine(tmp_path, session_dir):
+    data = os.urandom(1000)
+    session = main.UploadSession.create(str(tmp_path), "big.bin", len(data))
+    assert not session.complete
+    assert session.status()["received"] == []
+
+    # Chunks in any order, overlapping, and across "restarts" (fresh loads)
+    assert session.write_chunk(600, io.BytesIO(data[600:])) == 400
+    session = main.UploadSession.load(session.id)
+    assert session.received == [[600, 1000]]
+    session.write_chunk(0, io.BytesIO(data[:300]))
+    session.write_chunk(200, io.BytesIO(data[200:500]))
+    assert main.UploadSession.load(session.id).received == [[0, 500], [600, 1000]]
+    assert main.UploadSession.find(str(tmp_path), "big.bin", len(data)).id == session.id
+    assert main.UploadSession.find(str(tmp_path), "big.bin", len(data), key="other") is None
+    assert not session.complete
+
+    with pytest.raises(ValueError):
+        session.write_chunk(900, io.BytesIO(b"x" * 200))
+
+    session.write_chunk(500, io.BytesIO(data[500:600]))
+    assert session.complete
+    assert session.received_bytes == len(data)
+
+    # A checksum mismatch forgets what arrived, so the file is sent again
+    assert not session.verify("sha256", "0" * 64)
+    session.reset()
+    assert main.UploadSession.load(session.id).received == []
+    session.write_chunk(0, io.BytesIO(data))
+    assert session.verify("sha256", hashlib.sha256(data).hexdigest().upper())
+
+    # Nothing but the hidden part file shows up in the destination until finish()
+    assert visible(tmp_path) == ["sessions"]
+    assert os.path.dirname(session.part_path) == str(tmp_path)
+    name = session.finish()
+    assert name == "big.bin"
+    assert (tmp_path / "big.bin").read_bytes() == data
+    assert main.UploadSession.load(session.id) is None
+    assert sorted(os.listdir(tmp_path)) == ["big.bin", "sessions"]
+    assert os.listdir(session_dir) == []
+
+
+def test_session_finish_keeps_existing_file(tmp_path, session_dir):
+    (tmp_path / "a.txt").write_bytes(b"old")
+    session = main.UploadSession.create(str(tmp_path), "a.txt", 3)
+    session.write_chunk(0, io.BytesIO(b"new"))
+    name = session.finish()
+    assert name == "a (2).txt"
+    assert (tmp_path / "a.txt").read_bytes() == b"old"
+    assert (tmp_path / name).read_bytes() == b"new"
+
+
+def test_session_can_be_claimed_once(tmp_path, session_dir):
+    session = main.UploadSession.create(str(tmp_path), "a.txt", 3)
+    session.write_chunk(0, io.BytesIO(b"new"))
+    assert session.claim()
+    assert not main.UploadSession.load(session.id).claim()
+    session.release()
+    assert main.UploadSession.load(session.id).claim()
+
+
+def test_finished_session_cannot_finish_again(tmp_path, session_dir):
+    session = main.UploadSession.create(str(tmp_path), "a.txt", 3)
+    session.write_chunk(0, io.BytesIO(b"new"))
+    assert session.finish() == "a.txt"
+    with pytest.raises(FileNotFoundError):
+        session.finish()
+    assert sorted(os.listdir(tmp_path)) == ["a.txt", "sessions"]
+
+
+def test_reserve_name_skips_names_taken_meanwhile(tmp_path):
+    assert main.reserve_name(str(tmp_path), "a.txt") == "a.txt"
+    assert main.reserve_name(str(tmp_path), "a.txt") == "a (2).txt"
+    assert (tmp_path / "a (2).txt").read_bytes() == b""
+
+
+def test_empty_session_is_complete(tmp_path, session_dir):
+    session = main.UploadSession.create(str(tmp_path), "empty", 0)
+    assert session.complete
+    assert session.finish() == "empty"
+    assert (tmp_path / "empty").read_bytes() == b""
+
+
+@pytest.mark.parametrize("session_id", ["", "../../etc", "A" * 32, "0" * 31])
+def test_load_rejects_bad_ids(session_dir, session_id):
+    assert main.UploadSession.load(session_id) is None
+
+
+def test_expire_discards_stale_sessions(tmp_path, session_dir):
+    stale = main.UploadSession.create(str(tmp_path), "stale", 10)
+    fresh = main.UploadSession.create(str(tmp_path), "fresh", 10)
+    old = time.time() - main.UPLOAD_SESSION_TTL - 60
+    for path in (stale.part_path, stale.journal_path):
+        os.utime(path, (old, old))
+    main.UploadSession.expire()
+    assert main.UploadSession.load(stale.id) is None
+    assert not os.path.exists(stale.part_path)
+    assert main.UploadSession.load(fresh.id) is not None
+
+
+def test_session_api(fetch, folder):
+    data = os.urandom(5000)
+    create = json.dumps({"path": folder.name, "name": "api.bin", "size": len(data)})
+    response, payload = fetch("POST", "/api/upload", create)
+    assert response.status == 201
+    status = json.loads(payload)
+    session_id = status["id"]
+    assert status["received"] == [] and not status["complete"]
+
+    # Asking again returns the unfinished session so a client can resume
+    response, payload = fetch("POST", "/api/upload", create)
+    assert response.status == 200
+    assert json.loads(payload)["id"] == session_id
+
+    url = f"/api/upload/{session_id}"
+    response, _ = fetch("PUT", f"{url}?offset=4000", data[4000:])
+    assert response.status == 204
+    response, payload = fetch("POST", f"{url}/finish", b"{}")
+    assert response.status == 409
+    assert json.loads(payload)["received"] == [[4000, 5000]]
+    response, _ = fetch("PUT", f"{url}?offset=4500", data[:1000])
+    assert response.status == 416
+
+    response, _ = fetch("PUT", f"{url}?offset=0", data[:4000])
+    assert response.status == 204
+    response, payload = fetch("POST", f"{url}/finish", json.dumps({"sha256": "0" * 64}))
+    assert response.status == 422
+    assert json.loads(payload)["received"] == []
+    assert visible(folder) == []
+
+    response, _ = fetch("PUT", f"{url}?offset=0", data)
+    assert response.status == 204
+    digest = hashlib.sha256(data).hexdigest()
+    response, payload = fetch("POST", f"{url}/finish", json.dumps({"sha256": digest}))
+    assert response.status == 201
+    assert json.loads(payload) == {"name": "api.bin", "size": len(data),
+                                   "location": f"/{folder.name}/api.bin"}
+    assert (folder / "api.bin").read_bytes() == data
+
+    response, _ = fetch("PUT", f"{url}?offset=0", data)
+    assert response.status == 404
+
+
+@pytest.mark.parametrize("body", [
+    {"name": "x", "size": -1},
+    {"name": "x", "size": "10"},
+    {"name": "..", "size": 10},
+    {"size": 10},
+])
+def test_session_api_rejects_bad_requests(fetch, folder, body):
+    body["path"] = folder.name
+    response, _ = fetch("POST", "/api/upload", json.dumps(body))
+    assert response.status == 400
+
+
+def test_session_api_outside_root(fetch):
+    response, _ = fetch("POST", "/api/upload", json.dumps({"path": "../..", "name": "x", "size": 1}))
+    assert response.status == 403
+
+
+def test_session_api_finishes_once(fetch, folder):
+    create = json.dumps({"path": folder.name, "name": "once.bin", "size": 4})
+    response, payload = fetch("POST", "/api/upload", create)
+    url = f"/api/upload/{json.loads(payload)['id']}"
+    fetch("PUT", f"{url}?offset=0", b"data")
+
+    # Another request (or worker process) is finishing it
+    session = main.UploadSession.load(url.rsplit("/", 1)[1])
+    assert session.claim()
+    response, payload = fetch("POST", f"{url}/finish", b"{}")
+    assert response.status == 409
+    assert json.loads(payload)["error"] == "Upload is already being finished"
+    session.release()
+
+    response, _ = fetch("POST", f"{url}/finish", b"{}")
+    assert response.status == 201
+    response, _ = fetch("POST", f"{url}/finish", b"{}")
+    assert response.status == 404
+    assert os.listdir(folder) == ["once.bin"]
@@ -0,0 +1,138 @@
+import io
+import json
+import os
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+# ----------------------------------------------------------------------------
+# File names and targets
+# ----------------------------------------------------------------------------
+@pytest.mark.parametrize("filename, expected", [
+    ("photo.jpg", "photo.jpg"),
+    ("  spaced.txt  ", "spaced.txt"),
+    ("../../etc/passwd", "passwd"),
+    ("C:\\Users\\me\\report.pdf", "report.pdf"),
+    ("/absolute/name.txt", "name.txt"),
+    ('<i>"quoted" & \'kept\'.txt', '<i>"quoted" & \'kept\'.txt'),
+    ("", None),
+    (".", None),
+    ("..", None),
+    ("folder/", None),
+    ("a/..", None),
+    ("nul\0byte.txt", None),
+])
+def test_safe_upload_name(filename, expected):
+    assert main.safe_upload_name(filename) == expected
+
+
+def test_upload_target_never_replaces(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"old")
+    target = main.UploadTarget(str(tmp_path), "a.txt")
+    assert target.name == "a (2).txt"
+    assert os.path.basename(target.temp_path).startswith(main.UPLOAD_TEMP_PREFIX)
+    target.write(b"new")
+    target.close()
+    assert (tmp_path / "a.txt").read_bytes() == b"old"
+    assert (tmp_path / target.name).read_bytes() == b"new"
+    assert sorted(os.listdir(tmp_path)) == sorted(["a.txt", target.name])
+
+
+def test_upload_target_overwrite(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"old")
+    target = main.UploadTarget(str(tmp_path), "a.txt", overwrite=True)
+    target.write(b"new")
+    target.close()
+    assert (tmp_path / "a.txt").read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_upload_target_abort_leaves_nothing(tmp_path):
+    target = main.UploadTarget(str(tmp_path), "a.txt")
+    target.write(b"partial")
+    target.abort()
+    assert os.listdir(tmp_path) == []
+
+
+# ----------------------------------------------------------------------------
+# HTTP: PUT and multipart uploads
+# ----------------------------------------------------------------------------
+def test_put_creates_then_requires_if_match(fetch, folder):
+    url = f"/{folder.name}/new.txt"
+    response, _ = fetch("PUT", url, b"first")
+    assert response.status == 201
+    assert response.getheader("Location") == url
+    assert (folder / "new.txt").read_bytes() == b"first"
+
+    response, _ = fetch("PUT", url, b"second")
+    assert response.status == 409
+    response, _ = fetch("PUT", url, b"second", {"If-Match": 'W/"stale"'})
+    assert response.status == 412
+    assert (folder / "new.txt").read_bytes() == b"first"
+
+    etag = main.file_etag(os.stat(folder / "new.txt"))
+    response, _ = fetch("PUT", url, b"second", {"If-Match": etag})
+    assert response.status == 204
+    assert (folder / "new.txt").read_bytes() == b"second"
+    assert os.listdir(folder) == ["new.txt"]
+
+
+def test_put_if_match_on_missing_file(fetch, folder):
+    response, _ = fetch("PUT", f"/{folder.name}/missing.txt", b"x", {"If-Match": "*"})
+    assert response.status == 412
+    assert os.listdir(folder) == []
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/../escape.txt", 403),
+    ("/%2e%2e/escape.txt", 403),
+    ("/{folder}/", 409),
+    ("/{folder}", 409),
+    ("/{folder}/no/such/dir.txt", 409),
+])
+def test_put_rejects_paths(fetch, folder, path, status):
+    response, _ = fetch("PUT", path.format(folder=folder.name), b"x")
+    assert response.status == status
+    assert not (folder.parent.parent / "escape.txt").exists()
+
+
+def test_put_from_other_site(fetch, folder):
+    response, _ = fetch("PUT", f"/{folder.name}/x.txt", b"x", {"Origin": "http://evil.example"})
+    assert response.status == 403
+    assert os.listdir(folder) == []
+
+
+def multipart(files):
+    boundary = "testboundary1234"
+    body = io.BytesIO()
+    for filename, data in files:
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="files"; '
+                   f'filename="{filename}"\r\n\r\n'.encode())
+        body.write(data + b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    return body.getvalue(), {"Content-Type": f"multipart/form-data; boundary={boundary}",
+                             "Accept": "application/json"}
+
+
+def test_form_upload_sanitises_names(fetch, folder):
+    body, headers = multipart([("../../outside.txt", b"one"), ("sub\\dir\\inner.txt", b"two")])
+    response, payload = fetch("POST", f"/{folder.name}/", body, headers)
+    assert response.status == 201
+    assert json.loads(payload)["files"] == [{"name": "outside.txt", "size": 3},
+                                            {"name": "inner.txt", "size": 3}]
+    assert sorted(os.listdir(folder)) == ["inner.txt", "outside.txt"]
+    assert not (folder.parent.parent / "outside.txt").exists()
+
+
+def test_form_upload_keeps_existing_files(fetch, folder):
+    (folder / "same.txt").write_bytes(b"old")
+    body, headers = multipart([("same.txt", b"new")])
+    response, payload = fetch("POST", f"/{folder.name}/", body, headers)
+    assert response.status == 201
+    saved = json.loads(payload)["files"][0]["name"]
+    assert saved == "same (2).txt"
+    assert (folder / "same.txt").read_bytes() == b"old"
+    assert (folder / saved).read_bytes() == b"new"
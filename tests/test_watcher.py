@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+class Listener:
+    """Seed listener and subscriber: records what the watcher hands over"""
+
+    def __init__(self):
+        self.seeded_folders = []
+        self.batches = []
+        self.walked = threading.Event()
+
+    def seed(self, folder, info):
+        self.seeded_folders.append(folder)
+
+    def seeded(self):
+        self.walked.set()
+
+    def __call__(self, folders):
+        self.batches.append(folders)
+
+    def changed(self):
+        return set().union(*[b for b in self.batches if b is not None])
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def watch(tmp_path):
+    """watch() -> (watcher, listener) on tmp_path, after the startup walk"""
+    watchers = []
+
+    def watch():
+        watcher = main.FileWatcher()
+        listener = Listener()
+        watcher.subscribe(listener)
+        watcher.start(str(tmp_path), seed=[listener])
+        watchers.append(watcher)
+        assert listener.walked.wait(5)
+        return watcher, listener
+    yield watch
+    for watcher in watchers:
+        watcher.stop()
+
+
+@pytest.fixture
+def inotify(watch, tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    watcher, listener = watch()
+    if watcher.backend.name != "inotify":
+        pytest.skip("inotify is not available")
+    return watcher, listener
+
+
+def test_startup_walk_seeds_every_folder(watch, tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "c").mkdir()
+    watcher, listener = watch()
+    assert sorted(listener.seeded_folders) == ["", "a", "a/b", "c"]
+    assert watcher.stats()["watched_folders"] == 4
+
+
+def test_changes_are_reported_per_folder(inotify, tmp_path):
+    watcher, listener = inotify
+    (tmp_path / "a" / "b" / "new.txt").write_bytes(b"x")
+    (tmp_path / "top.txt").write_bytes(b"x")
+    wait_for(lambda: listener.changed() == {"a/b", ""})
+
+
+def test_new_folders_are_watched(inotify, tmp_path):
+    watcher, listener = inotify
+    (tmp_path / "a" / "new").mkdir()
+    wait_for(lambda: watcher.stats()["watched_folders"] == 4)
+    (tmp_path / "a" / "new" / "f.txt").write_bytes(b"x")
+    wait_for(lambda: "a/new" in listener.changed())
+
+    os.rename(tmp_path / "a" / "new", tmp_path / "moved")
+    wait_for(lambda: {"a", ""} <= listener.changed())
+    (tmp_path / "moved" / "g.txt").write_bytes(b"x")
+    wait_for(lambda: "moved" in listener.changed())
+
+
+def test_bursts_are_coalesced(inotify, tmp_path):
+    watcher, listener = inotify
+    for i in range(200):
+        (tmp_path / "a" / f"{i}.txt").write_bytes(b"x")
+    wait_for(lambda: "a" in listener.changed())
+    stats = watcher.stats()
+    assert stats["coalesced"] > 100
+    assert stats["batches"] < 10
+
+
+def test_upload_temp_files_are_ignored(inotify, tmp_path):
+    watcher, listener = inotify
+    (tmp_path / "a" / ".upload-x.part").write_bytes(b"x")
+    time.sleep(2 * main.WATCH_COALESCE_DELAY + 0.1)
+    assert listener.changed() == set()
+
+
+def test_overflow_reports_everything_changed(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "WATCH_QUEUE_MAX", 2)
+    watcher = main.FileWatcher()
+    listener = Listener()
+    watcher.subscribe(listener)
+    # Fill the queue before the dispatcher runs
+    for folder in ["a", "a", "b", "c"]:
+        watcher._emit(folder)
+    watcher.start(str(tmp_path))
+    try:
+        wait_for(lambda: listener.batches)
+        assert listener.batches == [None]
+        stats = watcher.stats()
+        assert (stats["coalesced"], stats["dropped"], stats["overflows"]) == (1, 1, 1)
+    finally:
+        watcher.stop()
+
+
+def test_polling_backend(tmp_path):
+    (tmp_path / "a").mkdir()
+    emitted = []
+    backend = main._PollingBackend(str(tmp_path), emitted.append, interval=0.05)
+    for folder in ["", "a"]:
+        backend.seen(folder, os.stat(tmp_path / folder).st_mtime_ns)
+    stop = threading.Event()
+    thread = threading.Thread(target=backend.run, args=(stop,), daemon=True)
+    thread.start()
+    try:
+        (tmp_path / "a" / "new").mkdir()
+        wait_for(lambda: {"a", "a/new"} <= set(emitted))
+        assert backend.watched == 3
+        (tmp_path / "a" / "new").rmdir()
+        (tmp_path / "a").rmdir()
+        wait_for(lambda: backend.watched == 1)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_watcher_falls_back_to_polling(watch, monkeypatch):
+    def unavailable():
+        raise OSError("no inotify")
+    monkeypatch.setattr(main, "_load_inotify", unavailable)
+    watcher, _ = watch()
+    assert watcher.stats()["backend"] == "polling"
@@ -0,0 +1,80 @@
+import io
+import json
+import os
+import socket
+import time
+import urllib.request
+import zipfile
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not main.MULTIPROCESS_AVAILABLE, reason="needs fork and SO_REUSEPORT")
+
+
+def free_port():
+    # Every worker binds the port itself, so it cannot be 0
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def download(port, path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=20) as response:
+        return response.read()
+
+
+def test_workers_forked_after_archive_downloads_can_build_archives(tmp_path):
+    for name in ("first", "second"):
+        (tmp_path / name).mkdir()
+        for i in range(4):
+            (tmp_path / name / f"{i}.bin").write_bytes(os.urandom(256 * 1024) * 4)
+    cwd = os.getcwd()
+    manager = main.ServerManager()
+    try:
+        # The first server starts the shared ZIP pools in this process...
+        ok, message = manager.start(str(tmp_path), 0, "threaded")
+        assert ok, message
+        port = manager.server.server_address[1]
+        assert len(zipfile.ZipFile(io.BytesIO(download(port, "/download/first"))).namelist()) == 4
+        manager.stop()
+
+        # ...which the workers forked next must not try to use
+        port = free_port()
+        ok, message = manager.start(str(tmp_path), port, "threaded", processes=2)
+        assert ok, message
+        for _ in range(4):
+            archive = zipfile.ZipFile(io.BytesIO(download(port, "/download/second")))
+            assert archive.testzip() is None
+            assert len(archive.namelist()) == 4
+    finally:
+        manager.stop()
+        os.chdir(cwd)
+
+
+def test_workers_report_their_requests(tmp_path):
+    cwd = os.getcwd()
+    manager = main.ServerManager()
+    port = free_port()
+    ok, message = manager.start(str(tmp_path), port, "threaded", processes=2)
+    assert ok, message
+    try:
+        status = json.loads(download(port, "/api/status"))
+        assert status["process"]["worker"] in (0, 1)
+        assert status["process"]["shared"] == ["search_index", "folder_sizes", "watcher"]
+        for _ in range(9):
+            download(port, "/")
+
+        stats = manager.server.stats()
+        assert stats["engine"] == "multiprocess/threaded"
+        assert stats["processes"] == 2
+        deadline = time.monotonic() + 5 * main.WORKER_STATS_INTERVAL
+        while manager.server.stats()["requests"] < 10 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert manager.server.stats()["requests"] == 10
+        assert all(worker["alive"] for worker in manager.server.stats()["workers"])
+    finally:
+        manager.stop()
+        os.chdir(cwd)
@@ -0,0 +1,169 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+pytest.importorskip("kivy")
+import main  # noqa: E402
+
+
+@pytest.fixture
+def files(tmp_path):
+    """(path, arcname, stat) entries: compressible text, incompressible bytes, an empty file, a non-ASCII name"""
+    contents = {
+        "notes.txt": b"hello archive\n" * 5000,
+        "photo.jpg": os.urandom(300 * 1024),
+        "empty.bin": b"",
+        "déjà/vu.txt": b"unicode name",
+    }
+    entries = []
+    for arcname, data in contents.items():
+        path = tmp_path / arcname
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(data)
+        entries.append((str(path), arcname, os.stat(path)))
+    return entries, contents
+
+
+def read_back(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        return {info.filename: (info, archive.read(info)) for info in archive.infolist()}
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+def test_add_file_round_trip(files, compression):
+    entries, contents = files
+    out = io.BytesIO()
+    stream = main.ZipStream(out, compression)
+    for path, arcname, st in entries:
+        stream.add_file(path, arcname, st)
+    stream.close()
+
+    members = read_back(out.getvalue())
+    assert {name: data for name, (_, data) in members.items()} == contents
+    assert members["photo.jpg"][0].compress_type == zipfile.ZIP_STORED
+    assert members["notes.txt"][0].compress_type == compression
+
+
+def test_planned_size_is_exact_for_store(files):
+    entries, _ = files
+    out = io.BytesIO()
+    stream = main.ZipStream(out, zipfile.ZIP_STORED)
+    planned = stream.planned_size(entries)
+    for path, arcname, st in entries:
+        stream.add_file(path, arcname, st)
+    stream.close()
+    assert len(out.getvalue()) == planned
+
+
+def test_planned_size_needs_store(files):
+    with pytest.raises(ValueError):
+        main.ZipStream(io.BytesIO()).planned_size(files[0])
+
+
+def test_zip64_entries(files, monkeypatch):
+    # Files past 4 GiB take Zip64 local headers and data descriptors; force that path on small files
+    monkeypatch.setattr(main.ZipStream, "_needs_zip64", staticmethod(lambda size: True))
+    entries, contents = files
+    out = io.BytesIO()
+    stream = main.ZipStream(out, zipfile.ZIP_STORED)
+    planned = stream.planned_size(entries)
+    for path, arcname, st in entries:
+        stream.add_file(path, arcname, st)
+    stream.close()
+
+    data = out.getvalue()
+    assert len(data) == planned
+    assert data[4:6] == (45).to_bytes(2, "little")  # Version needed: Zip64
+    assert {name: data for name, (_, data) in read_back(data).items()} == contents
+
+
+def test_zip64_end_records_past_65535_entries(tmp_path):
+    path = tmp_path / "x"
+    path.write_bytes(b"x")
+    st = os.stat(path)
+    count = 0xFFFF + 1
+    entries = [(str(path), f"f{i}", st) for i in range(count)]
+    out = io.BytesIO()
+    stream = main.ZipStream(out, zipfile.ZIP_STORED)
+    planned = stream.planned_size(entries)
+    for entry in entries:
+        stream.add_file(*entry)
+    stream.close()
+
+    data = out.getvalue()
+    assert len(data) == planned
+    assert b"PK\x06\x06" in data[-200:]
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        names = archive.namelist()
+        assert len(names) == count
+        assert archive.read(names[-1]) == b"x"
+
+
+def test_store_archives_the_statted_size(tmp_path):
+    path = tmp_path / "grows.txt"
+    path.write_bytes(b"short")
+    st = os.stat(path)
+    path.write_bytes(b"much longer now")
+    out = io.BytesIO()
+    stream = main.ZipStream(out, zipfile.ZIP_STORED)
+    stream.add_file(str(path), "grows.txt", st)
+    stream.close()
+    assert read_back(out.getvalue())["grows.txt"][1] == b"much "
+
+
+def test_store_fails_on_a_shrunken_file(tmp_path):
+    path = tmp_path / "shrinks.txt"
+    path.write_bytes(b"much longer now")
+    st = os.stat(path)
+    path.write_bytes(b"short")
+    stream = main.ZipStream(io.BytesIO(), zipfile.ZIP_STORED)
+    with pytest.raises(IOError):
+        stream.add_file(str(path), "shrinks.txt", st)
+
+
+# ----------------------------------------------------------------------------
+# Parallel pipeline
+# ----------------------------------------------------------------------------
+@pytest.mark.parametrize("compression", [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+def test_add_files_pipeline_matches_contents(files, monkeypatch, compression):
+    entries, contents = files
+    # Small blocks so the large files are split across several pipeline jobs
+    monkeypatch.setattr(main, "ZIP_PARALLEL_BLOCK", 16 * 1024)
+    out = io.BytesIO()
+    stream = main.ZipStream(out, compression)
+    assert stream.add_files(entries) == sum(len(data) for data in contents.values())
+    stream.close()
+    archived = read_back(out.getvalue())
+    assert {name: data for name, (_, data) in archived.items()} == contents
+    assert archived["photo.jpg"][0].compress_type == zipfile.ZIP_STORED
+    assert archived["notes.txt"][0].compress_type == compression
+
+
+def test_add_files_batches_many_small_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ZIP_BATCH_FILES", 8)
+    entries = []
+    for i in range(50):
+        path = tmp_path / f"{i:02}.txt"
+        path.write_bytes(b"%d\n" % i * (i + 1))
+        entries.append((str(path), path.name, os.stat(path)))
+    out = io.BytesIO()
+    stream = main.ZipStream(out)
+    stream.add_files(entries)
+    stream.close()
+    archived = read_back(out.getvalue())
+    assert list(archived) == [path.name for path in sorted(tmp_path.iterdir())]
+    assert archived["49.txt"][1] == b"49\n" * 50
+
+
+def test_add_files_fails_on_a_shrunken_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ZIP_PARALLEL_BLOCK", 16 * 1024)
+    path = tmp_path / "shrinks.bin"
+    path.write_bytes(os.urandom(100 * 1024))
+    st = os.stat(path)
+    path.write_bytes(os.urandom(40 * 1024))
+    stream = main.ZipStream(io.BytesIO())
+    with pytest.raises(IOError):
+        stream.add_files([(str(path), "shrinks.bin", st)])
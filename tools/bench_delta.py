@@ -0,0 +1,132 @@
+"""
+Delta download benchmark
+
+Measures how many bytes a delta download (block signature plus the changed
+blocks, as tools/delta_fetch.py fetches them) needs to bring an old copy of
+a file up to date, against re-downloading the whole file. Scenarios cover a
+growing log, in-place edits, an insertion that shifts everything after it,
+a rewritten tail and an unrelated file. Every rebuilt file is compared with
+the new version.
+
+Usage:
+    python tools/bench_delta.py [size_mb]    default: 64
+"""
+
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+sys.path.insert(0, TOOLS_DIR)
+
+import main  # noqa: E402
+import delta_fetch  # noqa: E402
+
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+
+def log_lines(rng, size):
+    """About `size` bytes of access-log style text"""
+    lines = []
+    total = 0
+    while total < size:
+        line = (f"2024-05-{rng.randrange(1, 29):02d} {rng.randrange(24):02d}:{rng.randrange(60):02d} "
+                f"GET /api/item/{rng.randrange(10 ** 6)} {rng.choice((200, 200, 200, 304, 404))} "
+                f"{rng.random():.4f}\n").encode("ascii")
+        lines.append(line)
+        total += len(line)
+    return b"".join(lines)
+
+
+def scenarios(old, rng):
+    """(label, new version) pairs derived from the old file"""
+    middle = len(old) // 2
+    edited = bytearray(old)
+    for _ in range(5):
+        at = rng.randrange(len(old) - 16)
+        edited[at:at + 10] = b"EDITED****"
+    yield "append 1%", old + log_lines(rng, len(old) // 100)
+    yield "5 in-place edits", bytes(edited)
+    yield "insert 1 KB mid", old[:middle] + log_lines(rng, 1024) + old[middle:]
+    yield "delete 64 KB mid", old[:middle] + old[middle + 65536:]
+    yield "rewrite last 5%", old[:len(old) * 95 // 100] + log_lines(rng, len(old) // 20)
+    yield "unrelated file", log_lines(random.Random(99), len(old))
+
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+class RangeReader:
+    """Serves the missing ranges from the new file, as /api/blocks would, and counts the bytes"""
+
+    def __init__(self, path, sig, ranges):
+        self.f = open(path, "rb")
+        self.spans = [(a * sig.block, min((b + 1) * sig.block, sig.size)) for a, b in ranges]
+        self.sent = 0
+
+    def read(self, size):
+        while self.spans:
+            start, end = self.spans[0]
+            if start < end:
+                self.f.seek(start)
+                data = self.f.read(min(size, end - start))
+                self.spans[0] = (start + len(data), end)
+                self.sent += len(data)
+                return data
+            self.spans.pop(0)
+        return b""
+
+
+def run(scratch, label, old, new):
+    old_path = os.path.join(scratch, "old")
+    new_path = os.path.join(scratch, "new")
+    out_path = os.path.join(scratch, "out")
+    with open(old_path, "wb") as f:
+        f.write(old)
+    with open(new_path, "wb") as f:
+        f.write(new)
+
+    start = time.perf_counter()
+    signature = io.BytesIO()
+    with open(new_path, "rb") as f:
+        main.write_signature(f, len(new), main.delta_block_size(len(new)), signature)
+    signed = time.perf_counter()
+    sig = delta_fetch.Signature(signature.getvalue())
+    found = delta_fetch.match_blocks(old, sig)
+    matched = time.perf_counter()
+    reader = RangeReader(new_path, sig, delta_fetch.missing_ranges(sig, found))
+    with open(out_path, "wb") as out:
+        delta_fetch.rebuild(old, sig, found, reader, out)
+    reader.f.close()
+    with open(out_path, "rb") as f:
+        ok = f.read() == new
+
+    transferred = len(signature.getvalue()) + reader.sent
+    print(f"{label:<18} {len(new) / 1e6:>7.1f} {sig.block // 1024:>5} {len(signature.getvalue()) / 1024:>8.0f} "
+          f"{reader.sent / 1024:>9.0f} {100.0 * (1 - transferred / len(new)):>6.1f}% "
+          f"{signed - start:>7.2f} {matched - signed:>7.2f}  {'ok' if ok else 'MISMATCH'}")
+
+
+def main_bench(size_mb):
+    rng = random.Random(1234)
+    old = log_lines(rng, size_mb * 1000 * 1000)
+    print(f"{'scenario':<18} {'new MB':>7} {'blk K':>5} {'sig KB':>8} {'blocks KB':>9} {'saved':>7} "
+          f"{'sign s':>7} {'match s':>7}  check")
+    scratch = tempfile.mkdtemp(prefix="pyserver_deltabench_")
+    try:
+        for label, new in scenarios(old, rng):
+            run(scratch, label, old, new)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
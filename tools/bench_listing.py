@@ -0,0 +1,194 @@
+"""
+Directory listing benchmark
+
+Compares the old listing pipeline (listdir + isdir sort key + isdir/stat/getcwd
+per entry) against the single-pass scan_directory() engine for directories of
+1k / 10k / 100k files, reporting wall time and filesystem call counts, and
+reports listing page bytes with the stylesheet and script inlined (before)
+versus linked as cached static assets (after).
+
+Usage:
+    python tools/bench_listing.py [sizes...]      e.g. 1000 10000 100000
+"""
+
+import gzip
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+# ============================================================================
+# CALL COUNTING
+# ============================================================================
+
+class CallCounter:
+    """Wrap os-level functions and count how often they are called"""
+
+    def __init__(self):
+        self.counts = {}
+        self._originals = {}
+
+    def _wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        for name in ("stat", "listdir", "getcwd"):
+            self._originals[name] = getattr(os, name)
+            setattr(os, name, self._wrap(name, self._originals[name]))
+
+        original_scandir = os.scandir
+        self._originals["scandir"] = original_scandir
+        counter = self
+
+        class CountingEntry:
+            # DirEntry is a C type, so count through a thin proxy
+            def __init__(self, entry):
+                self._entry = entry
+                self.name = entry.name
+
+            def is_dir(self):
+                return self._entry.is_dir()
+
+            def stat(self):
+                counter.counts["DirEntry.stat"] = counter.counts.get("DirEntry.stat", 0) + 1
+                return self._entry.stat()
+
+        class CountingScandir:
+            def __init__(self, path):
+                counter.counts["scandir"] = counter.counts.get("scandir", 0) + 1
+                self._it = original_scandir(path)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self._it.close()
+
+            def __iter__(self):
+                return (CountingEntry(e) for e in self._it)
+
+        os.scandir = CountingScandir
+        return self
+
+    def __exit__(self, *exc):
+        for name, func in self._originals.items():
+            setattr(os, name, func)
+
+
+# ============================================================================
+# PIPELINES
+# ============================================================================
+
+def legacy_listing(path):
+    """The pre-scandir pipeline: per-entry isdir/stat/getcwd/relpath"""
+    file_list = os.listdir(path)
+    file_list.sort(key=lambda a: (not os.path.isdir(os.path.join(path, a)), a.lower()))
+    rows = []
+    for name in file_list:
+        fullname = os.path.join(path, name)
+        try:
+            is_dir = os.path.isdir(fullname)
+            st = os.stat(fullname)
+            relative_path = os.path.relpath(fullname, os.getcwd())
+        except OSError:
+            continue
+        rows.append((name, is_dir, st.st_size, st.st_mtime, relative_path))
+    return rows
+
+
+def scandir_listing(path):
+    """The current pipeline: one scandir pass plus a single relpath"""
+    entries = main.scan_directory(path)
+    os.path.relpath(path, os.getcwd())
+    return entries
+
+
+def render_listing(path):
+    """Full HTML rendering of a listing through the request handler"""
+    handler = main.EnhancedHTTPHandler.__new__(main.EnhancedHTTPHandler)
+    return handler._generate_file_list(path, main.scan_directory(path))
+
+
+def page_bytes(path):
+    """Listing page size with assets inlined (before) and linked (after)"""
+    handler = main.EnhancedHTTPHandler.__new__(main.EnhancedHTTPHandler)
+    after = handler._generate_html(path, main.scan_directory(path), "/")
+    before = after.replace(
+        f'<link rel="stylesheet" href="{main.STATIC_ASSET_URLS["listing.css"]}">',
+        f"<style>\n{main.LISTING_CSS}</style>",
+    ).replace(
+        f'<script src="{main.STATIC_ASSET_URLS["listing.js"]}" defer></script>',
+        f"<script>\n{main.LISTING_JS}</script>",
+    )
+    return [(len(page), len(gzip.compress(page))) for page in
+            (before.encode("utf-8"), after.encode("utf-8"))]
+
+
+def measure(func, path, repeat=3):
+    """Best wall time over `repeat` runs and the call counts of one run"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        best = min(best, time.perf_counter() - start)
+    with CallCounter() as counter:
+        func(path)
+    return best, counter.counts
+
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+def populate(path, count):
+    """Create `count` small files (and a few folders) under path"""
+    for i in range(count):
+        if i % 100 == 0:
+            os.mkdir(os.path.join(path, f"dir_{i:06d}"))
+        else:
+            with open(os.path.join(path, f"File_{i:06d}.txt"), "wb") as f:
+                f.write(b"x" * (i % 512))
+
+
+def main_bench(sizes):
+    print(f"{'entries':>8}  {'pipeline':<10} {'wall ms':>9}  calls")
+    page_sizes = []
+    for count in sizes:
+        root = tempfile.mkdtemp(prefix="pyserver_bench_")
+        try:
+            populate(root, count)
+            for label, func in (("legacy", legacy_listing),
+                                ("scandir", scandir_listing),
+                                ("render", render_listing)):
+                wall, counts = measure(func, root)
+                calls = ", ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+                print(f"{count:>8}  {label:<10} {wall * 1000:>9.1f}  {calls}")
+            page_sizes.append((count, page_bytes(root)))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    # Small folders are where inlined assets dominate, so include an empty one
+    root = tempfile.mkdtemp(prefix="pyserver_bench_")
+    try:
+        page_sizes.insert(0, (0, page_bytes(root)))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print()
+    print(f"{'entries':>8}  {'before B':>10} {'after B':>10} {'saved':>7}  {'before gz':>10} {'after gz':>10}")
+    for count, ((before, before_gz), (after, after_gz)) in page_sizes:
+        saved = 100.0 * (before - after) / before
+        print(f"{count:>8}  {before:>10} {after:>10} {saved:>6.1f}%  {before_gz:>10} {after_gz:>10}")
+
+
+if __name__ == "__main__":
+    main_bench([int(a) for a in sys.argv[1:]] or [1000, 10000, 100000])
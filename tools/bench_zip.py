@@ -0,0 +1,145 @@
+"""
+Folder ZIP benchmark
+
+Compares three ways of archiving a folder: the original zipfile.ZipFile
+writer (os.walk + zipf.write), the serial ZipStream writer (add_file per
+entry, deflating everything) and the parallel pipeline (add_files with
+read-ahead, multi-core deflate and STORE for already-compressed types).
+Reports input MB/s, archive size and verifies every archive with zipfile.
+
+Usage:
+    python tools/bench_zip.py [folder]    default: a generated mixed folder
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+# ============================================================================
+# ARCHIVERS
+# ============================================================================
+
+def zipfile_archive(folder, out):
+    """The original implementation: os.walk + ZipFile.write"""
+    parent = os.path.dirname(folder)
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                path = os.path.join(root, name)
+                zipf.write(path, os.path.relpath(path, parent))
+
+
+def serial_archive(folder, out):
+    """ZipStream one entry at a time, deflating every file"""
+    archive = main.ZipStream(out)
+    for path, arcname, st in main.iter_zip_entries(folder):
+        archive.add_file(path, arcname, st, method=zipfile.ZIP_DEFLATED)
+    archive.close()
+
+
+def pipeline_archive(folder, out):
+    """ZipStream.add_files: read-ahead, parallel deflate, STORE for media"""
+    archive = main.ZipStream(out)
+    archive.add_files(main.iter_zip_entries(folder))
+    archive.close()
+
+
+class UnseekableFile:
+    """File wrapper without seek/tell, like the socket the server writes to"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, data):
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+# ============================================================================
+# ENTRY POINT
+# ============================================================================
+
+def populate(path):
+    """Build a mixed folder: text, binary, media and one large log (~170 MB)"""
+    rng = random.Random(1234)
+    words = [b"alpha", b"beta", b"gamma", b"delta", b"error", b"request", b"GET", b"200"]
+
+    def text(size):
+        line_count = size // 48 + 1
+        return b"".join(
+            b"%d %s %s %d\n" % (i, rng.choice(words), rng.choice(words), rng.randrange(10 ** 6))
+            for i in range(line_count)
+        )[:size]
+
+    for sub in ("docs", "photos", "bin", "logs"):
+        os.mkdir(os.path.join(path, sub))
+    for i in range(400):
+        with open(os.path.join(path, "docs", f"note_{i:04d}.txt"), "wb") as f:
+            f.write(text(rng.randrange(1024, 96 * 1024)))
+    for i in range(40):
+        with open(os.path.join(path, "photos", f"IMG_{i:04d}.jpg"), "wb") as f:
+            f.write(os.urandom(rng.randrange(512 * 1024, 2 * 1024 * 1024)))
+    for i in range(8):
+        with open(os.path.join(path, "bin", f"blob_{i}.bin"), "wb") as f:
+            f.write(os.urandom(4 * 1024 * 1024))
+    with open(os.path.join(path, "logs", "server.log"), "wb") as f:
+        for _ in range(8):
+            f.write(text(8 * 1024 * 1024))
+
+
+def folder_bytes(folder):
+    return sum(st.st_size for _, _, st in main.iter_zip_entries(folder))
+
+
+def main_bench(folder):
+    total = folder_bytes(folder)
+    print(f"folder: {folder} ({total / 1e6:.1f} MB, "
+          f"{main.ZIP_COMPRESS_WORKERS} compression threads)")
+    print(f"{'archiver':<10} {'wall s':>8} {'MB/s':>8} {'archive MB':>11}  check")
+    scratch = tempfile.mkdtemp(prefix="pyserver_zipbench_")
+    try:
+        results = {}
+        for label, func in (("zipfile", zipfile_archive),
+                            ("serial", serial_archive),
+                            ("pipeline", pipeline_archive)):
+            target = os.path.join(scratch, f"{label}.zip")
+            with open(target, "wb") as f:
+                start = time.perf_counter()
+                func(folder, UnseekableFile(f))
+                wall = time.perf_counter() - start
+            with zipfile.ZipFile(target) as check:
+                bad = check.testzip()
+            size = os.path.getsize(target)
+            results[label] = wall
+            print(f"{label:<10} {wall:>8.2f} {total / 1e6 / wall:>8.1f} {size / 1e6:>11.1f}  "
+                  f"{'ok' if bad is None else 'CORRUPT: ' + bad}")
+            os.remove(target)
+        print(f"\npipeline speedup: {results['zipfile'] / results['pipeline']:.1f}x vs zipfile, "
+              f"{results['serial'] / results['pipeline']:.1f}x vs serial ZipStream")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main_bench(os.path.abspath(sys.argv[1]))
+    else:
+        root = tempfile.mkdtemp(prefix="pyserver_zipbench_src_")
+        try:
+            folder = os.path.join(root, "bench")
+            os.mkdir(folder)
+            populate(folder)
+            main_bench(folder)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,255 @@
+"""
+Delta download client
+
+Brings a local copy of a served file up to date by downloading only the
+blocks that changed. It fetches the file's block signature from
+/api/signature/<path>, rolls an Adler-32 window over the old copy to find
+blocks it already has at any offset (the rsync/zsync technique), then fetches
+the rest from /api/blocks/<path> and rebuilds the file next to the old one.
+The result is checked against /api/hash/<path> before it replaces anything.
+
+Usage:
+    python tools/delta_fetch.py URL OLD_FILE [OUTPUT]    default output: OLD_FILE
+    e.g. python tools/delta_fetch.py http://192.168.1.5:8000/logs/app.log app.log
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+SIGNATURE_HEADER = struct.Struct("<4sB3xIQ")
+STRONG_BYTES = 16
+RECORD = STRONG_BYTES + 4
+ADLER_MOD = 65521
+MAX_ROLL = 8 * 1024 * 1024   # Unmatched bytes rolled through before only block-aligned offsets are tried
+RANGES_PER_REQUEST = 4096
+COPY_CHUNK = 1024 * 1024
+
+
+# ============================================================================
+# MATCHING
+# ============================================================================
+
+class Signature:
+    """A parsed /api/signature body"""
+
+    def __init__(self, data):
+        magic, version, self.block, self.size = SIGNATURE_HEADER.unpack_from(data)
+        if magic != b"PSIG" or version != 1:
+            raise ValueError("not a version 1 block signature")
+        body = memoryview(data)[SIGNATURE_HEADER.size:]
+        self.count = -(-self.size // self.block)
+        if len(body) != self.count * RECORD:
+            raise ValueError("truncated block signature")
+        self.weak = [struct.unpack_from("<I", body, i * RECORD)[0] for i in range(self.count)]
+        self.strong = [bytes(body[i * RECORD + 4:(i + 1) * RECORD]) for i in range(self.count)]
+
+    def length(self, index):
+        return min(self.block, self.size - index * self.block)
+
+
+def strong_digest(data):
+    return hashlib.blake2b(data, digest_size=STRONG_BYTES).digest()
+
+
+def match_blocks(old, sig, max_roll=MAX_ROLL):
+    """
+    {block index: offset in old} for every block of the new version found in
+    the old copy. Full blocks are searched at every offset; the short last
+    block only where it would sit if the file grew or shrank at the front.
+    """
+    block = sig.block
+    full = sig.size // block
+    table = {}
+    for index in range(full):
+        table.setdefault(sig.weak[index], []).append(index)
+
+    found = {}
+    n = len(old)
+    p = 0
+    rolling = True
+    while table and p + block <= n:
+        value = zlib.adler32(old[p:p + block])
+        a, b = value & 0xFFFF, value >> 16
+        unmatched = 0
+        while True:
+            candidates = table.get((b << 16) | a)
+            if candidates:
+                digest = strong_digest(old[p:p + block])
+                same = [i for i in candidates if sig.strong[i] == digest]
+                if same:
+                    # Repeated content (e.g. zero-filled blocks) maps to the next unfound copy
+                    index = next((i for i in same if i not in found), None)
+                    if index is not None:
+                        found[index] = p
+                    p += block
+                    rolling = True
+                    break
+            if not rolling:
+                p += block
+                break
+            if p + block >= n:
+                p = n
+                break
+            if unmatched >= max_roll:
+                # Nothing in a long stretch: the copies differ here, so only try aligned offsets
+                rolling = False
+                p += block - p % block
+                break
+            out_byte, in_byte = old[p], old[p + block]
+            a = (a - out_byte + in_byte) % ADLER_MOD
+            b = (b - block * out_byte + a - 1) % ADLER_MOD
+            p += 1
+            unmatched += 1
+
+    last = sig.count - 1
+    if sig.count > full:
+        length = sig.length(last)
+        for offset in (last * block, n - length):
+            if 0 <= offset and offset + length <= n:
+                data = old[offset:offset + length]
+                if zlib.adler32(data) == sig.weak[last] and strong_digest(data) == sig.strong[last]:
+                    found[last] = offset
+                    break
+    return found
+
+
+def missing_ranges(sig, found):
+    """Inclusive (first, last) block index runs that have to be downloaded"""
+    ranges = []
+    for index in range(sig.count):
+        if index in found:
+            continue
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1] = (ranges[-1][0], index)
+        else:
+            ranges.append((index, index))
+    return ranges
+
+
+def rebuild(old, sig, found, fetched, out):
+    """
+    Write the new version to out: matched blocks are copied from old, the
+    others are read in order from the file-like `fetched`.
+    """
+    index = 0
+    while index < sig.count:
+        if index in found:
+            # Copy a run of blocks that were also consecutive in the old copy in one go
+            start = found[index]
+            end = index + 1
+            while end in found and found[end] == start + (end - index) * sig.block:
+                end += 1
+            stop = start + sum(sig.length(i) for i in range(index, end))
+            for offset in range(start, stop, COPY_CHUNK):
+                out.write(old[offset:min(offset + COPY_CHUNK, stop)])
+            index = end
+        else:
+            remaining = sig.length(index)
+            while remaining:
+                data = fetched.read(min(remaining, COPY_CHUNK))
+                if not data:
+                    raise IOError("block download ended early")
+                out.write(data)
+                remaining -= len(data)
+            index += 1
+
+
+# ============================================================================
+# HTTP
+# ============================================================================
+
+class BlockStream:
+    """File-like reader over the /api/blocks responses for a list of ranges"""
+
+    def __init__(self, url, sig, ranges, etag):
+        self.url = url
+        self.sig = sig
+        self.etag = etag
+        self.batches = [ranges[i:i + RANGES_PER_REQUEST] for i in range(0, len(ranges), RANGES_PER_REQUEST)]
+        self.response = None
+        self.received = 0
+
+    def read(self, size):
+        while True:
+            if self.response is None:
+                if not self.batches:
+                    return b""
+                body = ",".join(f"{a}-{b}" for a, b in self.batches.pop(0)).encode("ascii")
+                request = urllib.request.Request(
+                    f"{self.url}?block={self.sig.block}", data=body, method="POST",
+                    headers={"If-Match": self.etag, "Content-Type": "text/plain"},
+                )
+                self.response = urllib.request.urlopen(request)
+            data = self.response.read(size)
+            if data:
+                self.received += len(data)
+                return data
+            self.response.close()
+            self.response = None
+
+
+def api_url(file_url, endpoint):
+    parts = urllib.parse.urlsplit(file_url)
+    return urllib.parse.urlunsplit((parts.scheme, parts.netloc, f"/api/{endpoint}{parts.path}", "", ""))
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def delta_fetch(file_url, old_path, out_path):
+    start = time.perf_counter()
+    with urllib.request.urlopen(api_url(file_url, "signature")) as response:
+        etag = response.headers["ETag"]
+        signature_bytes = response.read()
+    sig = Signature(signature_bytes)
+
+    temp_path = out_path + ".delta-tmp"
+    with open(old_path, "rb") if os.path.exists(old_path) else open(os.devnull, "rb") as f:
+        old_size = os.fstat(f.fileno()).st_size
+        old = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if old_size else b""
+        try:
+            found = match_blocks(old, sig)
+            matched = time.perf_counter()
+            ranges = missing_ranges(sig, found)
+            stream = BlockStream(api_url(file_url, "blocks"), sig, ranges, etag)
+            with open(temp_path, "wb") as out:
+                rebuild(old, sig, found, stream, out)
+        finally:
+            if old_size:
+                old.close()
+
+    with urllib.request.urlopen(api_url(file_url, "hash") + "?algo=sha256") as response:
+        expected = json.load(response)["digest"]
+    if sha256_file(temp_path) != expected:
+        os.unlink(temp_path)
+        raise SystemExit("Rebuilt file does not match the server's sha256; it may have changed, run again")
+    os.replace(temp_path, out_path)
+
+    transferred = len(signature_bytes) + stream.received
+    print(f"{out_path}: {sig.size} bytes, {sig.count} blocks of {sig.block}, {len(found)} reused")
+    print(f"downloaded {transferred} bytes (signature {len(signature_bytes)}, blocks {stream.received}), "
+          f"{100.0 * (1 - transferred / max(sig.size, 1)):.1f}% saved; "
+          f"matching {matched - start:.2f}s, total {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        sys.exit(__doc__)
+    try:
+        delta_fetch(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else sys.argv[2])
+    except urllib.error.HTTPError as e:
+        sys.exit(f"{e.code} {e.reason}" + (": the file changed on the server, run again" if e.code == 412 else ""))